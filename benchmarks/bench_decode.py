@@ -0,0 +1,156 @@
+"""compare the header-compiled row decoder with dict-per-row parsing
+
+    python benchmarks/bench_decode.py [students]
+"""
+import logging
+import sys
+import time
+from directo.decoder import RowDecoder, format_name
+from directo.synthetic import generate
+
+
+# the dict-per-row parsing RowDecoder replaced, kept as its reference
+def parse_parents_from_item(item):
+    parent_a_attributes = [
+        "name_last_parent_guardian_a",
+        "name_first_parent_guardian_a",
+        "email_parent_guardian_a",
+        "phone_parent_guardian_a",
+        "address_parent_guardian_a",
+        "city_parent_guardian_a",
+        "state_parent_guardian_a",
+        "zip_parent_guardian_a",
+    ]
+    parent_a = dict(
+        {
+            k.replace("_parent_guardian_a", ""): v
+            for (k, v) in item.items()
+            if k in parent_a_attributes and v != ""
+        }
+    )
+    logging.debug("parent_a_preformatted: %s", parent_a)
+    parent_b_attributes = [
+        "name_last_parent_guardian_b",
+        "name_first_parent_guardian_b",
+        "email_parent_guardian_b",
+        "phone_parent_guardian_b",
+        "address_parent_guardian_b",
+        "city_parent_guardian_b",
+        "state_parent_guardian_b",
+        "zip_parent_guardian_b",
+    ]
+    parent_b = {
+        k.replace("_parent_guardian_b", ""): v
+        for (k, v) in item.items()
+        if k in parent_b_attributes and v != ""
+    }
+    logging.debug("parent_b_preformatted: %s", parent_b)
+
+    result = {}
+    result[format_name(parent_a)] = parent_a
+    if "name_last" in parent_b:
+        result[format_name(parent_b)] = parent_b
+    return result
+
+
+def parse_children_from_item(item):
+    child_a_attributes = [
+        "name_last_child_a",
+        "name_first_child_a",
+        # "grade_child_a",
+        # "program_child_a",
+        # "teacher_hr_child_a",
+    ]
+    child_a = {
+        k.replace("_child_a", ""): v
+        for (k, v) in item.items()
+        if k in child_a_attributes
+    }
+    logging.debug("child_a_preformatted: %s", child_a)
+
+    child_b_attributes = [
+        "name_last_child_b",
+        "name_first_child_b",
+        # "grade_child_b",
+        # "program_child_b",
+        # "teacher_hr_child_b",
+    ]
+    child_b = {
+        k.replace("_child_b", ""): v
+        for (k, v) in item.items()
+        if k in child_b_attributes
+    }
+    logging.debug("child_b_preformatted: %s", child_b)
+
+    result = {}
+    result[format_name(child_a)] = child_a
+    if "name_last" in child_b:
+        result[format_name(child_b)] = child_b
+    return result
+
+
+def parse_family_from_item(item):
+    parents = parse_parents_from_item(item)
+    logging.debug("parents_parsed: %s", parents)
+    children = parse_children_from_item(item)
+    for _, child_data in children.items():
+        child_data["parents"] = list(set(parents.keys()))
+    return {
+        "children": children,
+        "parents": parents,
+    }
+
+
+def parse_child_from_item(item):
+    child_attributes = [
+        "name_last",
+        "name_first",
+        "grade",
+        "teacher_hr",
+        "language",
+    ]
+    child = {k: v for (k, v) in item.items() if k in child_attributes}
+    logging.debug("child_pre_parsed: %s", child)
+    result = {}
+    result[format_name(child)] = child
+    return result
+
+
+
+def dict_path(headers, rows, parse):
+    return [parse(item) for item in map(lambda d: dict(zip(headers, d)), rows)]
+
+
+def decoder_path(headers, rows, parse):
+    decode = parse(RowDecoder(headers))
+    return [decode(row) for row in rows]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    roster, directory = generate(students)
+    cases = [
+        ("roster", roster, parse_child_from_item, lambda d: d.child),
+        ("directory", directory, parse_family_from_item, lambda d: d.family),
+    ]
+    for name, values, parse_item, parse_row in cases:
+        headers, rows = values[0], values[1:]
+        old_seconds, old = timed(dict_path, headers, rows, parse_item)
+        new_seconds, new = timed(decoder_path, headers, rows, parse_row)
+        assert old == new
+        print(
+            f"{name:10} {len(rows)} rows"
+            f"  dict {old_seconds * 1000:8.1f} ms"
+            f"  decoder {new_seconds * 1000:8.1f} ms"
+            f"  speedup {old_seconds / new_seconds:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
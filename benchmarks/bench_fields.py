@@ -0,0 +1,67 @@
+"""response size and parse time of documents.get per fields projection
+
+    python benchmarks/bench_fields.py [--sizes 1000,10000] [--seed 0]
+
+a student directory document is built on the local model from synthetic
+data, then cut to each of DOC_PROJECTIONS as the api would return it. the
+local model keeps no text or paragraph styles, which real full reads carry
+on every paragraph and run, so real full responses are larger still
+"""
+import argparse
+import json
+import timeit
+from directo.docs import (
+    BOLD_STYLE,
+    DOC_PROJECTIONS,
+    group_cell_data_items,
+    insert_table_request,
+    last_table_index,
+    plan_table_fill,
+    project,
+)
+from directo.model import DocumentModel
+from directo.pipeline import directory_text_groups
+from directo.synthetic import generate
+from directo.transport import empty_document
+
+
+def directory_doc(students, seed):
+    roster, directory = generate(students, seed)
+    text_groups = directory_text_groups(
+        (roster[0], iter(roster[1:])), (directory[0], iter(directory[1:]))
+    )
+    model = DocumentModel(empty_document("bench", "student directory"))
+    model.apply(insert_table_request(rows=1, columns=2))
+    table = model.content[last_table_index(model.doc_json)]
+    rows = list(group_cell_data_items(text_groups, 2))
+    model.apply_all(
+        plan_table_fill(table["table"], table["startIndex"], rows, BOLD_STYLE)
+    )
+    return model.doc_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for students in [int(size) for size in args.sizes.split(",")]:
+        doc_json = directory_doc(students, args.seed)
+        full_bytes = None
+        for projection in DOC_PROJECTIONS:
+            content = json.dumps(project(doc_json, projection))
+            seconds = min(
+                timeit.repeat(lambda: json.loads(content), number=1, repeat=5)
+            )
+            full_bytes = full_bytes or len(content)
+            print(
+                f"{students:>7} {projection:10}"
+                f" {len(content) / 2 ** 10:10.1f} KiB"
+                f" {len(content) / full_bytes:7.1%}"
+                f" {seconds * 1000:9.2f} ms parse"
+            )
+
+
+if __name__ == "__main__":
+    main()
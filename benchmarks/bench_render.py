@@ -0,0 +1,36 @@
+"""compare per-call template construction with the compiled template cache
+
+    python benchmarks/bench_render.py [parents]
+"""
+import sys
+import timeit
+from jinja2 import Template
+from directo.render import ADDRESS_TEMPLATE, render_addresses
+
+PARENT = {
+    "name_first": "Alex",
+    "name_last": "Rivera",
+    "address": "123 Main St",
+    "city": "Portland",
+    "state": "OR",
+    "zip": "97201",
+    "email": "alex@example.com",
+    "phone": "555-0100",
+}
+
+
+def per_call(parents):
+    return [Template(ADDRESS_TEMPLATE).render(p).strip() for p in parents]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    parents = [PARENT] * count
+    assert per_call(parents[:10]) == render_addresses(parents[:10])
+    for name, func in (("per_call", per_call), ("cached", render_addresses)):
+        seconds = min(timeit.repeat(lambda: func(parents), number=1, repeat=3))
+        print(f"{name:10} {count} parents {seconds * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
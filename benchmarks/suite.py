@@ -0,0 +1,147 @@
+"""per-stage benchmark of the directory pipeline on synthetic data
+
+    python benchmarks/suite.py [--sizes 100,1000,10000,100000] [--seed 0]
+                               [--output bench_results.json]
+
+every stage runs once untraced for wall time and once under tracemalloc for
+its peak memory; results are written as json, one record per size
+"""
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from directo.decoder import RowDecoder
+from directo.docs import (
+    all_cells_content_indexes,
+    group_cell_data_items,
+    insert_table_request,
+    last_table_index,
+    plan_table_fill,
+    update_text_style_request,
+)
+from directo.model import DocumentModel
+from directo.sheets import DirectorySheetData, RosterSheetData
+from directo.synthetic import generate
+from directo.transport import empty_document
+
+
+def sheet_values(roster, directory):
+    return {
+        ("roster", "header"): roster[:1],
+        ("roster", "data"): roster[1:],
+        ("directory", "header"): directory[:1],
+        ("directory", "data"): directory[1:],
+    }
+
+
+def stages(roster, directory):
+    """yields (stage name, callable) pairs; each callable may use the results
+    of the stages before it through `state`"""
+    state = {"values": sheet_values(roster, directory)}
+
+    def parse():
+        roster_decoder = RowDecoder(roster[0])
+        directory_decoder = RowDecoder(directory[0])
+        for row in roster[1:]:
+            roster_decoder.child(row)
+        for row in directory[1:]:
+            directory_decoder.family(row)
+
+    def roster_read():
+        state["roster"] = RosterSheetData("roster", "header", "data", state["values"])
+
+    def converge_data():
+        state["directory"] = DirectorySheetData(
+            "directory", "header", "data", state["values"]
+        )
+
+    def enrich():
+        state["roster"].enrich_roster_with_normalized_directory(state["directory"])
+
+    def correlate():
+        state["roster"].correlate_teachers_to_students(sort=True)
+        state["roster"].correlate_students_to_parents(sort=True)
+
+    def format_data():
+        state["directory_data"] = state["roster"].format_directory_data()
+        state["roster_data"] = state["roster"].format_roster_data()
+
+    def request_generation():
+        model = DocumentModel(empty_document("bench", "bench"))
+        model.apply(insert_table_request(rows=1, columns=2))
+        table = model.content[last_table_index(model.doc_json)]
+        rows = list(group_cell_data_items(list(state["directory_data"]), 2))
+        requests = plan_table_fill(table["table"], table["startIndex"], rows)
+        state["model"] = model
+        state["table"] = table
+        state["requests"] = requests
+
+    def model_apply():
+        state["model"].apply_all(state["requests"])
+        state["requests"] = [
+            update_text_style_request({"bold": True}, start, end)
+            for (start, end) in all_cells_content_indexes(
+                state["table"]["table"], first_para_only=True
+            )
+        ]
+
+    for stage in (
+        parse,
+        roster_read,
+        converge_data,
+        enrich,
+        correlate,
+        format_data,
+        request_generation,
+        model_apply,
+    ):
+        yield stage.__name__, stage
+
+
+def run_size(students, seed):
+    roster, directory = generate(students, seed)
+    result = {"students": students, "stages": {}}
+    for name, stage in stages(roster, directory):
+        start = time.perf_counter()
+        stage()
+        result["stages"][name] = {"seconds": time.perf_counter() - start}
+
+    tracemalloc.start()
+    for name, stage in stages(roster, directory):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        stage()
+        peak = tracemalloc.get_traced_memory()[1]
+        result["stages"][name]["peak_bytes"] = peak - before
+    tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "runs": [],
+    }
+    for students in [int(size) for size in args.sizes.split(",")]:
+        run = run_size(students, args.seed)
+        results["runs"].append(run)
+        for name, stage in run["stages"].items():
+            print(
+                f"{students:>7} {name:20}"
+                f" {stage['seconds'] * 1000:10.1f} ms"
+                f" {stage['peak_bytes'] / 2 ** 20:9.1f} MiB"
+            )
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
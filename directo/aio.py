@@ -0,0 +1,368 @@
+"""aio module
+
+asyncio client for the docs and sheets calls directo makes, so sheet reads,
+document creation and updates of several documents can overlap in one
+process. requires the "async" extra (aiohttp)
+
+every call goes through one aiohttp session, so connections are reused, and
+is paced by the same token bucket as the synchronous client. cancelling a
+task cancels its request; a document whose update was cancelled marks its
+local model stale and re-reads it on the next update
+
+setting DIRECTO_API_URL sends both apis to one unauthenticated base url, e.g.
+the fake server of directo.transport
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+from directo.auth import CREDENTIALS, SCOPES_RW
+from directo.clients import REGISTRY
+from directo.docs import (
+    BOLD_STYLE,
+    DOC_PROJECTIONS,
+    UNBROKEN_STYLE,
+    DirectoryDoc,
+    cells_paragraph_style_requests,
+    cells_text_style_requests,
+    general_format_style,
+    group_cell_data_items,
+    guarded_body,
+    insert_table_request,
+    insert_table_row_request,
+    iter_table_fill_requests,
+    last_table_index,
+    project,
+    response_revision,
+    reversed_insert_text_requests,
+    table_last_row_content_append_indexes,
+    table_last_row_index,
+)
+from directo.model import DocumentModel, skeleton
+from directo.scheduler import (
+    DOCS_SCHEDULER,
+    RETRYABLE_STATUSES,
+    chunk_requests,
+    error_status,
+)
+from directo.trace import TRACER, traced_methods
+from directo.transport import endpoint
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+API_URL = os.environ.get("DIRECTO_API_URL")
+DOCS_URL = "https://docs.googleapis.com"
+SHEETS_URL = "https://sheets.googleapis.com"
+
+
+class AsyncClient(object):
+    """the docs and sheets calls directo makes, on one reused session"""
+
+    def __init__(self, api_url=API_URL, scheduler=DOCS_SCHEDULER, scopes=SCOPES_RW):
+        if aiohttp is None:
+            raise ImportError("directo.aio needs aiohttp: pip install directo[async]")
+        self.docs_url = api_url or DOCS_URL
+        self.sheets_url = api_url or SHEETS_URL
+        self.authorize = api_url is None
+        self.scheduler = scheduler
+        self.scopes = scopes
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def headers(self):
+        if not self.authorize:
+            return {}
+        creds = REGISTRY.get_creds(self.scopes)
+        if not creds.valid:
+            await asyncio.to_thread(CREDENTIALS.refresh, creds, self.scopes)
+        return {"Authorization": f"Bearer {creds.token}"}
+
+    async def request(self, method, url, params=None, body=None):
+        """one api call, returning the decoded json response"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(raise_for_status=True)
+        start = time.perf_counter()
+        async with self.session.request(
+            method, url, params=params, json=body, headers=await self.headers()
+        ) as response:
+            content = await response.read()
+            if TRACER.enabled:
+                TRACER.add_event(
+                    f"{method} {response.url.host}{endpoint(url)}",
+                    "api",
+                    start,
+                    time.perf_counter(),
+                    {
+                        "status": response.status,
+                        "request_bytes": len(json.dumps(body)) if body else 0,
+                        "response_bytes": len(content),
+                    },
+                )
+            return await response.json(content_type=None)
+
+    async def call(self, method, url, params=None, body=None, before_retry=None):
+        """a paced api call, retried like BatchScheduler.call; before_retry
+        may return a result that makes the retry unnecessary"""
+        scheduler = self.scheduler
+        attempt = 0
+        while True:
+            wait = scheduler.bucket.try_acquire()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = scheduler.bucket.try_acquire()
+            try:
+                return await self.request(method, url, params, body)
+            except aiohttp.ClientResponseError as e:
+                if (
+                    error_status(e) not in RETRYABLE_STATUSES
+                    or attempt >= scheduler.max_retries
+                ):
+                    raise
+                scheduler.count_retry()
+                await asyncio.sleep(scheduler.backoff(attempt))
+                attempt += 1
+                if before_retry is not None:
+                    result = await before_retry()
+                    if result is not None:
+                        return result
+
+    async def read_sheet_range(self, sheet_id, sheet_range):
+        return await self.request(
+            "GET",
+            f"{self.sheets_url}/v4/spreadsheets/{sheet_id}/values/"
+            f"{quote(sheet_range, safe='')}",
+            params={"fields": "values"},
+        )
+
+    async def batch_read_sheet_ranges(self, sheet_id, sheet_ranges):
+        """value grids of several ranges of one spreadsheet, in request order"""
+        response = await self.request(
+            "GET",
+            f"{self.sheets_url}/v4/spreadsheets/{sheet_id}/values:batchGet",
+            params=[("ranges", sheet_range) for sheet_range in sheet_ranges]
+            + [("fields", "valueRanges(range,values)")],
+        )
+        return [
+            value_range.get("values", []) for value_range in response["valueRanges"]
+        ]
+
+    async def create_doc(self, body):
+        doc = await self.call("POST", f"{self.docs_url}/v1/documents", body=body)
+        return doc["documentId"]
+
+    async def get_doc_json(self, doc_id, projection="full"):
+        fields = DOC_PROJECTIONS[projection]
+        return await self.request(
+            "GET",
+            f"{self.docs_url}/v1/documents/{doc_id}",
+            params=None if fields is None else {"fields": fields},
+        )
+
+    async def batch_update_doc(self, doc_id, requests, revision=None):
+        """chunks are sent in order, a document's updates must not overlap;
+        each requires the revision the chunk before left, and a retried chunk
+        is not sent again if the revision shows it landed, as in
+        docs.batch_update_doc"""
+        url = f"{self.docs_url}/v1/documents/{doc_id}:batchUpdate"
+        if revision is None:
+            revision = (await self.get_doc_json(doc_id, "revision")).get("revisionId")
+
+        async def landed():
+            current = (await self.get_doc_json(doc_id, "revision")).get("revisionId")
+            if current != revision:
+                return {
+                    "documentId": doc_id,
+                    "writeControl": {"requiredRevisionId": current},
+                }
+            return None
+
+        responses = []
+        for chunk in chunk_requests(
+            requests, self.scheduler.max_count, self.scheduler.max_bytes
+        ):
+            response = await self.call(
+                "POST", url, body=guarded_body(chunk, revision), before_retry=landed
+            )
+            revision = response_revision(response)
+            responses.append(response)
+        return responses
+
+
+@traced_methods("doc")
+class AsyncDirectoryDoc(DirectoryDoc):
+    """DirectoryDoc whose api calls are awaited on an AsyncClient; the
+    request planning and local model are shared with the synchronous class"""
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    async def new(self, title):
+        self.doc_id = await self.client.create_doc({"title": title, "body": {}})
+        await self.refresh_doc_json()
+
+    async def new_table(self, columns):
+        await self.batch_update([insert_table_request(rows=1, columns=columns)])
+        self.activate_table(last_table_index(self.doc_json))
+
+    async def get(self, doc_id, read_only=False):
+        self.doc_id = doc_id
+        await self.refresh_doc_json()
+
+    async def batch_update(self, requests):
+        if self.model.stale:
+            await self.refresh_doc_json()
+        try:
+            responses = await self.client.batch_update_doc(
+                self.doc_id, requests, self.doc_json.get("revisionId")
+            )
+        except asyncio.CancelledError:
+            # some chunks may have landed, the model no longer says which
+            self.model.stale = True
+            raise
+        self.model.apply_all(requests)
+        if self.model.stale:
+            await self.refresh_doc_json()
+        elif responses:
+            self.doc_json["revisionId"] = response_revision(responses[-1])
+        try:
+            self.refresh_table_json()
+        except Exception:
+            pass
+
+    async def stream_update(self, requests):
+        for chunk in chunk_requests(
+            requests, self.client.scheduler.max_count, self.client.scheduler.max_bytes
+        ):
+            await self.batch_update(chunk)
+
+    async def refresh_doc_json(self):
+        self.model = DocumentModel(await self.client.get_doc_json(self.doc_id))
+        self.doc_json = self.model.doc_json
+
+    async def checkpoint(self):
+        remote = await self.client.get_doc_json(self.doc_id, "skeleton")
+        matched = skeleton(project(self.doc_json, "skeleton")) == skeleton(remote)
+        if not matched:
+            logging.warning("local document model drifted, resynchronized")
+            await self.refresh_doc_json()
+        try:
+            self.refresh_table_json()
+        except Exception:
+            pass
+        return matched
+
+    async def append_table_row(self):
+        await self.batch_update(
+            [
+                insert_table_row_request(
+                    self.table_start_index,
+                    table_last_row_index(self.active_table_json),
+                )
+            ]
+        )
+
+    async def fill_last_table_row(self, text_groups):
+        content_append_indexes = table_last_row_content_append_indexes(
+            self.active_table_json
+        )
+        await self.batch_update(
+            reversed_insert_text_requests(text_groups, content_append_indexes)
+        )
+
+    async def fill_table_with_data(self, data, first_line_style=None):
+        await self.batch_update(self._table_fill_requests(data, first_line_style))
+
+    async def stream_table_with_data(self, data, first_line_style=None):
+        await self.stream_update(
+            iter_table_fill_requests(
+                self.active_table_json,
+                self.table_start_index,
+                group_cell_data_items(data, self.columns_count),
+                first_line_style,
+            )
+        )
+
+    async def build_tables(self, tables_data, columns, font_size=9):
+        for requests in self._build_tables_steps(tables_data, columns, font_size):
+            await self.batch_update(requests)
+
+    async def apply_text_style(self, style, first_para_only=False):
+        await self.batch_update(
+            cells_text_style_requests(self.active_table_json, style, first_para_only)
+        )
+
+    async def apply_paragraph_style(self, style, first_para_only=False):
+        await self.batch_update(
+            cells_paragraph_style_requests(
+                self.active_table_json, style, first_para_only
+            )
+        )
+
+    async def bold_cells_first_line(self):
+        await self.apply_text_style(BOLD_STYLE, first_para_only=True)
+
+    async def general_format_cells(self, font_size=8, font_family="Calibri"):
+        await self.apply_text_style(general_format_style(font_size, font_family))
+
+    async def unbroken_cells(self):
+        await self.apply_paragraph_style(UNBROKEN_STYLE)
+
+
+class SyncClient(object):
+    """blocking facade over AsyncClient; the client runs on a private event
+    loop thread, so its session and connections outlive each call"""
+
+    def __init__(self, **client_kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = AsyncClient(**client_kwargs)
+
+    def run(self, coroutine, timeout=None):
+        """wait for a coroutine on the client's loop, cancelling it if the
+        wait is interrupted or times out"""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except (KeyboardInterrupt, concurrent.futures.TimeoutError):
+            future.cancel()
+            raise
+
+    def read_sheet_range(self, sheet_id, sheet_range):
+        return self.run(self.client.read_sheet_range(sheet_id, sheet_range))
+
+    def batch_read_sheet_ranges(self, sheet_id, sheet_ranges):
+        return self.run(self.client.batch_read_sheet_ranges(sheet_id, sheet_ranges))
+
+    def create_doc(self, body):
+        return self.run(self.client.create_doc(body))
+
+    def get_doc_json(self, doc_id, projection="full"):
+        return self.run(self.client.get_doc_json(doc_id, projection))
+
+    def batch_update_doc(self, doc_id, requests, revision=None):
+        return self.run(self.client.batch_update_doc(doc_id, requests, revision))
+
+    def close(self):
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
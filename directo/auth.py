@@ -1,9 +1,29 @@
-"""auth module"""
-import os.path
+"""auth module
+
+credentials are held in memory by a CredentialManager, one set per scope
+list, and refreshed by a background thread ahead of their expiry, so api
+calls never stall on a refresh. the token file, DIRECTO_TOKEN_PATH or
+token.json in the working directory, is shared by every directo process:
+it is read and written under an exclusive lock, replaced atomically, and
+only written when the token changed. a process about to refresh first
+re-reads the file, and adopts a token another process already refreshed
+"""
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # If modifying these scopes, delete the file token.json.
 SCOPES_RO = [
     "https://www.googleapis.com/auth/documents.readonly",
@@ -15,24 +35,157 @@ SCOPES_RW = [
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
+# The file token.json stores the user's access and refresh tokens, and is
+# created automatically when the authorization flow completes for the first
+# time.
+TOKEN_PATH = os.environ.get("DIRECTO_TOKEN_PATH", "token.json")
+# refresh this many seconds before a token expires
+REFRESH_MARGIN = 300
+REFRESH_RETRY_SECONDS = 30
 
-def get_creds(scopes):
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", scopes)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+
+def utcnow():
+    """naive utc, as google-auth keeps expiry"""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class CredentialManager(object):
+    def __init__(self, token_path=TOKEN_PATH, refresh_margin=REFRESH_MARGIN):
+        self.token_path = token_path
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.creds = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @contextmanager
+    def file_lock(self):
+        """exclusive across processes; a sibling lock file, since the token
+        file itself is replaced"""
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.token_path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self):
+        try:
+            with open(self.token_path) as token:
+                return token.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, creds):
+        """replace the token file atomically, unless it already holds creds;
+        call with the file lock held"""
+        content = creds.to_json()
+        if content == self.read():
+            return
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as token:
+                token.write(content)
+                token.flush()
+                os.fsync(token.fileno())
+            os.replace(temporary, self.token_path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def stored_creds(self, scopes):
+        content = self.read()
+        if content is None:
+            return None
+        return Credentials.from_authorized_user_info(json.loads(content), scopes)
+
+    def expiring(self, creds):
+        return creds.expiry is not None and (
+            creds.expiry - self.refresh_margin <= utcnow()
+        )
+
+    def get(self, scopes):
+        """the credentials for scopes, authorizing once per process"""
+        key = tuple(scopes)
+        with self.lock:
+            if key not in self.creds:
+                self.creds[key] = self.authorize(scopes)
+            self.start()
+            return self.creds[key]
+
+    def authorize(self, scopes):
+        with self.file_lock():
+            creds = self.stored_creds(scopes)
+            if creds and creds.valid and not self.expiring(creds):
+                return creds
+            if creds and creds.refresh_token:
+                creds.refresh(Request())
+            else:
+                # If there are no (valid) credentials available, let the user
+                # log in.
+                flow = InstalledAppFlow.from_client_secrets_file(
+                    os.environ.get("GOOGLE_CREDENTIALS"), scopes
+                )
+                creds = flow.run_local_server(port=0)
+            self.write(creds)
+        return creds
+
+    def refresh(self, creds, scopes):
+        """refresh creds in place, so api clients holding them see the new
+        token; a token another process already refreshed is adopted"""
+        with self.file_lock():
+            stored = self.stored_creds(scopes)
+            if stored and stored.valid and not self.expiring(stored):
+                creds.token = stored.token
+                creds.expiry = stored.expiry
+                return
             creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                os.environ.get("GOOGLE_CREDENTIALS"), scopes
-            )
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-    return creds
+            self.write(creds)
+
+    def seconds_to_next_refresh(self):
+        """until the first token is due, checking at least twice a margin so
+        credentials added meanwhile are not missed"""
+        wait = self.refresh_margin / 2
+        expiries = [c.expiry for c in self.creds.values() if c.expiry is not None]
+        if expiries:
+            wait = min(wait, min(expiries) - self.refresh_margin - utcnow())
+        return max(1.0, wait.total_seconds())
+
+    def run(self):
+        wait = self.seconds_to_next_refresh()
+        while not self.stopped.wait(wait):
+            wait = None
+            for key, creds in list(self.creds.items()):
+                if not self.expiring(creds):
+                    continue
+                try:
+                    self.refresh(creds, list(key))
+                except Exception as e:
+                    # the client refreshes on its own if this keeps failing
+                    logging.warning(f"background token refresh failed: {e}")
+                    wait = REFRESH_RETRY_SECONDS
+            if wait is None:
+                wait = self.seconds_to_next_refresh()
+
+    def start(self):
+        """start the refresh thread, again after a fork, which does not
+        carry threads over"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+CREDENTIALS = CredentialManager()
+
+
+def get_creds(scopes):
+    return CREDENTIALS.get(scopes)
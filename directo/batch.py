@@ -0,0 +1,240 @@
+"""batch module
+
+runs directo for several schools at once from a json manifest:
+
+    python -m directo.batch MANIFEST [--workers N] [--report PATH]
+
+    {
+      "defaults": {"command": "directory", "max_age": 3600},
+      "jobs": [
+        {"name": "north", "roster_sheet_id": "...", "directory_sheet_id": "..."},
+        {"name": "south", "roster_sheet_id": "...", "directory_sheet_id": "...",
+         "command": "roster", "format": "docx", "output": "south.docx"}
+      ]
+    }
+
+a job takes the command line options of directo ("doc_id", "per_grade",
+"format", "output", "max_age", "offline", "snapshot", "page_size", "resume",
+"journal_dir"), the sheet ids, and optionally "roster_range" and
+"directory_range" in the shape of ROSTER_SHEET_KWARGS and
+"requests_per_minute", which can only lower the job's share of the quota;
+"defaults" applies to every job. a job with "resume" or "journal_dir"
+journals its builds under its own name in that directory, JOURNAL_DIR by
+default, so a batch rerun with "resume" finishes what a failed one left;
+other jobs journal nothing
+
+jobs run in a pool of worker processes. credentials are loaded once, before
+the pool starts, and each worker builds its api clients once for all the
+jobs it runs. the write quota belongs to the user, not to a job, so each
+job's scheduler gets an equal share of it and together the workers keep the
+documents api busy at the quota ceiling. the combined report lists each
+job's outcome, documents and timing
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from directo.auth import SCOPES_RW
+from directo.clients import REGISTRY
+from directo.journal import JOURNAL_DIR
+from directo.main import (
+    DIRECTORY_SHEET_KWARGS,
+    ROSTER_SHEET_KWARGS,
+    parse_args,
+    run,
+)
+from directo.scheduler import DOCS_SCHEDULER, REQUESTS_PER_MINUTE, TokenBucket
+from directo.trace import TRACER
+
+JOB_OPTIONS = {
+    "doc_id",
+    "per_grade",
+    "format",
+    "output",
+    "max_age",
+    "offline",
+    "snapshot",
+    "page_size",
+    "resume",
+    "journal_dir",
+}
+JOB_KEYS = JOB_OPTIONS | {
+    "name",
+    "command",
+    "roster_sheet_id",
+    "directory_sheet_id",
+    "roster_range",
+    "directory_range",
+    "requests_per_minute",
+}
+
+
+def job_argv(job):
+    """the directo command line a job stands for"""
+    argv = [job.get("command", "directory")]
+    options = ("doc_id", "format", "output", "max_age", "page_size", "journal_dir")
+    for option in options:
+        if job.get(option) is not None:
+            argv.extend([f"--{option.replace('_', '-')}", str(job[option])])
+    for flag in ("per_grade", "offline", "snapshot", "resume"):
+        if job.get(flag):
+            argv.append(f"--{flag.replace('_', '-')}")
+    return argv
+
+
+def load_manifest(path):
+    """the manifest's jobs with defaults applied, each checked like a command
+    line so a bad job fails the batch before anything runs"""
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for number, job in enumerate(manifest["jobs"]):
+        own_journal_dir = "journal_dir" in job
+        job = {**defaults, **job}
+        job.setdefault("name", f"job-{number}")
+        if not own_journal_dir and (job.get("resume") or job.get("journal_dir")):
+            # schools build documents of the same titles, so journal them apart
+            job["journal_dir"] = os.path.join(
+                job.get("journal_dir") or JOURNAL_DIR, job["name"]
+            )
+        unknown = set(job) - JOB_KEYS
+        if unknown:
+            raise ValueError(f"job {job['name']}: unknown keys {sorted(unknown)}")
+        if not job.get("roster_sheet_id"):
+            raise ValueError(f"job {job['name']}: roster_sheet_id is required")
+        if job.get("command", "directory") != "roster" and not job.get(
+            "directory_sheet_id"
+        ):
+            raise ValueError(f"job {job['name']}: directory_sheet_id is required")
+        try:
+            parse_args(job_argv(job))
+        except SystemExit:
+            raise ValueError(f"job {job['name']}: invalid options") from None
+        jobs.append(job)
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("job names must be unique")
+    return jobs
+
+
+def init_worker(log_level):
+    """once per worker process: progress on stderr, keeping stdout for the
+    report, a trace file of its own, and the api clients its jobs reuse"""
+    sys.stdout = sys.stderr
+    logging.basicConfig(level=log_level, stream=sys.stderr, force=True)
+    if TRACER.enabled:
+        root, extension = os.path.splitext(TRACER.path)
+        TRACER.path = f"{root}-{os.getpid()}{extension}"
+    REGISTRY.get_service("docs", "v1", SCOPES_RW)
+    REGISTRY.get_service("sheets", "v4", SCOPES_RW)
+
+
+def run_job(job, requests_per_minute):
+    """run one job in a worker; returns its report entry, never raises"""
+    # a worker runs one job at a time, so its scheduler is the job's; a job
+    # may pace itself below its share but never past it, or the workers
+    # together would exceed the quota
+    DOCS_SCHEDULER.bucket = TokenBucket(
+        min(job.get("requests_per_minute", requests_per_minute), requests_per_minute)
+    )
+    retries = DOCS_SCHEDULER.retries
+    entry = {"name": job["name"], "command": job.get("command", "directory")}
+    start = time.perf_counter()
+    try:
+        entry.update(
+            run(
+                parse_args(job_argv(job)),
+                roster_sheet_id=job["roster_sheet_id"],
+                directory_sheet_id=job.get("directory_sheet_id"),
+                roster_kwargs=job.get("roster_range", ROSTER_SHEET_KWARGS),
+                directory_kwargs=job.get("directory_range", DIRECTORY_SHEET_KWARGS),
+            )
+        )
+        entry["status"] = "ok"
+    except Exception as e:
+        logging.exception("job %s failed", job["name"])
+        entry["status"] = "failed"
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    entry["api_retries"] = DOCS_SCHEDULER.retries - retries
+    entry["pid"] = os.getpid()
+    TRACER.finish()
+    return entry
+
+
+def run_batch(jobs, workers=None, requests_per_minute=REQUESTS_PER_MINUTE):
+    """run jobs in a process pool; returns the combined report"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    share = requests_per_minute / workers
+    if REGISTRY.transport is None or REGISTRY.transport.needs_credentials:
+        # any interactive authorization happens here, once; the workers
+        # inherit the loaded credentials, each restarts the background
+        # refresh on its first lookup, and they refresh through the locked
+        # token file so only one of them refreshes at a time
+        REGISTRY.get_creds(SCOPES_RW)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(logging.getLogger().getEffectiveLevel(),),
+    ) as executor:
+        futures = [executor.submit(run_job, job, share) for job in jobs]
+        entries = [future.result() for future in futures]
+    seconds = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "requests_per_minute_per_job": share,
+        "seconds": round(seconds, 3),
+        "job_seconds": round(sum(entry["seconds"] for entry in entries), 3),
+        "failed": sum(entry["status"] != "ok" for entry in entries),
+        "jobs": entries,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="directo-batch")
+    parser.add_argument("manifest", help="json manifest of the jobs to run")
+    parser.add_argument(
+        "--workers", type=int, help="worker processes, one per cpu if unset"
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=REQUESTS_PER_MINUTE,
+        help="write quota shared by all workers",
+    )
+    parser.add_argument("--report", help="write the json report here, not stdout")
+    args = parser.parse_args(argv)
+
+    if os.environ.get("DEBUG") is not None:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.WARN
+    logging.basicConfig(level=log_level, stream=sys.stdout)
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"bad manifest {args.manifest}: {e}")
+    report = run_batch(jobs, args.workers, args.requests_per_minute)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(
+            f"{len(jobs) - report['failed']}/{len(jobs)} jobs ok in "
+            f"{report['seconds']}s ({report['job_seconds']}s of job time), "
+            f"report in {args.report}"
+        )
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""clients module"""
+import threading
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+from directo.auth import get_creds
+from directo.trace import TRACER, TracingHttp
+from directo.transport import TRANSPORT
+
+
+def traced_http(http):
+    if TRACER.enabled:
+        return TracingHttp(http)
+    return http
+
+
+class ClientRegistry(object):
+    """process-wide cache of api service objects keyed by (api, version,
+    scopes); httplib2 connections are not thread-safe, so each thread gets
+    its own service objects. services are built from the discovery documents
+    bundled with googleapiclient, so building one needs no network.
+    credentials are shared, and always looked up through auth's
+    CredentialManager, which keeps their refresh thread running, in forked
+    workers too"""
+
+    def __init__(self, transport=TRANSPORT):
+        self.transport = transport
+        self.services = {}
+        self.stats = {
+            "service_hits": 0,
+            "service_misses": 0,
+        }
+        self.lock = threading.Lock()
+
+    def get_creds(self, scopes):
+        return get_creds(scopes)
+
+    def get_service(self, api, version, scopes):
+        key = (api, version, tuple(scopes), threading.get_ident())
+        if self.transport is None or self.transport.needs_credentials:
+            creds = self.get_creds(scopes)
+        else:
+            creds = None
+        with self.lock:
+            if key in self.services:
+                self.stats["service_hits"] += 1
+            else:
+                self.stats["service_misses"] += 1
+                self.services[key] = self.build(api, version, creds)
+            return self.services[key]
+
+    def build(self, api, version, creds):
+        if self.transport is not None:
+            http = self.transport.http(creds)
+        elif TRACER.enabled:
+            http = AuthorizedHttp(creds, http=build_http())
+        else:
+            return build(api, version, credentials=creds, static_discovery=True)
+        return build(api, version, http=traced_http(http), static_discovery=True)
+
+    def clear(self):
+        with self.lock:
+            self.services.clear()
+
+
+REGISTRY = ClientRegistry()
+
+
+def get_service(api, version, scopes):
+    return REGISTRY.get_service(api, version, scopes)
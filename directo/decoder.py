@@ -0,0 +1,98 @@
+"""decoder module
+
+parses raw sheet rows straight into records using column positions compiled
+once from the header row, instead of building and scanning a dict per row
+"""
+
+PARENT_FIELDS = [
+    "name_last",
+    "name_first",
+    "email",
+    "phone",
+    "address",
+    "city",
+    "state",
+    "zip",
+]
+CHILD_FIELDS = [
+    "name_last",
+    "name_first",
+]
+ROSTER_CHILD_FIELDS = [
+    "name_last",
+    "name_first",
+    "grade",
+    "teacher_hr",
+    "language",
+]
+
+
+def format_name(item):
+    return f"{item['name_last'].strip()}, {item['name_first'].strip()}"
+
+
+def compile_fields(headers, fields, suffix=""):
+    """(position, field) pairs in header order for the columns named
+    field + suffix; like dict(zip(headers, row)), the last duplicate wins"""
+    positions = {header: i for i, header in enumerate(headers)}
+    return sorted(
+        (positions[field + suffix], field)
+        for field in fields
+        if field + suffix in positions
+    )
+
+
+def decode_fields(fields, row, keep_empty=True):
+    """short rows are normal, the api trims trailing empty cells"""
+    width = len(row)
+    if keep_empty:
+        return {field: row[i] for (i, field) in fields if i < width}
+    return {field: row[i] for (i, field) in fields if i < width and row[i] != ""}
+
+
+class RowDecoder(object):
+    def __init__(self, headers):
+        self.parent_a = compile_fields(headers, PARENT_FIELDS, "_parent_guardian_a")
+        self.parent_b = compile_fields(headers, PARENT_FIELDS, "_parent_guardian_b")
+        self.child_a = compile_fields(headers, CHILD_FIELDS, "_child_a")
+        self.child_b = compile_fields(headers, CHILD_FIELDS, "_child_b")
+        self.roster = compile_fields(headers, ROSTER_CHILD_FIELDS)
+
+    def parents(self, row):
+        """same result as parse_parents_from_item in
+        benchmarks/bench_decode.py"""
+        parent_a = decode_fields(self.parent_a, row, keep_empty=False)
+        parent_b = decode_fields(self.parent_b, row, keep_empty=False)
+        result = {format_name(parent_a): parent_a}
+        if "name_last" in parent_b:
+            result[format_name(parent_b)] = parent_b
+        return result
+
+    def children(self, row):
+        """same result as parse_children_from_item in
+        benchmarks/bench_decode.py"""
+        child_a = decode_fields(self.child_a, row)
+        child_b = decode_fields(self.child_b, row)
+        result = {format_name(child_a): child_a}
+        if "name_last" in child_b:
+            result[format_name(child_b)] = child_b
+        return result
+
+    def family(self, row):
+        """same result as parse_family_from_item in
+        benchmarks/bench_decode.py"""
+        parents = self.parents(row)
+        children = self.children(row)
+        parent_names = list(set(parents.keys()))
+        for child_data in children.values():
+            child_data["parents"] = list(parent_names)
+        return {
+            "children": children,
+            "parents": parents,
+        }
+
+    def child(self, row):
+        """same result as parse_child_from_item in
+        benchmarks/bench_decode.py"""
+        child = decode_fields(self.roster, row)
+        return {format_name(child): child}
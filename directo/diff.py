@@ -0,0 +1,233 @@
+"""diff module
+
+incremental regeneration of an existing document: the rows already in its
+tables are compared with freshly rendered rows and only the differences are
+sent, so a refresh costs in proportion to what changed
+
+rows are compared by a hash of their cell texts. rows of the document whose
+cells still come out consecutively in the new data are kept whole, and only
+the data between kept rows is packed into new rows. a family added mid-table
+therefore costs one new row instead of shifting every later cell, at the
+price of an occasional partly filled row; build a fresh document to repack
+"""
+import copy
+import hashlib
+from difflib import SequenceMatcher
+from directo.docs import (
+    BOLD_STYLE,
+    UNBROKEN_STYLE,
+    coalesce_ranges,
+    delete_content_range_request,
+    delete_table_row_request,
+    general_format_style,
+    insert_table_row_request,
+    insert_text_request,
+    update_paragraph_style_request,
+    update_text_style_request,
+)
+from directo.model import DocumentModel, paragraph_text
+
+# a cell padding out a short last row, as filled by group_cell_data_items
+PAD_CELL = "\n\n"
+EMPTY_CELL = "\n"
+
+
+def data_cells(row):
+    return [cell for cell in row if cell not in (PAD_CELL, EMPTY_CELL)]
+
+
+def cell_text(cell):
+    return "".join(paragraph_text(p) or "" for p in cell["content"])
+
+
+def table_rows_text(table_json):
+    return [
+        tuple(cell_text(cell) for cell in row["tableCells"])
+        for row in table_json["tableRows"]
+    ]
+
+
+def row_hash(row):
+    return hashlib.blake2b("\x1f".join(row).encode(), digest_size=16).digest()
+
+
+def pack_rows(items, old_rows, columns):
+    """pack cell texts into rows, keeping any old row whose data cells come
+    next in items as it is; the rest is packed left to right and padded"""
+    rows_by_first_cell = {}
+    for row in old_rows:
+        rows_by_first_cell.setdefault(row[0], []).append(row)
+
+    rows = []
+    pending = []
+
+    def flush():
+        if pending:
+            rows.append(tuple(pending + [PAD_CELL] * (columns - len(pending))))
+            pending.clear()
+
+    position = 0
+    while position < len(items):
+        kept = None
+        for row in rows_by_first_cell.get(items[position], []):
+            cells = data_cells(row)
+            if list(items[position : position + len(cells)]) == cells:
+                kept = row
+                break
+        if kept is None:
+            pending.append(items[position])
+            position += 1
+            if len(pending) == columns:
+                flush()
+            continue
+        rows_by_first_cell[kept[0]].remove(kept)
+        flush()
+        rows.append(kept)
+        position += len(data_cells(kept))
+    flush()
+    if not rows:
+        # a table keeps at least its one empty row
+        rows.append((EMPTY_CELL,) * columns)
+    return rows
+
+
+def cell_format_requests(cells, font_size=9):
+    """the table format passes for some cells only, over coalesced ranges;
+    bold is cleared first as replaced text may inherit it"""
+    cell_ranges = coalesce_ranges(
+        (cell["startIndex"], cell["endIndex"]) for cell in cells
+    )
+    first_lines = coalesce_ranges(
+        (cell["content"][0]["startIndex"], cell["content"][0]["endIndex"])
+        for cell in cells
+    )
+    text_style = dict(general_format_style(font_size), bold=False)
+    return (
+        [update_paragraph_style_request(UNBROKEN_STYLE, *r) for r in cell_ranges]
+        + [update_text_style_request(text_style, *r) for r in cell_ranges]
+        + [update_text_style_request(BOLD_STYLE, *r) for r in first_lines]
+    )
+
+
+class TableUpdate(object):
+    """plans the update of one table on a scratch model, each request being
+    applied to the model as it is planned so the next one reads true indexes"""
+
+    def __init__(self, model, position):
+        self.model = model
+        self.position = position
+        self.requests = []
+
+    @property
+    def element(self):
+        return self.model.content[self.position]
+
+    def row(self, row_index):
+        return self.element["table"]["tableRows"][row_index]
+
+    def add(self, request):
+        self.model.apply(request)
+        self.requests.append(request)
+
+    def fill_row(self, row_index, new_row, old_row=None):
+        """write each changed cell right to left, replacing what it held"""
+        for column in reversed(range(len(new_row))):
+            if old_row is not None and old_row[column] == new_row[column]:
+                continue
+            cell = self.row(row_index)["tableCells"][column]
+            start = cell["content"][0]["startIndex"]
+            end = cell["content"][-1]["endIndex"] - 1
+            if end > start:
+                self.add(delete_content_range_request(start, end))
+            # the cell's own last newline stays, see EMPTY_CELL
+            if new_row[column][:-1]:
+                self.add(insert_text_request(new_row[column][:-1], start))
+
+    def insert_rows(self, row_index, new_rows):
+        """insert new_rows so the first of them lands at row_index"""
+        table_start = self.element["startIndex"]
+        for _ in new_rows:
+            if row_index == 0:
+                self.add(insert_table_row_request(table_start, 0, insert_below=False))
+            else:
+                self.add(insert_table_row_request(table_start, row_index - 1))
+        for offset in reversed(range(len(new_rows))):
+            self.fill_row(row_index + offset, new_rows[offset])
+
+    def delete_rows(self, row_start, row_end):
+        table_start = self.element["startIndex"]
+        for row_index in reversed(range(row_start, row_end)):
+            self.add(delete_table_row_request(table_start, row_index))
+
+    def plan(self, new_rows):
+        """returns (row counts per change kind, new row indexes touched)"""
+        old_rows = table_rows_text(self.element["table"])
+        matcher = SequenceMatcher(
+            None,
+            [row_hash(row) for row in old_rows],
+            [row_hash(row) for row in new_rows],
+            autojunk=False,
+        )
+        counts = {"kept": 0, "replaced": 0, "inserted": 0, "deleted": 0}
+        touched = []
+        # last to first, so each change leaves the rows before it in place
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == "equal":
+                counts["kept"] += i2 - i1
+                continue
+            common = min(i2 - i1, j2 - j1)
+            self.delete_rows(i1 + common, i2)
+            self.insert_rows(i1 + common, new_rows[j1 + common : j2])
+            for offset in reversed(range(common)):
+                self.fill_row(
+                    i1 + offset, new_rows[j1 + offset], old_rows[i1 + offset]
+                )
+            counts["replaced"] += common
+            counts["deleted"] += i2 - i1 - common
+            counts["inserted"] += j2 - j1 - common
+            touched.extend(range(j1, j2))
+        return counts, touched
+
+
+def plan_tables_update(doc_json, tables_data, columns, font_size=9):
+    """requests turning the last len(tables_data) tables of a document into
+    tables_data, plus the format of every touched cell; returns (requests,
+    counts of kept/replaced/inserted/deleted rows)"""
+    model = DocumentModel(copy.deepcopy(doc_json))
+    positions = [i for (i, element) in enumerate(model.content) if "table" in element]
+    if len(positions) < len(tables_data):
+        raise ValueError(
+            f"document has {len(positions)} tables, {len(tables_data)} needed"
+        )
+    positions = positions[len(positions) - len(tables_data) :]
+
+    requests = []
+    totals = {"kept": 0, "replaced": 0, "inserted": 0, "deleted": 0}
+    touched_by_position = {}
+    for position, data in reversed(list(zip(positions, tables_data))):
+        update = TableUpdate(model, position)
+        items = ["".join(text_group) + EMPTY_CELL for text_group in data]
+        old_rows = table_rows_text(update.element["table"])
+        counts, touched = update.plan(pack_rows(items, old_rows, columns))
+        requests.extend(update.requests)
+        touched_by_position[position] = touched
+        for kind, count in counts.items():
+            totals[kind] += count
+
+    # text changes never add or remove tables, so positions still hold
+    for position, touched in touched_by_position.items():
+        rows = model.content[position]["table"]["tableRows"]
+        cells = [
+            cell for row_index in touched for cell in rows[row_index]["tableCells"]
+        ]
+        requests.extend(cell_format_requests(cells, font_size))
+    return requests, totals
+
+
+def update_doc(doc, tables_data, columns, font_size=9):
+    """bring an opened DirectoryDoc's tables up to date with tables_data"""
+    requests, counts = plan_tables_update(
+        doc.doc_json, tables_data, columns, font_size
+    )
+    doc.batch_update(requests)
+    return counts
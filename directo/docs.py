@@ -1,19 +1,57 @@
 """docs module"""
-from googleapiclient.discovery import build
-from directo.auth import get_creds, SCOPES_RO, SCOPES_RW
+from directo.auth import SCOPES_RO, SCOPES_RW
+from directo.clients import get_service
+from directo.model import (
+    DocumentModel,
+    apply_field_mask,
+    parse_field_mask,
+    skeleton,
+    utf16_len,
+)
+from directo.scheduler import DOCS_SCHEDULER, chunk_requests
+from directo.trace import traced_methods
+import copy
+import itertools
 import logging
-import time
 
 
 # api interactions
-def get_doc_json(doc_id):
-    service = build("docs", "v1", credentials=get_creds(SCOPES_RO))
-    return service.documents().get(documentId=doc_id).execute()
+# fields masks for documents.get by what the caller reads; the skeleton is
+# what model.skeleton compares, without any text or style
+DOC_PROJECTIONS = {
+    "full": None,
+    "existence": "documentId",
+    "revision": "revisionId",
+    "skeleton": (
+        "documentId,body/content(startIndex,endIndex,table/tableRows("
+        "startIndex,endIndex,tableCells(startIndex,endIndex,"
+        "content(startIndex,endIndex))))"
+    ),
+}
+
+
+def get_doc_json(doc_id, projection="full"):
+    """the document, or only the fields of one of DOC_PROJECTIONS"""
+    service = get_service("docs", "v1", SCOPES_RO)
+    return (
+        service.documents()
+        .get(documentId=doc_id, fields=DOC_PROJECTIONS[projection])
+        .execute()
+    )
+
+
+def project(doc_json, projection):
+    """a local document as get_doc_json would return it under projection"""
+    fields = DOC_PROJECTIONS[projection]
+    if fields is None:
+        return doc_json
+    return apply_field_mask(doc_json, parse_field_mask(fields)[0])
 
 
 def create_doc(body):
-    service = build("docs", "v1", credentials=get_creds(SCOPES_RW))
-    doc = service.documents().create(body=body).execute()
+    service = get_service("docs", "v1", SCOPES_RW)
+    # document creation counts against the same write quota as batchUpdate
+    doc = DOCS_SCHEDULER.call(service.documents().create(body=body).execute)
     return doc["documentId"]
 
 
@@ -22,30 +60,63 @@ def get_doc(doc_id, read_only=False):
         scopes = SCOPES_RO
     else:
         scopes = SCOPES_RW
-    service = build("docs", "v1", credentials=get_creds(scopes))
-    doc = service.documents().get(documentId=doc_id).execute()
+    service = get_service("docs", "v1", scopes)
+    doc = (
+        service.documents()
+        .get(documentId=doc_id, fields=DOC_PROJECTIONS["existence"])
+        .execute()
+    )
     return doc["documentId"]
 
 
-def batch_update_doc(doc_id, requests):
-    service = build("docs", "v1", credentials=get_creds(SCOPES_RW))
-    while len(requests) > 0:
-        request_group = []
-        for _ in range(100):
-            try:
-                request_group.append(requests.pop(0))
-            except Exception:
-                pass
-        _ = (
+def response_revision(response):
+    """the revision a batchUpdate response left the document at"""
+    return response.get("writeControl", {}).get("requiredRevisionId")
+
+
+def guarded_body(request_group, revision):
+    body = {"requests": request_group}
+    if revision is not None:
+        body["writeControl"] = {"requiredRevisionId": revision}
+    return body
+
+
+def batch_update_doc(doc_id, requests, scheduler=DOCS_SCHEDULER, revision=None):
+    """send requests in chunks, each requiring the revision the chunk before
+    left, read first unless given; batchUpdate is not idempotent, and a
+    chunk whose response was lost to a retryable error may have been
+    applied, so before a retry the revision is read again and a changed one
+    means the chunk landed and is not sent twice"""
+    service = get_service("docs", "v1", SCOPES_RW)
+    if revision is None:
+        revision = get_doc_json(doc_id, "revision").get("revisionId")
+    sent = None
+
+    def send_chunk(request_group):
+        nonlocal revision, sent
+        if sent is request_group:
+            current = get_doc_json(doc_id, "revision").get("revisionId")
+            if current != revision:
+                revision = current
+                return {
+                    "documentId": doc_id,
+                    "writeControl": {"requiredRevisionId": current},
+                }
+        sent = request_group
+        response = (
             service.documents()
-            .batchUpdate(documentId=doc_id, body={"requests": request_group})
+            .batchUpdate(
+                documentId=doc_id, body=guarded_body(request_group, revision)
+            )
             .execute()
         )
-        time.sleep(1)
-    return
+        revision = response_revision(response)
+        return response
+
+    return scheduler.run(send_chunk, requests)
 
 
-# document json data extraction
+# document json data extraction, from the server json or the local model
 def table_last_row_index(table):
     """returns the index of the last row to append by"""
     return table["rows"] - 1
@@ -90,6 +161,42 @@ def insert_table_request(rows, columns):
     }
 
 
+def insert_table_row_request(table_start_index, row_index, insert_below=True):
+    return {
+        "insertTableRow": {
+            "tableCellLocation": {
+                "tableStartLocation": {"index": table_start_index},
+                "rowIndex": row_index,
+                "columnIndex": 1,
+            },
+            "insertBelow": "true" if insert_below else "false",
+        }
+    }
+
+
+def delete_table_row_request(table_start_index, row_index):
+    return {
+        "deleteTableRow": {
+            "tableCellLocation": {
+                "tableStartLocation": {"index": table_start_index},
+                "rowIndex": row_index,
+                "columnIndex": 0,
+            },
+        }
+    }
+
+
+def delete_content_range_request(index_start, index_end):
+    return {
+        "deleteContentRange": {
+            "range": {
+                "startIndex": index_start,
+                "endIndex": index_end,
+            },
+        }
+    }
+
+
 def insert_text_request(text, index):
     return {"insertText": {"text": text, "location": {"index": index}}}
 
@@ -129,6 +236,67 @@ def update_paragraph_style_request(style, index_start, index_end):
     }
 
 
+def coalesce_ranges(ranges, max_gap=1):
+    """merge (start, end) ranges that overlap, touch, or are at most max_gap
+    indexes apart into the fewest covering ranges. between the cells of a
+    table the only gap is a row's own start index, so whole tables merge
+    into one range"""
+    result = []
+    for start, end in sorted(ranges):
+        if result and start - result[-1][1] <= max_gap:
+            result[-1] = (result[-1][0], max(result[-1][1], end))
+        else:
+            result.append((start, end))
+    return result
+
+
+def cells_text_style_requests(table_json, style, first_para_only=False):
+    return [
+        update_text_style_request(style, index_start, index_end)
+        for (index_start, index_end) in coalesce_ranges(
+            all_cells_content_indexes(table_json, first_para_only=first_para_only)
+        )
+    ]
+
+
+def cells_paragraph_style_requests(table_json, style, first_para_only=False):
+    return [
+        update_paragraph_style_request(style, index_start, index_end)
+        for (index_start, index_end) in coalesce_ranges(
+            all_cells_content_indexes(table_json, first_para_only=first_para_only)
+        )
+    ]
+
+
+# styles
+UNBROKEN_STYLE = {
+    "keepLinesTogether": True,
+    "keepWithNext": True,
+}
+BOLD_STYLE = {"bold": True}
+
+
+def general_format_style(font_size=8, font_family="Calibri"):
+    return {
+        "fontSize": {"magnitude": font_size, "unit": "PT"},
+        "weightedFontFamily": {"fontFamily": font_family, "weight": 400},
+    }
+
+
+def table_format_requests(table_json, font_size=9, bold_first_line=True):
+    """the unbroken, general format and bold first line passes for one table,
+    fused into one list; leave out bold_first_line when the fill already
+    styled each first line"""
+    requests = cells_paragraph_style_requests(
+        table_json, UNBROKEN_STYLE
+    ) + cells_text_style_requests(table_json, general_format_style(font_size))
+    if bold_first_line:
+        requests += cells_text_style_requests(
+            table_json, BOLD_STYLE, first_para_only=True
+        )
+    return requests
+
+
 # collection manipulation
 def reversed_insert_text_requests(text_groups, content_append_indices):
     """make a list of text insertion requests in reverse (right to left) order
@@ -146,32 +314,99 @@ def reversed_insert_text_requests(text_groups, content_append_indices):
 
 def group_cell_data_items(cell_data_items, per_group, default_item_value=("\n")):
     """cell data items are returned by this generator in lists with the requested per group size"""
-    while len(cell_data_items) > 0:
-        result = []
-        for _ in range(per_group):
-            try:
-                result.append(cell_data_items.pop(0))
-            except IndexError:
-                result.append(default_item_value)
+    items = iter(cell_data_items)
+    while True:
+        result = list(itertools.islice(items, per_group))
+        if not result:
+            return
+        result.extend([default_item_value] * (per_group - len(result)))
         yield result
 
 
+# table layout planning
+def empty_row_size(columns):
+    """an empty row takes one index for itself plus, per cell, one for the cell
+    and one for the cell's empty paragraph"""
+    return 1 + 2 * columns
+
+
+def first_line_length(text):
+    """utf-16 length of text up to and including its first newline"""
+    newline = text.find("\n")
+    return utf16_len(text if newline == -1 else text[: newline + 1])
+
+
+def iter_table_fill_requests(
+    table_json, table_start_index, rows, first_line_style=None
+):
+    """yield the requests that fill a table with rows of text groups, starting
+    at the table's last row (which must be empty) and appending a new row for
+    every further row of data
+
+    every cell insertion index is computed offline from the layout of empty
+    rows plus the text already inserted, so the plan never needs the document
+    re-read. each row is appended and then filled left to right, so every
+    insertion lands at the end of the table and shifts nothing but what
+    follows it. with first_line_style each cell's first line is styled as it
+    is inserted, saving a pass over the filled table"""
+    columns = table_json["columns"]
+    row_index = table_last_row_index(table_json)
+    row_start = table_json["tableRows"][-1]["startIndex"]
+    row_size = empty_row_size(columns)
+    for row_offset, row in enumerate(rows):
+        if row_offset > 0:
+            yield insert_table_row_request(table_start_index, row_index)
+            row_index += 1
+        inserted = 0
+        for column, text_group in enumerate(row):
+            text = "".join(text_group)
+            if text == "":
+                continue
+            index = row_start + 2 + 2 * column + inserted
+            yield insert_text_request(text, index)
+            if first_line_style is not None:
+                yield update_text_style_request(
+                    first_line_style, index, index + first_line_length(text)
+                )
+            inserted += utf16_len(text)
+        row_start += row_size + inserted
+
+
+def plan_table_fill(table_json, table_start_index, rows, first_line_style=None):
+    return list(
+        iter_table_fill_requests(
+            table_json, table_start_index, rows, first_line_style
+        )
+    )
+
+
+@traced_methods("doc")
 class DirectoryDoc(object):
-    def __init__(self):
+    def __init__(self, journal=None):
+        self.journal = journal
         self.doc_id = None
         self.doc_json = None
+        self.model = None
         self.table_index = None
         self.active_table_json = None
         self.table_start_index = None
         self.columns_count = None
 
     def new(self, title):
+        if self.journal is not None and self.journal.doc_id is not None:
+            # resuming: replay the build from the document as it was created
+            self.doc_id = self.journal.doc_id
+            self.model = DocumentModel(copy.deepcopy(self.journal.doc_json))
+            self.doc_json = self.model.doc_json
+            return
         body = {
             "title": title,
             "body": {},
         }
         self.doc_id = create_doc(body)
         self.refresh_doc_json()
+        if self.journal is not None:
+            self.journal.begin(self.doc_id, copy.deepcopy(self.doc_json))
 
     def new_table(self, columns):
         requests = [insert_table_request(rows=1, columns=columns)]
@@ -184,16 +419,55 @@ class DirectoryDoc(object):
         self.refresh_doc_json()
 
     def batch_update(self, requests):
-        batch_update_doc(self.doc_id, requests)
-        self.refresh_doc_json()
+        """send requests and apply them to the local model; the document is
+        only re-fetched if a request could not be modelled locally. with a
+        journal, each chunk is journaled around its send"""
+        revision = self.doc_json.get("revisionId")
+        if self.journal is None:
+            responses = batch_update_doc(self.doc_id, requests, revision=revision)
+            if responses:
+                revision = response_revision(responses[-1])
+        else:
+            self.journal.send(self.doc_id, requests)
+            revision = self.journal.revision
+        self.model.apply_all(requests)
+        if self.model.stale:
+            self.refresh_doc_json()
+        else:
+            self.doc_json["revisionId"] = revision
         try:
             self.refresh_table_json()
         except Exception:
             pass
 
+    def stream_update(self, requests):
+        """send requests as they are generated, a chunk at a time, so planning
+        overlaps sending; all of them are planned against the model as it was
+        before the first chunk, like one batch_update"""
+        for chunk in chunk_requests(
+            requests, DOCS_SCHEDULER.max_count, DOCS_SCHEDULER.max_bytes
+        ):
+            self.batch_update(chunk)
+
     def refresh_doc_json(self):
-        """"""
-        self.doc_json = get_doc_json(self.doc_id)
+        """fetch the document and rebuild the local model from it"""
+        self.model = DocumentModel(get_doc_json(self.doc_id))
+        self.doc_json = self.model.doc_json
+
+    def checkpoint(self):
+        """compare the local model with the server and resynchronize on drift,
+        returns whether they matched; only the skeleton is read unless the
+        model drifted"""
+        remote = get_doc_json(self.doc_id, "skeleton")
+        matched = skeleton(project(self.doc_json, "skeleton")) == skeleton(remote)
+        if not matched:
+            logging.warning("local document model drifted, resynchronized")
+            self.refresh_doc_json()
+        try:
+            self.refresh_table_json()
+        except Exception:
+            pass
+        return matched
 
     def activate_table(self, index):
         """more permanent state persistence method for targeted table operations"""
@@ -209,16 +483,9 @@ class DirectoryDoc(object):
 
     def append_table_row(self):
         requests = [
-            {
-                "insertTableRow": {
-                    "tableCellLocation": {
-                        "tableStartLocation": {"index": self.table_start_index},
-                        "rowIndex": table_last_row_index(self.active_table_json),
-                        "columnIndex": 1,
-                    },
-                    "insertBelow": "true",
-                }
-            }
+            insert_table_row_request(
+                self.table_start_index, table_last_row_index(self.active_table_json)
+            )
         ]
         self.batch_update(requests)
         return
@@ -232,43 +499,93 @@ class DirectoryDoc(object):
         requests = reversed_insert_text_requests(text_groups, content_append_indexes)
         self.batch_update(requests)
 
-    def fill_table_with_data(self, data):
-        for data_group in group_cell_data_items(data, self.columns_count):
-            self.fill_last_table_row(data_group)
-            self.append_table_row()
-
-    def apply_text_style(self, style, first_para_only=False):
-        requests = [
-            update_text_style_request(style, index_start, index_end)
-            for (index_start, index_end) in all_cells_content_indexes(
-                self.active_table_json, first_para_only=first_para_only
+    def fill_table_with_data(self, data, first_line_style=None):
+        """fill the active table in one planned pass; the table's last row must
+        be empty, as it is after new_table"""
+        self.batch_update(self._table_fill_requests(data, first_line_style))
+
+    def stream_table_with_data(self, data, first_line_style=None):
+        """fill_table_with_data from any iterable of text groups, each chunk
+        sent as soon as the data for it has been read"""
+        self.stream_update(
+            iter_table_fill_requests(
+                self.active_table_json,
+                self.table_start_index,
+                group_cell_data_items(data, self.columns_count),
+                first_line_style,
             )
+        )
+
+    def _table_fill_requests(self, data, first_line_style=None):
+        rows = list(group_cell_data_items(data, self.columns_count))
+        if len(rows) == 0:
+            return []
+        return plan_table_fill(
+            self.active_table_json, self.table_start_index, rows, first_line_style
+        )
+
+    def build_tables(self, tables_data, columns, font_size=9):
+        """append one filled and formatted table per item of tables_data in
+        three batch updates: the empty tables are inserted together, filled
+        last to first so that no fill moves a table still to be filled, and
+        then formatted together. the last table is left active"""
+        for requests in self._build_tables_steps(tables_data, columns, font_size):
+            self.batch_update(requests)
+
+    def _build_tables_steps(self, tables_data, columns, font_size):
+        """yields the request lists of build_tables, each planned from the
+        model as left by the previous one, so any client can send them"""
+        tables_rows = [
+            list(group_cell_data_items(data, columns)) for data in tables_data
         ]
-        self.batch_update(requests)
+        if len(tables_rows) == 0:
+            return
+        yield [insert_table_request(rows=1, columns=columns) for _ in tables_rows]
+        positions = [
+            i for (i, element) in enumerate(self.model.content) if "table" in element
+        ][-len(tables_rows) :]
+
+        requests = []
+        for position, rows in reversed(list(zip(positions, tables_rows))):
+            if rows:
+                table = self.model.content[position]
+                requests.extend(
+                    iter_table_fill_requests(
+                        table["table"], table["startIndex"], rows, BOLD_STYLE
+                    )
+                )
+        yield requests
+
+        # fills only grow the tables, so their positions in the body still hold
+        requests = []
+        for position, rows in zip(positions, tables_rows):
+            requests.extend(
+                table_format_requests(
+                    self.model.content[position]["table"],
+                    font_size,
+                    bold_first_line=not rows,
+                )
+            )
+        yield requests
+        self.activate_table(positions[-1])
+
+    def apply_text_style(self, style, first_para_only=False):
+        self.batch_update(
+            cells_text_style_requests(self.active_table_json, style, first_para_only)
+        )
 
     def apply_paragraph_style(self, style, first_para_only=False):
-        requests = [
-            update_paragraph_style_request(style, index_start, index_end)
-            for (index_start, index_end) in all_cells_content_indexes(
-                self.active_table_json, first_para_only=first_para_only
+        self.batch_update(
+            cells_paragraph_style_requests(
+                self.active_table_json, style, first_para_only
             )
-        ]
-        self.batch_update(requests)
+        )
 
     def bold_cells_first_line(self):
-        style = {"bold": True}
-        self.apply_text_style(style, first_para_only=True)
+        self.apply_text_style(BOLD_STYLE, first_para_only=True)
 
     def general_format_cells(self, font_size=8, font_family="Calibri"):
-        style = {
-            "fontSize": {"magnitude": font_size, "unit": "PT"},
-            "weightedFontFamily": {"fontFamily": font_family, "weight": 400},
-        }
-        self.apply_text_style(style)
+        self.apply_text_style(general_format_style(font_size, font_family))
 
     def unbroken_cells(self):
-        style = {
-            "keepLinesTogether": True,
-            "keepWithNext": True,
-        }
-        self.apply_paragraph_style(style)
+        self.apply_paragraph_style(UNBROKEN_STYLE)
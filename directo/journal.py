@@ -0,0 +1,247 @@
+"""journal module
+
+write-ahead journal of a document build, so a build that dies halfway, on
+an api error, an exhausted quota or a sleeping laptop, resumes where it
+stopped instead of starting over with a new document
+
+one json line per event, each fsynced before the step it records:
+
+    {"begin": doc_id, "run": "...", "doc": {...}} the document as created
+    {"chunk": n, "digest": "..."}                 before chunk n is sent
+    {"ack": n, "revision": "..."}                 once chunk n succeeded
+
+chunks are journaled by digest only, as their requests hold the families'
+names and contact details
+
+a run is identified by a digest of the sheet rows it builds from, and only
+a journal of the same run is resumed; anything else, or no journal at all,
+is built anew. resuming replays the build on the local model, from the
+document as it was created: the same data plans the same chunks, so
+acknowledged chunks are checked against their digest and skipped, and the
+first unacknowledged one is only sent if the document's revision shows it
+did not land before the failure. a finished build leaves only
+{"finish": doc_id, "run": "..."}, so resuming a run of several documents
+skips the ones it already finished
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from directo.docs import batch_update_doc, get_doc_json, response_revision
+from directo.scheduler import DOCS_SCHEDULER, chunk_requests, error_status
+
+JOURNAL_DIR = os.environ.get(
+    "DIRECTO_JOURNALS",
+    os.path.join(os.path.expanduser("~"), ".cache", "directo", "journals"),
+)
+
+
+def journal_path(title, directory=JOURNAL_DIR):
+    """one journal per document title"""
+    return os.path.join(directory, re.sub(r"[^\w-]+", "_", title) + ".jsonl")
+
+
+class Journals(object):
+    """where the journals of a run are kept, whether it resumes them, and
+    the run's identity"""
+
+    def __init__(self, directory=JOURNAL_DIR, resume=False):
+        self.directory = directory
+        self.resume = resume
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def update(self, row):
+        self.digest.update(json.dumps(row, separators=(",", ":")).encode() + b"\n")
+
+    def add_sheet(self, headers, rows):
+        """(headers, rows) of a sheet the run builds from; rows are added to
+        the run's identity as they are read, so a lazily read sheet is too"""
+        self.update(headers)
+        return headers, (self.update(row) or row for row in rows)
+
+    def add_read_sheet(self, headers, rows):
+        """add a sheet read before the run to its identity, all at once"""
+        self.update(headers)
+        for row in rows:
+            self.update(row)
+
+    def open(self, title):
+        """the title's journal; open it once every sheet has been read"""
+        return Journal(
+            journal_path(title, self.directory),
+            self.resume,
+            self.digest.hexdigest(),
+        )
+
+
+def chunk_digest(chunk):
+    content = json.dumps(chunk, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class JournalError(ValueError):
+    """a journal that cannot be resumed"""
+
+
+class Journal(object):
+    def __init__(self, path, resume=False, run=None):
+        self.path = path
+        self.resume = resume
+        self.run = run
+        self.file = None
+        self.doc_id = None
+        self.doc_json = None
+        self.finished = None
+        self.digests = {}
+        self.revisions = {}
+        self.revision = None
+        # a revision read from the journal may have expired since
+        self.journaled_revision = False
+        self.sequence = 0
+        if resume:
+            self.load()
+        elif os.path.exists(path) and "finish" not in (self.read() or [{}])[-1]:
+            logging.warning(f"discarding the unfinished build journaled in {path}")
+
+    def read(self):
+        """the journal's entries, [] if there is none"""
+        entries = []
+        try:
+            with open(self.path) as journal:
+                for line in journal:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # a line cut short by the failure was never acted on
+                        break
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def load(self):
+        entries = self.read()
+        if not entries or entries[0].get("run") != self.run:
+            if entries and "finish" not in entries[-1]:
+                logging.warning(
+                    f"{self.path} journals an unfinished build of other sheet "
+                    "data, building anew"
+                )
+            else:
+                logging.info("nothing to resume in %s, building anew", self.path)
+            self.resume = False
+            return
+        for entry in entries:
+            if "begin" in entry:
+                self.doc_id = entry["begin"]
+                self.doc_json = entry["doc"]
+                self.revision = self.doc_json.get("revisionId")
+            elif "chunk" in entry:
+                self.digests[entry["chunk"]] = entry["digest"]
+            elif "ack" in entry:
+                self.revisions[entry["ack"]] = entry["revision"]
+            elif "finish" in entry:
+                self.finished = self.doc_id = entry["finish"]
+        if self.doc_id is None:
+            # the run failed creating the document
+            self.resume = False
+        elif self.finished is None:
+            self.journaled_revision = True
+            logging.info(
+                "resuming %s after %d of %d journaled chunks",
+                self.doc_id,
+                len(self.revisions),
+                len(self.digests),
+            )
+
+    def record(self, entry):
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(self.path, "a" if self.resume else "w")
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def begin(self, doc_id, doc_json):
+        self.doc_id = doc_id
+        self.doc_json = doc_json
+        self.revision = doc_json.get("revisionId")
+        self.record({"begin": doc_id, "run": self.run, "doc": doc_json})
+
+    def ack(self, sequence, revision):
+        self.revisions[sequence] = revision
+        self.revision = revision
+        self.journaled_revision = False
+        self.record({"ack": sequence, "revision": revision})
+
+    def landed(self, doc_id):
+        """whether the journaled but unacknowledged chunk changed the document"""
+        try:
+            current = get_doc_json(doc_id, "revision").get("revisionId")
+        except Exception as e:
+            if error_status(e) == 404:
+                raise JournalError(
+                    f"the journaled document {doc_id} no longer exists; build a "
+                    "new document without --resume"
+                ) from e
+            raise
+        return current != self.revision, current
+
+    def send_chunk(self, doc_id, chunk):
+        """batch_update_doc of one chunk; the docs api rejects a revision
+        that is no longer current, or, after about a day, too old"""
+        try:
+            (response,) = batch_update_doc(doc_id, chunk, revision=self.revision)
+        except Exception as e:
+            if self.journaled_revision and error_status(e) == 400:
+                raise JournalError(
+                    f"{doc_id} rejected the journaled revision {self.revision}: "
+                    "the document was edited since, or the journal is too old "
+                    "to resume; build a new document without --resume"
+                ) from e
+            raise
+        return response
+
+    def send(self, doc_id, requests):
+        """batch_update_doc, journaling each chunk and skipping the chunks a
+        resumed build already sent"""
+        for chunk in chunk_requests(
+            requests, DOCS_SCHEDULER.max_count, DOCS_SCHEDULER.max_bytes
+        ):
+            sequence = self.sequence
+            self.sequence += 1
+            digest = chunk_digest(chunk)
+            if sequence in self.digests:
+                if self.digests[sequence] != digest:
+                    raise JournalError(
+                        f"chunk {sequence} differs from the journaled build, the "
+                        "data changed; build a new document without --resume"
+                    )
+                if sequence in self.revisions:
+                    self.revision = self.revisions[sequence]
+                    continue
+                landed, revision = self.landed(doc_id)
+                if landed:
+                    self.ack(sequence, revision)
+                    continue
+            else:
+                self.digests[sequence] = digest
+                self.record({"chunk": sequence, "digest": digest})
+            response = self.send_chunk(doc_id, chunk)
+            self.ack(sequence, response_revision(response))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def finish(self):
+        """the build is complete: only its document id is kept, so resuming
+        a run reports it rather than building it again"""
+        self.close()
+        self.finished = self.doc_id
+        self.resume = False
+        self.record({"finish": self.doc_id, "run": self.run})
+        self.close()
@@ -1,13 +1,30 @@
 """main module"""
+import argparse
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from directo.sheets import (
+    GRADE_REPR,
     DirectorySheetData,
+    RosterError,
     RosterSheetData,
-    construct_sheet_range,
+    header_and_data_ranges,
+    read_sheets,
 )
+from directo.diff import update_doc
+from directo.pipeline import directory_text_groups, sheet_rows, stream_doc
 from directo.docs import DirectoryDoc
+from directo.journal import JOURNAL_DIR, JournalError, Journals
+from directo.clients import REGISTRY
+from directo.reconcile import reconcile
+from directo.renderers import RENDERERS
+from directo.snapshots import (
+    MissingSnapshotError,
+    SnapshotStore,
+    read_sheets_cached,
+)
+from directo.trace import TRACER, traced
 
 # The ID of a sample spreadsheet.
 DIRECTORY_SHEET_ID = os.environ.get("DIRECTORY_SHEET_ID")
@@ -26,71 +43,310 @@ DIRECTORY_SHEET_KWARGS = {
     "row_start": "1"
 }
 
+ROSTER_GRADES = ["0", "1", "2", "3", "4", "5"]
+# per-grade documents are built by this many threads sharing the write quota
+ROSTER_WORKERS = int(os.environ.get("DIRECTO_WORKERS", "4"))
 
-def make_class_roster(roster_data):
-    doc = DirectoryDoc()
-    doc.new("class roster")
-    for grade in ["0", "1", "2", "3", "4", "5"]:
-        doc.new_table(2)
-        doc.fill_table_with_data(roster_data.format_roster_data(grade=grade))
-        doc.unbroken_cells()
-        doc.general_format_cells(font_size=9)
-        doc.bold_cells_first_line()
-    # another option is to make a new table for each grade-language
-
-
-def make_student_directory(roster_data):
-    doc = DirectoryDoc()
-    doc.new("student directory")
-    doc.new_table(2)
-    doc.fill_table_with_data(roster_data.format_directory_data())
-    doc.unbroken_cells()
-    doc.general_format_cells(font_size=9)
-    doc.bold_cells_first_line()
-
-
-def get_directory_data(directory_sheet_id, tab_name=None, col_start=None, col_end=None, row_start=None):
-    directory_header_range = construct_sheet_range(
-        tab_name=tab_name,
-        col_start=col_start,
-        col_end=col_end,
-        row_start=row_start,
-        row_end=row_start,
-    )
-    data_row_start = str(int(row_start) + 1)
-    directory_data_range = construct_sheet_range(
-        tab_name=tab_name,
-        col_start=col_start,
-        col_end=col_end,
-        row_start=data_row_start,
-        row_end="",
+
+def build_local_doc(title, tables_data, doc_format, output=None):
+    """render to a local file, named after the title unless output is given"""
+    renderer = RENDERERS[doc_format]
+    path = output or title.replace(" ", "_") + renderer.extension
+    with renderer(path) as doc:
+        doc.new(title)
+        doc.build_tables(tables_data, 2, font_size=9)
+    print(f"Wrote {path}")
+    return path
+
+
+def build_roster_doc(
+    title, tables_data, doc_id=None, doc_format="gdoc", output=None, journals=None
+):
+    """build a new document, journaled if given journals, or with doc_id
+    update that one in place; any format other than gdoc is rendered to a
+    local file instead"""
+    if doc_format != "gdoc":
+        return build_local_doc(title, tables_data, doc_format, output)
+    # an update in place plans only what differs, so it resumes by rerunning
+    journal = None if journals is None or doc_id is not None else journals.open(title)
+    if journal is not None and journal.finished is not None:
+        return journal.finished
+    doc = DirectoryDoc(journal)
+    if doc_id is None:
+        doc.new(title)
+        doc.build_tables(tables_data, 2, font_size=9)
+    else:
+        doc.get(doc_id)
+        counts = update_doc(doc, tables_data, 2, font_size=9)
+        print(
+            f"Updated {doc_id}: {counts['kept']} rows kept, "
+            f"{counts['replaced']} replaced, {counts['inserted']} inserted, "
+            f"{counts['deleted']} deleted"
+        )
+    doc.checkpoint()
+    if journal is not None:
+        journal.finish()
+    return doc.doc_id
+
+
+def build_grade_roster_doc(
+    roster_data, grade, doc_format="gdoc", output=None, journals=None
+):
+    if output is not None:
+        root, extension = os.path.splitext(output)
+        output = f"{root}-{GRADE_REPR[grade]}{extension}"
+    return build_roster_doc(
+        f"class roster - {GRADE_REPR[grade]}",
+        [roster_data.format_roster_data(grade=grade)],
+        doc_format=doc_format,
+        output=output,
+        journals=journals,
     )
-    return DirectorySheetData(
-        directory_sheet_id, directory_header_range, directory_data_range
+
+
+@traced()
+def make_class_roster(
+    roster_data,
+    per_grade_docs=False,
+    workers=ROSTER_WORKERS,
+    doc_id=None,
+    doc_format="gdoc",
+    output=None,
+    journals=None,
+):
+    """one document with a table per grade, or with per_grade_docs a document
+    per grade built concurrently; returns the document ids or file paths"""
+    if not per_grade_docs:
+        tables_data = [
+            roster_data.format_roster_data(grade=grade) for grade in ROSTER_GRADES
+        ]
+        return [
+            build_roster_doc(
+                "class roster", tables_data, doc_id, doc_format, output, journals
+            )
+        ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                build_grade_roster_doc,
+                roster_data,
+                grade,
+                doc_format,
+                output,
+                journals,
+            )
+            for grade in ROSTER_GRADES
+        ]
+        return [future.result() for future in futures]
+
+
+@traced()
+def make_student_directory(
+    text_groups, doc_id=None, doc_format="gdoc", output=None, journals=None
+):
+    """text_groups may be a lazy stream, as from directory_text_groups; a new
+    google doc or a local file is built as it is read"""
+    if doc_format == "gdoc" and doc_id is None:
+        return stream_doc("student directory", text_groups, 2, 9, journals)
+    return build_roster_doc(
+        "student directory", [text_groups], doc_id, doc_format, output, journals
     )
 
 
-def get_roster_data(roster_sheet_id, tab_name=None, col_start=None, col_end=None, row_start=None):
-    roster_header_range = construct_sheet_range(
-        tab_name=tab_name,
-        col_start=col_start,
-        col_end=col_end,
-        row_start=row_start,
-        row_end=row_start,
+@traced()
+def get_directory_data(directory_sheet_id, values=None, **range_kwargs):
+    header_range, data_range = header_and_data_ranges(**range_kwargs)
+    return DirectorySheetData(directory_sheet_id, header_range, data_range, values)
+
+
+@traced()
+def get_roster_data(roster_sheet_id, values=None, **range_kwargs):
+    header_range, data_range = header_and_data_ranges(**range_kwargs)
+    return RosterSheetData(roster_sheet_id, header_range, data_range, values)
+
+
+@traced()
+def read_all_sheets(
+    with_directory=False,
+    max_age=0,
+    offline=False,
+    snapshot=False,
+    roster_sheet_id=ROSTER_SHEET_ID,
+    directory_sheet_id=DIRECTORY_SHEET_ID,
+    roster_kwargs=ROSTER_SHEET_KWARGS,
+    directory_kwargs=DIRECTORY_SHEET_KWARGS,
+):
+    """fetch every range a command needs up front, one batchGet per spreadsheet,
+    unless the local snapshots are younger than max_age seconds; the sheets
+    hold families' contact details, so they are only snapshotted on disk
+    when asked to, with snapshot, max_age or offline"""
+    ranges_by_sheet = {roster_sheet_id: list(header_and_data_ranges(**roster_kwargs))}
+    if with_directory:
+        ranges_by_sheet.setdefault(directory_sheet_id, []).extend(
+            header_and_data_ranges(**directory_kwargs)
+        )
+    if not (snapshot or max_age > 0 or offline):
+        return read_sheets(ranges_by_sheet)
+    store = SnapshotStore()
+    try:
+        return read_sheets_cached(ranges_by_sheet, store, max_age, offline)
+    finally:
+        store.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="directo")
+    parser.add_argument("command", choices=["roster", "directory", "unrostered"])
+    parser.add_argument(
+        "--doc-id",
+        help="update this existing document in place instead of creating one",
+    )
+    parser.add_argument(
+        "--per-grade",
+        action="store_true",
+        help="roster: build one document per grade concurrently",
     )
-    data_row_start = str(int(row_start) + 1)
-    roster_data_range = construct_sheet_range(
-        tab_name=tab_name,
-        col_start=col_start,
-        col_end=col_end,
-        row_start=data_row_start,
-        row_end="",
+    parser.add_argument(
+        "--format",
+        dest="doc_format",
+        choices=["gdoc"] + sorted(RENDERERS),
+        default="gdoc",
+        help="build a google doc, or render a local html, markdown or docx file",
     )
-    return RosterSheetData(roster_sheet_id, roster_header_range, roster_data_range)
+    parser.add_argument(
+        "--output", help="local file to render to, named after the title if unset"
+    )
+    parser.add_argument(
+        "--max-age",
+        type=float,
+        default=0,
+        help="reuse sheet snapshots up to this many seconds old, snapshotting"
+        " the sheets read",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="read the sheets from snapshots only, whatever their age",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="keep a local snapshot of the sheets read, for --max-age and"
+        " --offline runs",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        help="directory: read the sheets lazily in pages of this many rows",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="finish the new documents an interrupted journaled run of the same"
+        " sheet data left half built, and build those it never started;"
+        " journals this run too",
+    )
+    parser.add_argument(
+        "--journal-dir",
+        help="journal the builds of new documents here, so --resume can finish"
+        " them; nothing is journaled without this or --resume, which journals"
+        f" in {JOURNAL_DIR} by default",
+    )
+    args = parser.parse_args(argv)
+    if args.doc_id and args.per_grade:
+        parser.error("--doc-id updates a single document, not --per-grade ones")
+    if args.doc_id and args.doc_format != "gdoc":
+        parser.error("--doc-id updates a google doc, it takes no --format")
+    if args.page_size is not None and (
+        args.command != "directory" or args.max_age or args.offline or args.snapshot
+    ):
+        parser.error("--page-size reads the directory's sheets live, unsnapshotted")
+    if args.page_size is not None and args.page_size < 1:
+        parser.error("--page-size must be positive")
+    if args.resume and (args.doc_id or args.doc_format != "gdoc"):
+        parser.error("--resume finishes new google docs; rerun an update instead")
+    return args
+
+
+def run(
+    args,
+    roster_sheet_id=ROSTER_SHEET_ID,
+    directory_sheet_id=DIRECTORY_SHEET_ID,
+    roster_kwargs=ROSTER_SHEET_KWARGS,
+    directory_kwargs=DIRECTORY_SHEET_KWARGS,
+):
+    """run a parsed command against one roster and directory sheet; returns
+    {"documents": [...]} of the ids or paths made, or for unrostered
+    {"unrostered": [...], "proposed": {...}, "ambiguous": {...}}"""
+    values = None
+    if args.page_size is None:
+        values = read_all_sheets(
+            args.command != "roster",
+            max_age=args.max_age,
+            offline=args.offline,
+            snapshot=args.snapshot,
+            roster_sheet_id=roster_sheet_id,
+            directory_sheet_id=directory_sheet_id,
+            roster_kwargs=roster_kwargs,
+            directory_kwargs=directory_kwargs,
+        )
+    # like snapshots, journals are only left on disk when a run opts in
+    journals = None
+    if args.resume or args.journal_dir is not None:
+        journals = Journals(args.journal_dir or JOURNAL_DIR, args.resume)
+    if args.command == "directory":
+        print("Compiling directory...")
+        roster = sheet_rows(roster_sheet_id, values, args.page_size, **roster_kwargs)
+        directory = sheet_rows(
+            directory_sheet_id, values, args.page_size, **directory_kwargs
+        )
+        if journals is not None:
+            roster = journals.add_sheet(*roster)
+            directory = journals.add_sheet(*directory)
+        text_groups = directory_text_groups(roster, directory)
+        document = make_student_directory(
+            text_groups,
+            doc_id=args.doc_id,
+            doc_format=args.doc_format,
+            output=args.output,
+            journals=journals,
+        )
+        return {"documents": [document]}
+    roster_data = get_roster_data(roster_sheet_id, values, **roster_kwargs)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("roster records: %s", roster_data.store.memory_usage())
+
+    if args.command == "roster":
+        print("Compiling roster...")
+        if journals is not None:
+            # the rows were read up front; the roster alone identifies the run
+            journals.add_read_sheet(
+                *sheet_rows(roster_sheet_id, values, **roster_kwargs)
+            )
+        documents = make_class_roster(
+            roster_data,
+            args.per_grade,
+            doc_id=args.doc_id,
+            doc_format=args.doc_format,
+            output=args.output,
+            journals=journals,
+        )
+        return {"documents": documents}
+    di = get_directory_data(directory_sheet_id, values, **directory_kwargs)
+    print("Finding unrostered children in directory data...")
+    with TRACER.span("unrostered"):
+        result = reconcile(roster_data.children.keys(), di.children.keys())
+    logging.info("reconciliation: %s", result.summary())
+    return {
+        "unrostered": result.unmatched_directory,
+        "proposed": result.proposed,
+        "ambiguous": result.ambiguous,
+    }
 
 
 def main():
     """main func"""
+    args = parse_args()
 
     if os.environ.get("DEBUG") is not None:
         log_level = logging.DEBUG
@@ -98,24 +354,27 @@ def main():
         log_level = logging.WARN
     logging.basicConfig(level=log_level, stream=sys.stdout)
 
-    roster_data = get_roster_data(ROSTER_SHEET_ID, **ROSTER_SHEET_KWARGS)
-
-    if sys.argv[1] == "roster":
-        print("Compiling roster...")
-        make_class_roster(roster_data)
-    elif sys.argv[1] == "directory":
-        print("Compiling directory...")
-        roster_data.enrich_roster_with_normalized_directory(
-            get_directory_data(DIRECTORY_SHEET_ID, **DIRECTORY_SHEET_KWARGS)
-        )
-        make_student_directory(roster_data)
-    elif sys.argv[1] == "unrostered":
-        print("Finding unrostered children in directory data...")
-        di = get_directory_data(DIRECTORY_SHEET_ID, **DIRECTORY_SHEET_KWARGS)
-        ro = get_roster_data(ROSTER_SHEET_ID, **ROSTER_SHEET_KWARGS)
-        unrostered = [ch for ch in di.children.keys() if ch not in ro.children.keys()]
-        for ch in unrostered:
+    try:
+        result = run(args)
+    except MissingSnapshotError as e:
+        sys.exit(f"{e}, run once without --offline")
+    except (JournalError, RosterError) as e:
+        sys.exit(str(e))
+    if args.command == "unrostered":
+        for ch in result["unrostered"]:
             print(ch)
+        if result["proposed"]:
+            print("Possible matches for rostered children, not applied:")
+            for ch, (_, name) in result["proposed"].items():
+                print(f"{ch}: {name}")
+        if result["ambiguous"]:
+            print("Ambiguous matches for rostered children:")
+            for ch, candidates in result["ambiguous"].items():
+                print(f"{ch}: {'; '.join(name for (_, name) in candidates)}")
+    logging.debug("client registry: %s", REGISTRY.stats)
+    if REGISTRY.transport is not None:
+        logging.debug("api calls: %s", REGISTRY.transport.stats.summary())
+    TRACER.finish()
 
 if __name__ == "__main__":
     main()
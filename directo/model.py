@@ -0,0 +1,367 @@
+"""model module
+
+local structural model of a google doc, kept in the same shape as the docs
+api json so the extraction helpers in directo.docs can read it directly
+"""
+import logging
+
+
+def utf16_len(text):
+    """docs indexes count utf-16 code units, not python characters"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def utf16_offset_to_index(text, offset):
+    """python string index matching a utf-16 offset into text"""
+    if text.isascii() or utf16_len(text) == len(text):
+        return min(offset, len(text))
+    units = 0
+    for i, char in enumerate(text):
+        if units >= offset:
+            return i
+        units += utf16_len(char)
+    return len(text)
+
+
+def children(element):
+    """the indexed elements directly under an element"""
+    if "paragraph" in element:
+        return element["paragraph"].get("elements", [])
+    if "table" in element:
+        return element["table"]["tableRows"]
+    if "tableCells" in element:
+        return element["tableCells"]
+    if "content" in element:
+        return element["content"]
+    if "tableOfContents" in element:
+        return element["tableOfContents"].get("content", [])
+    return []
+
+
+def first_ending_after(elements, index):
+    """position of the first element whose endIndex is past index; siblings
+    are ordered, so this is a binary search"""
+    low, high = 0, len(elements)
+    while low < high:
+        middle = (low + high) // 2
+        if elements[middle]["endIndex"] > index:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def walk_element(element):
+    yield element
+    for child in children(element):
+        yield from walk_element(child)
+
+
+def walk(content):
+    """yields every indexed element under a list of structural elements"""
+    for element in content:
+        yield from walk_element(element)
+
+
+def shift_elements(elements, index, delta, include_start=False):
+    """shift the indexes of every element at or after index; only the
+    elements containing index are descended into, so the cost is bounded by
+    what follows index rather than by the document size"""
+    for position in range(first_ending_after(elements, index), len(elements)):
+        element = elements[position]
+        start = element.get("startIndex", 0)
+        if start > index or (include_start and start == index):
+            for nested in walk_element(element):
+                if "startIndex" in nested:
+                    nested["startIndex"] += delta
+                nested["endIndex"] += delta
+        else:
+            element["endIndex"] += delta
+            shift_elements(children(element), index, delta, include_start)
+
+
+def find_paragraph(content, index):
+    """returns (containing list, position) of the paragraph holding index"""
+    position = first_ending_after(content, index)
+    if position < len(content):
+        element = content[position]
+        if element.get("startIndex", 0) <= index:
+            if "paragraph" in element:
+                return content, position
+            if "table" in element:
+                rows = element["table"]["tableRows"]
+                cells = rows[first_ending_after(rows, index)]["tableCells"]
+                cell = cells[first_ending_after(cells, index)]
+                return find_paragraph(cell["content"], index)
+    raise ValueError(f"no paragraph at index {index}")
+
+
+def paragraph_text(paragraph_element):
+    """text of a paragraph, None if the json carries no text runs"""
+    elements = paragraph_element["paragraph"].get("elements")
+    if not elements:
+        return None
+    return "".join(e.get("textRun", {}).get("content", "") for e in elements)
+
+
+def make_paragraph(start_index, end_index, text=None, template=None):
+    paragraph = {k: v for (k, v) in (template or {}).items() if k != "elements"}
+    if text is not None:
+        paragraph["elements"] = [
+            {
+                "startIndex": start_index,
+                "endIndex": end_index,
+                "textRun": {"content": text},
+            }
+        ]
+    return {"startIndex": start_index, "endIndex": end_index, "paragraph": paragraph}
+
+
+def make_row(start_index, columns):
+    cells = []
+    for column in range(columns):
+        cell_start = start_index + 1 + 2 * column
+        cells.append(
+            {
+                "startIndex": cell_start,
+                "endIndex": cell_start + 2,
+                "content": [make_paragraph(cell_start + 1, cell_start + 2, "\n")],
+            }
+        )
+    return {
+        "startIndex": start_index,
+        "endIndex": start_index + 1 + 2 * columns,
+        "tableCells": cells,
+    }
+
+
+def make_table(start_index, rows, columns):
+    table_rows = []
+    row_start = start_index + 1
+    for _ in range(rows):
+        row = make_row(row_start, columns)
+        table_rows.append(row)
+        row_start = row["endIndex"]
+    return {
+        "startIndex": start_index,
+        "endIndex": row_start + 1,
+        "table": {"rows": rows, "columns": columns, "tableRows": table_rows},
+    }
+
+
+class DocumentModel(object):
+    """applies our own structural requests to a local copy of the document
+    json, shifting indexes the way the docs api does, so the document only
+    has to be fetched again to verify or resynchronize"""
+
+    def __init__(self, doc_json):
+        self.doc_json = doc_json
+        self.stale = False
+
+    @property
+    def content(self):
+        return self.doc_json["body"]["content"]
+
+    def shift(self, index, delta, include_start=False):
+        shift_elements(self.content, index, delta, include_start)
+
+    def insert_text(self, text, index):
+        container, position = find_paragraph(self.content, index)
+        paragraph = container[position]
+        start = paragraph["startIndex"]
+        old_text = paragraph_text(paragraph)
+        self.shift(index, utf16_len(text))
+
+        # every newline in the inserted text ends a paragraph
+        paragraphs = []
+        para_start = start
+        if old_text is not None:
+            split = utf16_offset_to_index(old_text, index - start)
+            lines = (old_text[:split] + text + old_text[split:]).split("\n")
+            for line in lines[:-1]:
+                para_end = para_start + utf16_len(line) + 1
+                paragraphs.append(
+                    make_paragraph(
+                        para_start, para_end, line + "\n", paragraph["paragraph"]
+                    )
+                )
+                para_start = para_end
+            if lines[-1]:
+                paragraphs.append(
+                    make_paragraph(
+                        para_start,
+                        paragraph["endIndex"],
+                        lines[-1],
+                        paragraph["paragraph"],
+                    )
+                )
+        else:
+            # without text runs only the inserted newlines are known
+            boundaries = []
+            units = index
+            for line in text.split("\n")[:-1]:
+                units += utf16_len(line) + 1
+                boundaries.append(units)
+            boundaries.append(paragraph["endIndex"])
+            for para_end in boundaries:
+                paragraphs.append(
+                    make_paragraph(para_start, para_end, None, paragraph["paragraph"])
+                )
+                para_start = para_end
+        container[position : position + 1] = paragraphs
+
+    def delete_content(self, start, end):
+        """delete [start, end) within one run of paragraphs, such as a cell's
+        content; the paragraphs it touches merge into one"""
+        container, first = find_paragraph(self.content, start)
+        end_container, last = find_paragraph(self.content, end)
+        if end_container is not container:
+            logging.debug("deletion across structural elements not modelled")
+            self.stale = True
+            return
+        head = container[first]
+        tail = container[last]
+        head_text = paragraph_text(head)
+        tail_text = paragraph_text(tail)
+        text = None
+        if head_text is not None and tail_text is not None:
+            keep = utf16_offset_to_index(head_text, start - head["startIndex"])
+            resume = utf16_offset_to_index(tail_text, end - tail["startIndex"])
+            text = head_text[:keep] + tail_text[resume:]
+        container[first : last + 1] = [
+            make_paragraph(
+                head["startIndex"], tail["endIndex"], text, head["paragraph"]
+            )
+        ]
+        self.shift(end - 1, start - end)
+
+    def find_table(self, start_index):
+        for element in self.content:
+            if "table" in element and element["startIndex"] == start_index:
+                return element
+        raise ValueError(f"no table starts at index {start_index}")
+
+    def insert_table_row(self, table_start_index, row_index, insert_below=True):
+        table = self.find_table(table_start_index)["table"]
+        row = table["tableRows"][row_index]
+        if insert_below:
+            index = row["endIndex"]
+            row_index += 1
+        else:
+            index = row["startIndex"]
+        new_row = make_row(index, table["columns"])
+        self.shift(index, new_row["endIndex"] - index, include_start=True)
+        table["tableRows"].insert(row_index, new_row)
+        table["rows"] += 1
+
+    def delete_table_row(self, table_start_index, row_index):
+        table = self.find_table(table_start_index)["table"]
+        row = table["tableRows"].pop(row_index)
+        table["rows"] -= 1
+        self.shift(row["endIndex"] - 1, row["startIndex"] - row["endIndex"])
+
+    def insert_table(self, rows, columns, index=None):
+        """a newline is inserted ahead of the table, which starts just after it"""
+        if index is None:
+            index = self.content[-1]["endIndex"] - 1
+        self.insert_text("\n", index)
+        table = make_table(index + 1, rows, columns)
+        self.shift(index + 1, table["endIndex"] - table["startIndex"], True)
+        for position, element in enumerate(self.content):
+            if element.get("startIndex", 0) > index:
+                self.content.insert(position, table)
+                return
+
+    def apply(self, request):
+        if "insertText" in request:
+            body = request["insertText"]
+            self.insert_text(body["text"], body["location"]["index"])
+        elif "insertTableRow" in request:
+            body = request["insertTableRow"]
+            location = body["tableCellLocation"]
+            self.insert_table_row(
+                location["tableStartLocation"]["index"],
+                location["rowIndex"],
+                str(body.get("insertBelow", False)).lower() == "true",
+            )
+        elif "deleteContentRange" in request:
+            body = request["deleteContentRange"]["range"]
+            self.delete_content(body["startIndex"], body["endIndex"])
+        elif "deleteTableRow" in request:
+            location = request["deleteTableRow"]["tableCellLocation"]
+            self.delete_table_row(
+                location["tableStartLocation"]["index"], location["rowIndex"]
+            )
+        elif "insertTable" in request:
+            body = request["insertTable"]
+            index = body.get("location", {}).get("index")
+            self.insert_table(body["rows"], body["columns"], index)
+        elif not any(
+            kind in request
+            for kind in (
+                "updateTextStyle",
+                "updateParagraphStyle",
+                "updateTableCellStyle",
+            )
+        ):
+            logging.debug("request not modelled locally: %s", list(request))
+            self.stale = True
+
+    def apply_all(self, requests):
+        for request in requests:
+            self.apply(request)
+
+
+def skeleton(doc_json):
+    """the index structure of a document, for comparing local and remote"""
+    return [
+        (element.get("startIndex"), element["endIndex"])
+        for element in walk(doc_json["body"]["content"])
+        if "textRun" not in element
+    ]
+
+
+def parse_field_mask(fields, position=0):
+    """(tree, end position) of a partial response mask like "a,b/c,d(e,f)";
+    the tree maps each selected name to the tree below it, or to None when
+    the whole field is selected"""
+    tree = {}
+    while position < len(fields) and fields[position] != ")":
+        end = position
+        while end < len(fields) and fields[end] not in ",()":
+            end += 1
+        *path, name = fields[position:end].strip().split("/")
+        node = tree
+        for part in path:
+            if node.get(part, {}) is None:
+                # a parent field is already selected whole
+                node = None
+                break
+            node = node.setdefault(part, {})
+        position = end
+        if position < len(fields) and fields[position] == "(":
+            subtree, position = parse_field_mask(fields, position + 1)
+            position += 1
+        else:
+            subtree = None
+        if node is not None and node.get(name, {}) is not None:
+            node[name] = subtree
+        if position < len(fields) and fields[position] == ",":
+            position += 1
+    return tree, position
+
+
+def apply_field_mask(data, tree):
+    """data with only the fields the parsed mask selects, as the api's
+    partial responses have it"""
+    if tree is None:
+        return data
+    if isinstance(data, list):
+        return [apply_field_mask(item, tree) for item in data]
+    if isinstance(data, dict):
+        return {
+            name: apply_field_mask(data[name], subtree)
+            for name, subtree in tree.items()
+            if name in data
+        }
+    return data
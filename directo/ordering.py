@@ -0,0 +1,187 @@
+"""ordering module
+
+an index of one roster's children under precomputed collation keys, from
+which any of a few orderings, or a span of one, is read without sorting
+
+collation compares names the way people expect: letters and digits first,
+ignoring accents, case and punctuation, then accents, then case, so
+"de la Cruz" files under d and "López" next to "Lopez". with DIRECTO_LOCALE
+set (e.g. "sv_SE") the first level follows that locale's collation instead,
+for alphabets whose accented letters sort on their own; that needs the
+"locale" extra (PyICU), whose collators leave the process locale alone
+"""
+import bisect
+import itertools
+import logging
+import os
+import threading
+import unicodedata
+
+try:
+    import icu
+except ImportError:
+    icu = None
+
+COLLATE_LOCALE = os.environ.get("DIRECTO_LOCALE")
+_collator = None
+_collator_lock = threading.Lock()
+
+# the fields each ordering sorts by, most significant first
+ORDERINGS = {
+    "name": ("last", "first"),
+    "grade": ("grade", "last", "first"),
+    "class": ("grade", "language", "teacher", "last", "first"),
+    "teacher": ("teacher", "grade", "last", "first"),
+    "family": ("family_last", "family_first", "last", "first"),
+}
+# the leading fields of an ordering that groups() may run over; they are
+# compared at every level before the fields after them, so two spellings of
+# one teacher differing only in case or accents are not interleaved
+GROUP_FIELDS = {"grade": 1, "class": 3, "teacher": 2}
+
+
+def collator():
+    """the primary strength collator of COLLATE_LOCALE, made on first use;
+    None without one, or without PyICU"""
+    global _collator
+    if _collator is not None or not COLLATE_LOCALE:
+        return _collator or None
+    with _collator_lock:
+        if _collator is None:
+            if icu is None:
+                logging.warning(
+                    f"DIRECTO_LOCALE needs PyICU: pip install directo[locale], "
+                    f"{COLLATE_LOCALE} ignored"
+                )
+                _collator = False
+            else:
+                _collator = icu.Collator.createInstance(icu.Locale(COLLATE_LOCALE))
+                _collator.setStrength(icu.Collator.PRIMARY)
+    return _collator or None
+
+
+def primary_key(text):
+    """the first collation level: casefolded letters and digits"""
+    text = "".join(char for char in text.casefold() if char.isalnum())
+    locale_collator = collator()
+    if locale_collator is not None:
+        return locale_collator.getSortKey(text)
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def collation_levels(text):
+    """(primary, accents, case) levels of one field"""
+    text = (text or "").strip()
+    return primary_key(text), text.casefold(), text
+
+
+def combine(levels):
+    """a sort key comparing every field's primary level before any field's
+    accents, and those before any field's case"""
+    return tuple(tuple(field[level] for field in levels) for level in range(3))
+
+
+def successor(prefix):
+    """the least string sorting after every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def split_child_name(child_name):
+    last, _, first = child_name.partition(",")
+    return last, first
+
+
+class OrderedIndex(object):
+    """collation levels of every child of a RecordStore, computed once, and
+    each ordering sorted once on first use
+
+    orderings read back as lists of child names in O(k); spans select the
+    children whose leading field starts between two prefixes, like a grade
+    or a letter span of last names, in O(log n + k)"""
+
+    def __init__(self, store):
+        self.store = store
+        self.levels = {}
+        for child_name, record in store.child_records.items():
+            last, first = split_child_name(child_name)
+            self.levels[child_name] = {
+                "last": collation_levels(last),
+                "first": collation_levels(first),
+                "grade": collation_levels(record.grade),
+                "language": collation_levels(record.language),
+                "teacher": collation_levels(record.teacher_hr),
+            }
+        self.orderings = {}
+
+    def family_levels(self, child_name):
+        """a child files under its first parent, or under itself if it has
+        none, so siblings sharing parents come out together"""
+        parent_ids = self.store.child_records[child_name].parent_ids
+        if parent_ids:
+            last, first = split_child_name(self.store.parent_names[parent_ids[0]])
+            return {
+                "family_last": collation_levels(last),
+                "family_first": collation_levels(first),
+            }
+        levels = self.levels[child_name]
+        return {"family_last": levels["last"], "family_first": levels["first"]}
+
+    def build(self, ordering):
+        fields = ORDERINGS[ordering]
+        grouped = GROUP_FIELDS.get(ordering, 0)
+        keyed = []
+        for child_name, levels in self.levels.items():
+            if ordering == "family":
+                levels = {**levels, **self.family_levels(child_name)}
+            field_levels = [levels[field] for field in fields]
+            if grouped:
+                key = combine(field_levels[:grouped]) + combine(
+                    field_levels[grouped:]
+                )
+            else:
+                key = combine(field_levels)
+            keyed.append((key, child_name))
+        keyed.sort()
+        self.orderings[ordering] = (
+            [key for (key, _) in keyed],
+            [child_name for (_, child_name) in keyed],
+        )
+
+    def ordered(self, ordering):
+        """child names in the ordering; the list is shared, do not modify it"""
+        if ordering not in self.orderings:
+            self.build(ordering)
+        return self.orderings[ordering][1]
+
+    def span(self, ordering, low, high=None):
+        """child names whose leading field starts with low, or with anything
+        from low to high; ("grade", "3") is third grade, ("name", "a", "c")
+        last names from A to C"""
+        high = low if high is None else high
+        self.ordered(ordering)
+        keys, names = self.orderings[ordering]
+        start = bisect.bisect_left(keys, ((primary_key(low),),))
+        end = bisect.bisect_left(keys, ((primary_key(successor(high)),),))
+        return names[start:end]
+
+    def groups(self, ordering, fields_count, names=None):
+        """(field values, child names) runs of consecutive children sharing
+        the first fields_count fields, up to GROUP_FIELDS of the ordering,
+        over names if given"""
+        if fields_count > GROUP_FIELDS.get(ordering, 0):
+            raise ValueError(
+                f"the {ordering} ordering groups by at most "
+                f"{GROUP_FIELDS.get(ordering, 0)} fields"
+            )
+        fields = ORDERINGS[ordering][:fields_count]
+        names = self.ordered(ordering) if names is None else names
+        for values, run in itertools.groupby(
+            names, lambda name: tuple(self.levels[name][f][2] for f in fields)
+        ):
+            yield values, list(run)
+
+    def invalidate(self, *orderings):
+        """forget orderings whose fields have changed, all if none named"""
+        for ordering in orderings or list(self.orderings):
+            self.orderings.pop(ordering, None)
@@ -0,0 +1,105 @@
+"""pipeline module
+
+the student directory as a chain of generators: sheet rows are decoded
+straight into compact records, joined, formatted and turned into docs
+requests one at a time, and requests are sent a chunk at a time as they
+are generated
+
+ordering by name and reconciling the roster against the directory need every
+roster row, and any child's parents may be on the last directory row, so
+both sheets are read into RecordStores before the first group is yielded;
+they are the chain's buffers, and no list of row dicts, enriched children,
+formatted groups or requests is ever built. reading the sheets therefore
+never overlaps writing the document: what streams is formatting, planning
+and sending. the parse is checked before the document is created, so bad
+roster rows fail the build before it writes anything
+"""
+import itertools
+from directo.decoder import RowDecoder
+from directo.docs import BOLD_STYLE, DirectoryDoc, table_format_requests
+from directo.ordering import OrderedIndex
+from directo.reconcile import reconcile
+from directo.records import RecordStore, record_dict
+from directo.sheets import (
+    GRADE_REPR,
+    check_children,
+    format_addresses,
+    header_and_data_ranges,
+    iter_sheet_rows,
+    read_sheet_range,
+    store_children,
+    store_families,
+)
+from directo.trace import TRACER
+
+
+def sheet_rows(sheet_id, values=None, page_size=None, **range_kwargs):
+    """(headers, rows) of a sheet: from a read_sheets result when given one,
+    otherwise read lazily in pages, of 1000 rows by default, as the rows are
+    consumed"""
+    header_range, data_range = header_and_data_ranges(**range_kwargs)
+    if values is not None:
+        return values[(sheet_id, header_range)][0], iter(
+            values[(sheet_id, data_range)]
+        )
+    headers = read_sheet_range(sheet_id, header_range).get("values", [[]])[0]
+    kwargs = dict(range_kwargs)
+    kwargs["row_start"] = str(int(kwargs.get("row_start", "1")) + 1)
+    return headers, iter_sheet_rows(sheet_id, page_size=page_size or 1000, **kwargs)
+
+
+def directory_text_groups(roster, directory):
+    """yield the text groups of format_directory_data, in the same order,
+    from (headers, rows) of the roster and directory sheets; both sheets are
+    parsed, checked and reconciled before the first group"""
+    with TRACER.span("pipeline.parse", "sheets"):
+        headers, rows = directory
+        directory_store = store_families(RecordStore(), RowDecoder(headers), rows)
+        headers, rows = roster
+        roster_store = store_children(RecordStore(), RowDecoder(headers), rows)
+        check_children(roster_store)
+        reconciliation = reconcile(
+            roster_store.child_records, directory_store.child_records
+        )
+        reconciliation.log_proposed()
+        matched = reconciliation.matched
+    for child_name in OrderedIndex(roster_store).ordered("name"):
+        record = roster_store.child_records[child_name]
+        directory_child = directory_store.child_records.get(matched.get(child_name))
+        parents = []
+        if directory_child is not None and directory_child.parent_ids is not None:
+            parents = [
+                record_dict(directory_store.parent_records[parent_id])
+                for parent_id in directory_child.parent_ids
+            ]
+        yield (
+            f"{child_name} - {GRADE_REPR[record.grade]}\n\n",
+            format_addresses(parents),
+        )
+
+
+def stream_doc(title, text_groups, columns=2, font_size=9, journals=None):
+    """build a one table document from a lazy stream of text groups, like
+    DirectoryDoc.build_tables, journaled if given journals; returns the
+    document id"""
+    text_groups = iter(text_groups)
+    # the first group needs the whole parse, which raises on bad rows before
+    # the document exists, and completes the run's identity
+    first = next(text_groups, None)
+    journal = None if journals is None else journals.open(title)
+    if journal is not None and journal.finished is not None:
+        return journal.finished
+    doc = DirectoryDoc(journal)
+    doc.new(title)
+    doc.new_table(columns)
+    if first is not None:
+        doc.stream_table_with_data(itertools.chain([first], text_groups), BOLD_STYLE)
+    doc.batch_update(
+        table_format_requests(
+            doc.active_table_json, font_size, bold_first_line=first is None
+        )
+    )
+    doc.checkpoint()
+    if journal is not None:
+        journal.finish()
+    return doc.doc_id
@@ -0,0 +1,212 @@
+"""reconcile module
+
+matches roster children to directory children by name, tolerating case,
+accent, whitespace and punctuation differences; names that only score as
+close, like "Garcia, Mario" and "Garcia, Maria", may be different children,
+so they are proposed rather than matched
+
+names are normalized once and indexed under a few blocking keys (the sorted
+name tokens, the soundex of both name parts, and either part with the
+initial of the other), so each roster name is only scored against the
+directory names sharing a key and the whole match stays near-linear in the
+size of the sheets
+"""
+import logging
+import unicodedata
+from difflib import SequenceMatcher
+
+MATCH_SCORE = 0.9
+CANDIDATE_SCORE = 0.75
+# a best candidate this close to the runner-up is not trusted on its own
+AMBIGUITY_MARGIN = 0.05
+# larger blocks say too little about a name to be worth scoring in full
+MAX_BLOCK_SIZE = 200
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"),
+    **dict.fromkeys("cgjkqsxz", "2"),
+    **dict.fromkeys("dt", "3"),
+    "l": "4",
+    **dict.fromkeys("mn", "5"),
+    "r": "6",
+}
+
+
+def normalize_text(text):
+    """casefolded, accents stripped, punctuation as spaces, single spaced"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = "".join(char if char.isalnum() else " " for char in text.casefold())
+    return " ".join(text.split())
+
+
+def split_name(name):
+    """(last, first) normalized parts of a "Last, First" name"""
+    last, _, first = name.partition(",")
+    return normalize_text(last), normalize_text(first)
+
+
+def soundex(word):
+    if not word:
+        return ""
+    codes = [SOUNDEX_CODES.get(char, "") for char in word]
+    result = word[0]
+    previous = codes[0]
+    for char, code in zip(word[1:], codes[1:]):
+        if code and code != previous:
+            result += code
+        # h and w do not separate letters with the same code
+        if char not in "hw":
+            previous = code
+    return (result + "000")[:4]
+
+
+class NormalizedName(object):
+    __slots__ = ("name", "last", "first", "text", "keys")
+
+    def __init__(self, name):
+        self.name = name
+        self.last, self.first = split_name(name)
+        self.text = f"{self.last} {self.first}".strip()
+        tokens = self.text.split()
+        self.keys = set()
+        if tokens:
+            self.keys.add("t:" + " ".join(sorted(tokens)))
+        if self.last and self.first:
+            # a misspelling usually leaves one of these intact
+            self.keys.add(f"p:{soundex(self.last)}{soundex(self.first)}")
+            self.keys.add(f"l:{self.last} {self.first[0]}")
+            self.keys.add(f"f:{self.first} {self.last[0]}")
+
+
+class NameIndex(object):
+    """normalized names grouped by blocking key"""
+
+    def __init__(self, names):
+        self.names = {}
+        self.texts = {}
+        self.blocks = {}
+        for name in names:
+            normalized = NormalizedName(name)
+            if not normalized.keys:
+                continue
+            self.names[name] = normalized
+            self.texts.setdefault(normalized.text, []).append(name)
+            for key in normalized.keys:
+                self.blocks.setdefault(key, []).append(normalized)
+
+    def candidates(self, normalized):
+        """(score, name) of every indexed name sharing a block, best first;
+        oversized blocks are skipped, which bounds the cost of any one name"""
+        matcher = SequenceMatcher(autojunk=False)
+        # seq2 is the side SequenceMatcher preprocesses, so it is set once
+        matcher.set_seq2(normalized.text)
+        seen = {}
+        for key in normalized.keys:
+            block = self.blocks.get(key, [])
+            if len(block) > MAX_BLOCK_SIZE:
+                continue
+            for candidate in block:
+                if candidate.name in seen:
+                    continue
+                matcher.set_seq1(candidate.text)
+                # the cheap upper bounds rule out most of a block unscored
+                if (
+                    matcher.real_quick_ratio() < CANDIDATE_SCORE
+                    or matcher.quick_ratio() < CANDIDATE_SCORE
+                ):
+                    seen[candidate.name] = 0.0
+                else:
+                    seen[candidate.name] = matcher.ratio()
+        return sorted(
+            ((score, name) for (name, score) in seen.items()),
+            key=lambda item: (-item[0], item[1]),
+        )
+
+
+class Reconciliation(object):
+    """matched: {roster name: directory name}, equal once normalized
+    proposed: {roster name: (score, directory name)}, close but not applied
+    ambiguous: {roster name: [(score, directory name), ...]}
+    unmatched_roster, unmatched_directory: names with no match"""
+
+    def __init__(self):
+        self.matched = {}
+        self.proposed = {}
+        self.ambiguous = {}
+        self.unmatched_roster = []
+        self.unmatched_directory = []
+
+    def summary(self):
+        return {
+            "matched": len(self.matched),
+            "proposed": len(self.proposed),
+            "ambiguous": len(self.ambiguous),
+            "unmatched_roster": len(self.unmatched_roster),
+            "unmatched_directory": len(self.unmatched_directory),
+        }
+
+    def log_proposed(self):
+        for name, (score, candidate) in self.proposed.items():
+            logging.warning(
+                "%s not matched to directory entry %s (score %.2f), "
+                "fix the spelling in one of the sheets",
+                name,
+                candidate,
+                score,
+            )
+
+
+def reconcile(roster_names, directory_names):
+    """match each roster name to at most one directory name; exact names
+    match without scoring, names equal once normalized match if only one
+    directory name is, and the rest are scored within their blocks"""
+    result = Reconciliation()
+    directory_names = list(directory_names)
+    index = NameIndex(directory_names)
+    unresolved = []
+    for name in roster_names:
+        if name in index.names:
+            result.matched[name] = name
+        else:
+            unresolved.append(name)
+    claimed = set(result.matched.values())
+    for name in unresolved:
+        normalized = NormalizedName(name)
+        equal = [
+            candidate
+            for candidate in index.texts.get(normalized.text, [])
+            if candidate not in claimed
+        ]
+        if len(equal) == 1:
+            result.matched[name] = equal[0]
+            claimed.add(equal[0])
+            continue
+        if equal:
+            result.ambiguous[name] = [(1.0, candidate) for candidate in equal]
+            continue
+        candidates = [
+            (score, candidate)
+            for (score, candidate) in index.candidates(normalized)
+            if score >= CANDIDATE_SCORE and candidate not in claimed
+        ]
+        if not candidates:
+            result.unmatched_roster.append(name)
+        elif candidates[0][0] >= MATCH_SCORE and (
+            len(candidates) == 1
+            or candidates[0][0] - candidates[1][0] > AMBIGUITY_MARGIN
+        ):
+            result.proposed[name] = candidates[0]
+        else:
+            result.ambiguous[name] = candidates
+    ambiguous = {
+        candidate
+        for candidates in result.ambiguous.values()
+        for (_, candidate) in candidates
+    }
+    result.unmatched_directory = [
+        name
+        for name in directory_names
+        if name in index.names and name not in claimed and name not in ambiguous
+    ]
+    return result
@@ -0,0 +1,184 @@
+"""records module
+
+compact storage for children and parents: slotted records with interned
+values, parents referenced by integer id, and read-only dict views that keep
+the `children`/`parents` access the rest of the code expects
+"""
+import sys
+from collections.abc import Mapping
+
+
+class ParentRecord(object):
+    __slots__ = (
+        "name_last",
+        "name_first",
+        "email",
+        "phone",
+        "address",
+        "city",
+        "state",
+        "zip",
+    )
+
+
+class ChildRecord(object):
+    __slots__ = (
+        "name_last",
+        "name_first",
+        "grade",
+        "teacher_hr",
+        "language",
+        "parent_ids",
+    )
+
+
+def intern_value(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def update_record(record, data):
+    """fields missing from data keep their value, None means undefined"""
+    for field in record.__slots__:
+        if field in data:
+            setattr(record, field, intern_value(data[field]))
+
+
+def new_record(record_class):
+    record = record_class()
+    for field in record_class.__slots__:
+        setattr(record, field, None)
+    return record
+
+
+def record_dict(record, skip=()):
+    return {
+        field: getattr(record, field)
+        for field in record.__slots__
+        if field not in skip and getattr(record, field) is not None
+    }
+
+
+class RecordStore(object):
+    def __init__(self):
+        self.parent_records = []
+        self.parent_names = []
+        self.parent_ids = {}
+        self.child_records = {}
+
+    def add_parent(self, name, data):
+        """adds or updates a parent, returns its id"""
+        name = sys.intern(name)
+        if name not in self.parent_ids:
+            self.parent_ids[name] = len(self.parent_records)
+            self.parent_records.append(new_record(ParentRecord))
+            self.parent_names.append(name)
+        parent_id = self.parent_ids[name]
+        update_record(self.parent_records[parent_id], data)
+        return parent_id
+
+    def adopt_parent(self, name, record):
+        """shares another store's parent record instead of copying it"""
+        name = sys.intern(name)
+        if name not in self.parent_ids:
+            self.parent_ids[name] = len(self.parent_records)
+            self.parent_records.append(record)
+            self.parent_names.append(name)
+        return self.parent_ids[name]
+
+    def add_child(self, name, data, parent_ids=None):
+        """adds or updates a child; parent_ids replaces the child's parents"""
+        name = sys.intern(name)
+        if name not in self.child_records:
+            self.child_records[name] = new_record(ChildRecord)
+        record = self.child_records[name]
+        update_record(record, data)
+        if parent_ids is not None:
+            record.parent_ids = tuple(parent_ids)
+        return record
+
+    def children_view(self, expand_parents=False):
+        return ChildrenView(self, expand_parents)
+
+    def parents_view(self):
+        return ParentsView(self)
+
+    def memory_usage(self):
+        """approximate bytes held by the store, counting each shared object once"""
+        seen = set()
+
+        def size(obj):
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            return sys.getsizeof(obj)
+
+        total = size(self.parent_records) + size(self.parent_ids)
+        total += size(self.parent_names)
+        total += size(self.child_records)
+        for name, parent_id in self.parent_ids.items():
+            total += size(name) + size(parent_id)
+        for record in self.parent_records:
+            total += size(record) + sum(
+                size(getattr(record, f)) for f in record.__slots__
+            )
+        for name, record in self.child_records.items():
+            total += size(name) + size(record)
+            total += sum(size(getattr(record, f)) for f in record.__slots__)
+        return {
+            "children": len(self.child_records),
+            "parents": len(self.parent_records),
+            "bytes": total,
+        }
+
+
+class ChildrenView(Mapping):
+    """read-only name -> dict view; parents are listed by name, or as parent
+    dicts when expand_parents is set"""
+
+    def __init__(self, store, expand_parents=False):
+        self.store = store
+        self.expand_parents = expand_parents
+
+    def __getitem__(self, name):
+        record = self.store.child_records[name]
+        result = record_dict(record, skip=("parent_ids",))
+        if record.parent_ids is not None:
+            if self.expand_parents:
+                parents = self.store.parent_records
+                result["parents"] = [
+                    record_dict(parents[i]) for i in record.parent_ids
+                ]
+            else:
+                names = self.store.parent_names
+                result["parents"] = [names[i] for i in record.parent_ids]
+        return result
+
+    def __iter__(self):
+        return iter(self.store.child_records)
+
+    def __len__(self):
+        return len(self.store.child_records)
+
+    def __contains__(self, name):
+        return name in self.store.child_records
+
+
+class ParentsView(Mapping):
+    """read-only name -> dict view of the parents"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, name):
+        return record_dict(self.store.parent_records[self.store.parent_ids[name]])
+
+    def __iter__(self):
+        return iter(self.store.parent_ids)
+
+    def __len__(self):
+        return len(self.store.parent_ids)
+
+    def __contains__(self, name):
+        return name in self.store.parent_ids
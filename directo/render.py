@@ -0,0 +1,63 @@
+"""render module"""
+import os
+from functools import lru_cache
+from jinja2 import DictLoader, Environment, FileSystemBytecodeCache
+
+ADDRESS_TEMPLATE = """
+{{name_first}} {{name_last}}
+{% if address is defined -%}
+{{address}}
+{% endif %}
+{%- if city is defined -%}
+{{city}} {{state}} {{zip}}
+{% endif %}
+{%- if email is defined -%}
+{{email}}
+{% endif %}
+{%- if phone is defined -%}
+{{phone}}
+{% endif %}
+"""
+
+# operators may point these at a custom address template and a bytecode cache
+ADDRESS_TEMPLATE_PATH = os.environ.get("DIRECTO_ADDRESS_TEMPLATE")
+BYTECODE_CACHE_DIR = os.environ.get("DIRECTO_TEMPLATE_CACHE")
+
+
+@lru_cache(maxsize=None)
+def get_environment(bytecode_cache_dir=BYTECODE_CACHE_DIR):
+    bytecode_cache = None
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+    return Environment(
+        loader=DictLoader({"address": ADDRESS_TEMPLATE}),
+        bytecode_cache=bytecode_cache,
+        cache_size=-1,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_address_template(template_path=ADDRESS_TEMPLATE_PATH):
+    """compiled once per process; a custom template file is compiled through
+    the same environment so it shares the bytecode cache"""
+    env = get_environment()
+    if template_path is None:
+        return env.get_template("address")
+    with open(template_path) as template_file:
+        source = template_file.read()
+    # from_string skips the bytecode cache, so go through a named loader
+    env.loader.mapping[template_path] = source
+    return env.get_template(template_path)
+
+
+def render_address(parent_data, template=None):
+    template = template or get_address_template()
+    return template.render(parent_data).strip()
+
+
+def render_addresses(parents_data, template=None):
+    """render every parent record with one compiled template"""
+    template = template or get_address_template()
+    render = template.render
+    return [render(parent_data).strip() for parent_data in parents_data]
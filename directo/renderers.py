@@ -0,0 +1,303 @@
+"""renderers module
+
+local backends with DirectoryDoc's document methods, writing html, markdown
+or docx straight to a file instead of building a google doc through the api
+
+output is streamed: each row is written as soon as its text groups are read,
+so nothing but the current row is held in memory. as rows cannot be
+restyled once written, the style methods set the look of the tables that
+follow them, and build_tables styles its tables like the google doc
+"""
+import html
+import itertools
+import zipfile
+from xml.sax.saxutils import escape as xml_escape
+
+
+def iter_rows(data, columns, default_item_value="\n"):
+    """rows of text groups like group_cell_data_items, from any iterable"""
+    items = iter(data)
+    while True:
+        row = list(itertools.islice(items, columns))
+        if not row:
+            return
+        row.extend([default_item_value] * (columns - len(row)))
+        yield row
+
+
+def cell_paragraphs(text_group):
+    """the paragraphs a text group makes in a cell, as the google doc has
+    them: every newline ends one"""
+    return "".join(text_group).split("\n")
+
+
+class LocalDoc(object):
+    """writes one document to path; use as a context manager or call close"""
+
+    extension = None
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.columns_count = None
+        self.in_table = False
+        self.font_size = 8
+        self.font_family = "Calibri"
+        self.bold_first_line = False
+        self.unbroken = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        self.file = open(self.path, "w", encoding="utf-8")
+
+    def write(self, text):
+        self.file.write(text)
+
+    def close_file(self):
+        self.file.close()
+
+    def new(self, title):
+        self.open()
+        self.write_header(title)
+
+    def new_table(self, columns):
+        self.end_table()
+        self.columns_count = columns
+        self.in_table = True
+        self.write_table_start()
+
+    def fill_table_with_data(self, data, first_line_style=None):
+        if first_line_style:
+            self.bold_first_line = True
+        written = False
+        for row in iter_rows(data, self.columns_count):
+            self.write_row(row)
+            written = True
+        if not written:
+            # like a new google doc table, an empty one keeps its empty row
+            self.write_row([""] * self.columns_count)
+
+    def build_tables(self, tables_data, columns, font_size=9):
+        self.general_format_cells(font_size=font_size)
+        self.bold_cells_first_line()
+        self.unbroken_cells()
+        for data in tables_data:
+            self.new_table(columns)
+            self.fill_table_with_data(data)
+
+    def bold_cells_first_line(self):
+        self.bold_first_line = True
+
+    def general_format_cells(self, font_size=8, font_family="Calibri"):
+        self.font_size = font_size
+        self.font_family = font_family
+
+    def unbroken_cells(self):
+        self.unbroken = True
+
+    def checkpoint(self):
+        """nothing to drift from, the file is the document"""
+        return True
+
+    def end_table(self):
+        if self.in_table:
+            self.write_table_end()
+            self.in_table = False
+
+    def close(self):
+        if self.file is not None:
+            self.end_table()
+            self.write_footer()
+            self.close_file()
+            self.file = None
+
+    def write_header(self, title):
+        pass
+
+    def write_table_start(self):
+        pass
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def write_table_end(self):
+        pass
+
+    def write_footer(self):
+        pass
+
+
+class HtmlDoc(LocalDoc):
+    extension = ".html"
+
+    def write_header(self, title):
+        self.write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{html.escape(title)}</title>\n<style>\n"
+            "table { border-collapse: collapse; width: 100%; margin: 1em 0; }\n"
+            "td { border: 1px solid #000; vertical-align: top; padding: 4pt; }\n"
+            "p { margin: 0; min-height: 1em; }\n"
+            "</style>\n</head>\n<body>\n"
+        )
+
+    def write_table_start(self):
+        style = f"font-family: {self.font_family}; font-size: {self.font_size}pt;"
+        self.write(f'<table style="{style}">\n')
+
+    def write_row(self, row):
+        cells = []
+        for text_group in row:
+            paragraphs = []
+            for number, paragraph in enumerate(cell_paragraphs(text_group)):
+                paragraph = html.escape(paragraph)
+                if number == 0 and self.bold_first_line and paragraph:
+                    paragraph = f"<strong>{paragraph}</strong>"
+                paragraphs.append(f"<p>{paragraph}</p>")
+            cells.append(f"<td>{''.join(paragraphs)}</td>")
+        tag = '<tr style="break-inside: avoid;">' if self.unbroken else "<tr>"
+        self.write(f"{tag}{''.join(cells)}</tr>\n")
+
+    def write_table_end(self):
+        self.write("</table>\n")
+
+    def write_footer(self):
+        self.write("</body>\n</html>\n")
+
+
+class MarkdownDoc(LocalDoc):
+    """github flavoured markdown; cell paragraphs are joined with <br>"""
+
+    extension = ".md"
+
+    def write_header(self, title):
+        self.write(f"# {title}\n")
+
+    def write_table_start(self):
+        self.write("\n" + "|   " * self.columns_count + "|\n")
+        self.write("| --- " * self.columns_count + "|\n")
+
+    def write_row(self, row):
+        cells = []
+        for text_group in row:
+            paragraphs = [
+                paragraph.replace("\\", "\\\\").replace("|", "\\|").strip()
+                for paragraph in cell_paragraphs(text_group)
+            ]
+            if self.bold_first_line and paragraphs[0]:
+                paragraphs[0] = f"**{paragraphs[0]}**"
+            # the cell's own trailing newline makes no paragraph worth a break
+            while paragraphs and not paragraphs[-1]:
+                paragraphs.pop()
+            cells.append("<br>".join(paragraphs))
+        self.write(f"| {' | '.join(cells)} |\n")
+
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" '
+    'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    "</Types>"
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats'
+    '.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+DOCX_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+# a4 width less one inch margins, in twentieths of a point
+DOCX_TEXT_WIDTH = 9638
+
+
+class DocxDoc(LocalDoc):
+    """word document written as a zip, word/document.xml streamed into it"""
+
+    extension = ".docx"
+
+    def open(self):
+        self.archive = zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED)
+        self.archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        self.archive.writestr("_rels/.rels", DOCX_RELS)
+        self.file = self.archive.open("word/document.xml", "w")
+
+    def write(self, text):
+        self.file.write(text.encode("utf-8"))
+
+    def close_file(self):
+        self.file.close()
+        self.archive.close()
+
+    def run_properties(self, bold):
+        size = round(self.font_size * 2)
+        return (
+            f'<w:rPr><w:rFonts w:ascii="{xml_escape(self.font_family)}" '
+            f'w:hAnsi="{xml_escape(self.font_family)}"/>'
+            f"{'<w:b/>' if bold else ''}"
+            f'<w:sz w:val="{size}"/><w:szCs w:val="{size}"/></w:rPr>'
+        )
+
+    def paragraph(self, text, bold=False):
+        if not text:
+            return f"<w:p>{self.paragraph_properties}</w:p>"
+        return (
+            f"<w:p>{self.paragraph_properties}<w:r>{self.run_styles[bold]}"
+            f'<w:t xml:space="preserve">{xml_escape(text)}</w:t></w:r></w:p>'
+        )
+
+    def write_header(self, title):
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<w:document xmlns:w="{DOCX_NAMESPACE}"><w:body>'
+        )
+
+    def write_table_start(self):
+        # the style of every paragraph in the table, worked out once
+        self.run_styles = {bold: self.run_properties(bold) for bold in (False, True)}
+        self.paragraph_properties = ""
+        if self.unbroken:
+            self.paragraph_properties = "<w:pPr><w:keepNext/><w:keepLines/></w:pPr>"
+        width = DOCX_TEXT_WIDTH // self.columns_count
+        borders = "".join(
+            f'<w:{side} w:val="single" w:sz="4" w:space="0" w:color="000000"/>'
+            for side in ("top", "left", "bottom", "right", "insideH", "insideV")
+        )
+        self.write(
+            '<w:tbl><w:tblPr><w:tblW w:w="0" w:type="auto"/>'
+            f"<w:tblBorders>{borders}</w:tblBorders></w:tblPr><w:tblGrid>"
+            + f'<w:gridCol w:w="{width}"/>' * self.columns_count
+            + "</w:tblGrid>"
+        )
+
+    def write_row(self, row):
+        cells = []
+        for text_group in row:
+            cells.append(
+                "<w:tc>"
+                + "".join(
+                    self.paragraph(text, bold=number == 0 and self.bold_first_line)
+                    for number, text in enumerate(cell_paragraphs(text_group))
+                )
+                + "</w:tc>"
+            )
+        row_properties = "<w:trPr><w:cantSplit/></w:trPr>" if self.unbroken else ""
+        self.write(f"<w:tr>{row_properties}{''.join(cells)}</w:tr>")
+
+    def write_table_end(self):
+        # a paragraph keeps consecutive tables apart
+        self.write("</w:tbl><w:p/>")
+
+    def write_footer(self):
+        self.write("<w:sectPr/></w:body></w:document>")
+
+
+RENDERERS = {"html": HtmlDoc, "md": MarkdownDoc, "docx": DocxDoc}
@@ -0,0 +1,145 @@
+"""scheduler module"""
+import json
+import logging
+import random
+import threading
+import time
+from directo.trace import TRACER
+
+
+# Docs and Sheets both allow 60 write requests per minute per user
+REQUESTS_PER_MINUTE = 60
+MAX_REQUESTS_PER_BATCH = 100
+MAX_BYTES_PER_BATCH = 512 * 1024
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket(object):
+    """paces calls to a steady per-minute rate while allowing short bursts"""
+
+    def __init__(self, rate_per_minute=REQUESTS_PER_MINUTE, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """takes a token if one is available and returns 0, otherwise returns
+        the seconds to wait before trying again"""
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """blocks until a token is available and takes it"""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+
+def request_size(request):
+    return len(json.dumps(request, separators=(",", ":")))
+
+
+def chunk_requests(
+    requests, max_count=MAX_REQUESTS_PER_BATCH, max_bytes=MAX_BYTES_PER_BATCH
+):
+    """yields lists of requests bounded by both request count and payload size;
+    a single request larger than max_bytes is sent on its own"""
+    chunk = []
+    chunk_bytes = 0
+    for request in requests:
+        size = request_size(request)
+        if chunk and (len(chunk) >= max_count or chunk_bytes + size > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+def error_status(error):
+    """http status of an api error, None for anything else"""
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", getattr(error, "status", None))
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchScheduler(object):
+    """sends request chunks at the pace allowed by the api quota, retrying
+    throttled and failed calls with jittered exponential backoff"""
+
+    def __init__(
+        self,
+        bucket=None,
+        max_count=MAX_REQUESTS_PER_BATCH,
+        max_bytes=MAX_BYTES_PER_BATCH,
+        max_retries=6,
+        backoff_base=1.0,
+        backoff_max=64.0,
+    ):
+        self.bucket = bucket or TokenBucket()
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+
+    def backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, delay)
+
+    def count_retry(self):
+        """one more retry; the per-grade threads share the scheduler"""
+        with self.bucket.lock:
+            self.retries += 1
+        TRACER.count("api retries")
+
+    def call(self, func, *args, **kwargs):
+        """calls func once a token is available, retrying retryable errors"""
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if (
+                    error_status(e) not in RETRYABLE_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    raise
+                delay = self.backoff(attempt)
+                logging.warning(
+                    f"retrying after status {error_status(e)} in {delay:.1f}s"
+                )
+                self.count_retry()
+                attempt += 1
+                time.sleep(delay)
+
+    def run(self, send_chunk, requests):
+        """sends every request through send_chunk in bounded chunks and
+        returns the list of responses"""
+        return [
+            self.call(send_chunk, chunk)
+            for chunk in chunk_requests(requests, self.max_count, self.max_bytes)
+        ]
+
+
+DOCS_SCHEDULER = BatchScheduler()
@@ -1,7 +1,12 @@
 """sheets module"""
-from googleapiclient.discovery import build
-from directo.auth import get_creds, SCOPES_RW
-from jinja2 import Template
+from directo.auth import SCOPES_RW
+from directo.clients import get_service
+from directo.decoder import RowDecoder
+from directo.ordering import ORDERINGS, OrderedIndex
+from directo.reconcile import reconcile
+from directo.records import RecordStore
+from directo.trace import TRACER, traced
+from directo.render import render_address, render_addresses
 import logging
 
 
@@ -15,19 +20,90 @@ GRADE_REPR = {
     "4": "4",
     "5": "5",
 }
+# correlate_students_to_parents attributes read from an index ordering
+SORT_ORDERINGS = {"student_name": "name"}
 
 
 # api interaction
 def read_sheet_range(sheet_id, sheet_range):
-    service = build("sheets", "v4", credentials=get_creds(SCOPES_RW))
+    service = get_service("sheets", "v4", SCOPES_RW)
     return (
         service.spreadsheets()
         .values()
-        .get(spreadsheetId=sheet_id, range=sheet_range)
+        .get(spreadsheetId=sheet_id, range=sheet_range, fields="values")
         .execute()
     )
 
 
+def batch_read_sheet_ranges(sheet_id, sheet_ranges):
+    """reads several ranges of one spreadsheet in a single values.batchGet,
+    returns their value grids in request order"""
+    service = get_service("sheets", "v4", SCOPES_RW)
+    response = (
+        service.spreadsheets()
+        .values()
+        .batchGet(
+            spreadsheetId=sheet_id,
+            ranges=list(sheet_ranges),
+            fields="valueRanges(range,values)",
+        )
+        .execute()
+    )
+    return [
+        value_range.get("values", []) for value_range in response["valueRanges"]
+    ]
+
+
+def read_sheets(ranges_by_sheet):
+    """reads {sheet_id: [sheet_range, ...]} with one batchGet per spreadsheet,
+    returns {(sheet_id, sheet_range): values}"""
+    result = {}
+    for sheet_id, sheet_ranges in ranges_by_sheet.items():
+        sheet_ranges = list(dict.fromkeys(sheet_ranges))
+        for sheet_range, values in zip(
+            sheet_ranges, batch_read_sheet_ranges(sheet_id, sheet_ranges)
+        ):
+            result[(sheet_id, sheet_range)] = values
+    return result
+
+
+def sheet_row_count(sheet_id, tab_name):
+    """rows in a tab's grid, blank ones included"""
+    service = get_service("sheets", "v4", SCOPES_RW)
+    response = (
+        service.spreadsheets()
+        .get(
+            spreadsheetId=sheet_id,
+            fields="sheets(properties(title,gridProperties(rowCount)))",
+        )
+        .execute()
+    )
+    for sheet in response.get("sheets", []):
+        if sheet["properties"]["title"] == tab_name:
+            return sheet["properties"]["gridProperties"]["rowCount"]
+    raise ValueError(f"spreadsheet {sheet_id} has no tab {tab_name}")
+
+
+def iter_sheet_rows(
+    sheet_id,
+    tab_name="Sheet1",
+    col_start="A",
+    col_end="Z",
+    row_start="1",
+    page_size=1000,
+):
+    """yields rows from row_start on, reading the tab in row-windowed pages so
+    memory is bounded by the page size; the api trims trailing empty rows
+    from each page, so a short page says nothing about the rest of the tab
+    and the tab's row count bounds the read instead"""
+    row_count = sheet_row_count(sheet_id, tab_name)
+    for row in range(int(row_start), row_count + 1, page_size):
+        sheet_range = construct_sheet_range(
+            tab_name, col_start, col_end, str(row), str(row + page_size - 1)
+        )
+        yield from read_sheet_range(sheet_id, sheet_range).get("values", [])
+
+
 # sheets types
 def construct_sheet_range(
     tab_name="Sheet1", col_start="A", col_end="Z", row_start="1", row_end=""
@@ -35,195 +111,170 @@ def construct_sheet_range(
     return f"{tab_name}!{col_start}{row_start}:{col_end}{row_end}"
 
 
-# formatting funcs
-def format_name(item):
-    return f"{item['name_last'].strip()}, {item['name_first'].strip()}"
+def header_and_data_ranges(
+    tab_name="Sheet1", col_start="A", col_end="Z", row_start="1"
+):
+    """the header row range and the open-ended data range below it"""
+    header_range = construct_sheet_range(
+        tab_name=tab_name,
+        col_start=col_start,
+        col_end=col_end,
+        row_start=row_start,
+        row_end=row_start,
+    )
+    data_range = construct_sheet_range(
+        tab_name=tab_name,
+        col_start=col_start,
+        col_end=col_end,
+        row_start=str(int(row_start) + 1),
+        row_end="",
+    )
+    return header_range, data_range
 
 
+# formatting funcs
 def format_addresses(parents_info):
-    result = "\n\n".join([format_address(p) for p in parents_info])
+    result = "\n\n".join(render_addresses(parents_info))
     if result == "":
         result = "\n"  # docs api requires non-empty string for text inserts
     return result
 
 
 def format_address(parent_data):
-    template = Template(
-        """
-{{name_first}} {{name_last}}
-{% if address is defined -%}
-{{address}}
-{% endif %}
-{%- if city is defined -%}
-{{city}} {{state}} {{zip}}
-{% endif %}
-{%- if email is defined -%}
-{{email}}
-{% endif %}
-{%- if phone is defined -%}
-{{phone}}
-{% endif %}
-"""
-    )
-    return template.render(parent_data).strip()
+    return render_address(parent_data)
 
 
 # data parsing
-def parse_parents_from_item(item):
-    parent_a_attributes = [
-        "name_last_parent_guardian_a",
-        "name_first_parent_guardian_a",
-        "email_parent_guardian_a",
-        "phone_parent_guardian_a",
-        "address_parent_guardian_a",
-        "city_parent_guardian_a",
-        "state_parent_guardian_a",
-        "zip_parent_guardian_a",
-    ]
-    parent_a = dict(
-        {
-            k.replace("_parent_guardian_a", ""): v
-            for (k, v) in item.items()
-            if k in parent_a_attributes and v != ""
-        }
-    )
-    logging.debug(f"parent_a_preformatted: {parent_a}")
-    parent_b_attributes = [
-        "name_last_parent_guardian_b",
-        "name_first_parent_guardian_b",
-        "email_parent_guardian_b",
-        "phone_parent_guardian_b",
-        "address_parent_guardian_b",
-        "city_parent_guardian_b",
-        "state_parent_guardian_b",
-        "zip_parent_guardian_b",
-    ]
-    parent_b = {
-        k.replace("_parent_guardian_b", ""): v
-        for (k, v) in item.items()
-        if k in parent_b_attributes and v != ""
-    }
-    logging.debug(f"parent_b_preformatted: {parent_b}")
-
-    result = {}
-    result[format_name(parent_a)] = parent_a
-    if "name_last" in parent_b:
-        result[format_name(parent_b)] = parent_b
-    return result
-
-
-def parse_children_from_item(item):
-    child_a_attributes = [
-        "name_last_child_a",
-        "name_first_child_a",
-        # "grade_child_a",
-        # "program_child_a",
-        # "teacher_hr_child_a",
-    ]
-    child_a = {
-        k.replace("_child_a", ""): v
-        for (k, v) in item.items()
-        if k in child_a_attributes
-    }
-    logging.debug(f"child_a_preformatted: {child_a}")
-
-    child_b_attributes = [
-        "name_last_child_b",
-        "name_first_child_b",
-        # "grade_child_b",
-        # "program_child_b",
-        # "teacher_hr_child_b",
-    ]
-    child_b = {
-        k.replace("_child_b", ""): v
-        for (k, v) in item.items()
-        if k in child_b_attributes
-    }
-    logging.debug(f"child_b_preformatted: {child_b}")
-
-    result = {}
-    result[format_name(child_a)] = child_a
-    if "name_last" in child_b:
-        result[format_name(child_b)] = child_b
-    return result
-
-
-def parse_family_from_item(item):
-    parents = parse_parents_from_item(item)
-    logging.debug(f"parents_parsed: {parents}")
-    children = parse_children_from_item(item)
-    for _, child_data in children.items():
-        child_data["parents"] = list(set(parents.keys()))
-    return {
-        "children": children,
-        "parents": parents,
-    }
-
-
-def parse_child_from_item(item):
-    child_attributes = [
-        "name_last",
-        "name_first",
-        "grade",
-        "teacher_hr",
-        "language",
-    ]
-    child = {k: v for (k, v) in item.items() if k in child_attributes}
-    logging.debug(f"child_pre_parsed: {child}")
-    result = {}
-    result[format_name(child)] = child
-    return result
+def store_children(store, decoder, rows):
+    """add each roster row's child to a RecordStore, reading rows lazily"""
+    for row in rows:
+        for child_name, child_data in decoder.child(row).items():
+            store.add_child(child_name, child_data)
+    return store
+
+
+class RosterError(ValueError):
+    """roster rows the documents cannot be built from"""
+
+
+def check_children(store, shown=10):
+    """raise RosterError naming the children without a full name or with a
+    grade outside GRADE_REPR, so bad rows fail a build before it writes"""
+    problems = []
+    for child_name, record in store.child_records.items():
+        last, _, first = child_name.partition(",")
+        if not last.strip() or not first.strip():
+            problems.append(f"{child_name!r} lacks a last or first name")
+        if record.grade not in GRADE_REPR:
+            problems.append(f"{child_name} has unknown grade {record.grade!r}")
+    if problems:
+        more = f" and {len(problems) - shown} more" if len(problems) > shown else ""
+        raise RosterError(f"roster: {'; '.join(problems[:shown])}{more}")
+
+
+def store_families(store, decoder, rows):
+    """add each directory row's parents and children to a RecordStore"""
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for row in rows:
+        family = decoder.family(row)
+        if debug:
+            logging.debug("row: %s", row)
+            logging.debug("family: %s", family)
+        parent_ids = [
+            store.add_parent(parent_name, parent_data)
+            for parent_name, parent_data in family["parents"].items()
+        ]
+        for child_name, child_data in family["children"].items():
+            if debug:
+                logging.debug("raw child: %s %s", child_name, child_data)
+            store.add_child(child_name, child_data, parent_ids)
+    return store
 
 
 class SheetData(object):
-    def __init__(self, sheet_id, header_range, data_range):
+    """values, when given, is a read_sheets result holding both ranges, so
+    several sheets can be fetched together before they are parsed"""
+
+    def __init__(self, sheet_id, header_range, data_range, values=None):
         self.sheet_id = sheet_id
         self.header_range = header_range
         self.data_range = data_range
-        self.read_sheet_headers()
-        self.read_sheet_data()
-        self.structure_data()
+        with TRACER.span(type(self).__name__ + ".read", "sheets"):
+            if values is None:
+                values = read_sheets({sheet_id: [header_range, data_range]})
+            self.read_sheet_headers(values)
+            self.read_sheet_data(values)
 
-    def read_sheet_headers(self):
-        self.headers = read_sheet_range(self.sheet_id, self.header_range)["values"][0]
+    def read_sheet_headers(self, values):
+        self.headers = values[(self.sheet_id, self.header_range)][0]
+        self.decoder = RowDecoder(self.headers)
 
-    def read_sheet_data(self):
-        self.data = read_sheet_range(self.sheet_id, self.data_range)["values"]
+    def read_sheet_data(self, values):
+        self.data = values[(self.sheet_id, self.data_range)]
 
-    def structure_data(self):
-        self.data_structured = list(
-            map(lambda d: dict(zip(self.headers, d)), self.data)
-        )
+    @property
+    def data_structured(self):
+        """rows as header-keyed dicts, built on demand; parsing goes through
+        self.decoder and never needs them"""
+        return [dict(zip(self.headers, d)) for d in self.data]
 
 
 class RosterSheetData(SheetData):
-    def __init__(self, sheet_id, header_range, data_range):
-        super().__init__(sheet_id, header_range, data_range)
-        self.children = {}
-        self.children_enriched = {}
+    def __init__(self, sheet_id, header_range, data_range, values=None):
+        super().__init__(sheet_id, header_range, data_range, values)
+        self.store = RecordStore()
+        self.enriched = False
         self.read()
 
+    @property
+    def children(self):
+        return self.store.children_view()
+
+    @property
+    def children_enriched(self):
+        if not self.enriched:
+            return {}
+        return self.store.children_view(expand_parents=True)
+
+    @traced(category="sheets")
     def read(self):
         """make a list of children with their data and their parent/guardian info"""
-        for item in self.data_structured:
-            child = parse_child_from_item(item)
-            self.children.update(child)
-
-    def enrich_roster_with_normalized_directory(self, directory_data):
-        self.children_enriched = self.children.copy()
-        for child_name, child_data in self.children_enriched.items():
-            try:
-                child_data.update(directory_data.children[child_name])
-            except KeyError:
-                logging.info("Child not in directory data")
-            try:
-                child_parents = [
-                    directory_data.parents[p] for p in child_data["parents"]
-                ]
-            except KeyError:
-                logging.info("No parents listed for child in directory data")
-                child_parents = []
-            child_data["parents"] = child_parents
+        store_children(self.store, self.decoder, self.data)
+        check_children(self.store)
+        self.index = OrderedIndex(self.store)
+
+    @traced(category="sheets")
+    def enrich_roster_with_normalized_directory(
+        self, directory_data, reconciliation=None
+    ):
+        """attach the directory's names and parents to each rostered child,
+        matching names through reconcile; parent records are shared with the
+        directory store, not copied"""
+        directory_store = directory_data.store
+        if reconciliation is None:
+            reconciliation = reconcile(
+                self.store.child_records, directory_store.child_records
+            )
+            reconciliation.log_proposed()
+        for child_name, record in self.store.child_records.items():
+            directory_child = directory_store.child_records.get(
+                reconciliation.matched.get(child_name)
+            )
+            if directory_child is None or directory_child.parent_ids is None:
+                logging.info("Child not in directory data: %s", child_name)
+                record.parent_ids = ()
+                continue
+            record.name_last = directory_child.name_last
+            record.name_first = directory_child.name_first
+            record.parent_ids = tuple(
+                self.store.adopt_parent(
+                    directory_store.parent_names[parent_id],
+                    directory_store.parent_records[parent_id],
+                )
+                for parent_id in directory_child.parent_ids
+            )
+        self.index.invalidate("family")
+        self.enriched = True
 
     def correlate_teachers_to_students(
         self, sort=False, sort_attribute="index_slug", grade="all"
@@ -241,32 +292,23 @@ class RosterSheetData(SheetData):
         }
         """
         if grade == "all":
-            grades = ["0", "1", "2", "3", "4", "5"]
+            names = self.index.span("class", "0", "5")
         else:
-            grades = [grade]
-        # group by teacher, grade
-        teacher_grades = {
-            (v["teacher_hr"], v["grade"], v["language"])
-            for k, v in self.children.items()
-        }
-
+            names = self.index.span("class", grade)
+        # classes come out in collated (grade, language, teacher) order
         result = []
-        for teacher, teacher_grade, teacher_language in teacher_grades:
-            if teacher_grade in grades:
-                result.append(
-                    {
-                        "index_slug": f"{teacher_grade}-{teacher_language}-{teacher}",
-                        "teacher_name": teacher,
-                        "grade": teacher_grade,
-                        "language": teacher_language,
-                        "students": [
-                            k
-                            for k, v in self.children.items()
-                            if v["teacher_hr"] == teacher
-                        ],
-                    }
-                )
-        if sort:
+        for key, students in self.index.groups("class", 3, names):
+            teacher_grade, teacher_language, teacher = key
+            result.append(
+                {
+                    "index_slug": f"{teacher_grade}-{teacher_language}-{teacher}",
+                    "teacher_name": teacher,
+                    "grade": teacher_grade,
+                    "language": teacher_language,
+                    "students": students,
+                }
+            )
+        if sort and sort_attribute != "index_slug":
             result = sorted(result, key=lambda x: x[sort_attribute])
         return result
 
@@ -277,9 +319,19 @@ class RosterSheetData(SheetData):
             "grade": "3",
             "parents_info": "name\naddress\nemail\nphone\n"
         }
+        sort_attribute may also name an ordering of the index, e.g. family
         """
+        children = self.children_enriched
+        if not children:
+            return []
+        names = children
+        ordering = SORT_ORDERINGS.get(sort_attribute, sort_attribute)
+        if sort and ordering in ORDERINGS:
+            names = self.index.ordered(ordering)
+            sort = False
         result = []
-        for child_name, child_data in self.children_enriched.items():
+        for child_name in names:
+            child_data = children[child_name]
             result.append(
                 {
                     "student_name": child_name,
@@ -317,28 +369,20 @@ class RosterSheetData(SheetData):
 
 
 class DirectorySheetData(SheetData):
-    def __init__(self, sheet_id, header_range, data_range):
-        super().__init__(sheet_id, header_range, data_range)
-        self.children = {}
-        self.parents = {}
+    def __init__(self, sheet_id, header_range, data_range, values=None):
+        super().__init__(sheet_id, header_range, data_range, values)
+        self.store = RecordStore()
         self.converge_data()
 
+    @property
+    def children(self):
+        return self.store.children_view()
+
+    @property
+    def parents(self):
+        return self.store.parents_view()
+
+    @traced(category="sheets")
     def converge_data(self):
         """make a list of children with their data and their parent/guardian info"""
-        for item in self.data_structured:
-            logging.debug(f"item: {item}")
-            family = parse_family_from_item(item)
-            logging.debug(f"family: {family}")
-            for child_name, child_data in family["children"].items():
-                logging.debug(f"raw child: {child_name} {child_data}")
-                if child_name not in self.children:
-                    logging.debug("adding new child...")
-                    self.children[child_name] = child_data
-                else:
-                    logging.debug("updating existing child...")
-                    self.children[child_name].update(child_data)
-            for parent_name, parent_data in family["parents"].items():
-                if parent_name not in self.parents:
-                    self.parents[parent_name] = parent_data
-                else:
-                    self.parents[parent_name].update(parent_data)
+        store_families(self.store, self.decoder, self.data)
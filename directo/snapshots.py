@@ -0,0 +1,113 @@
+"""snapshots module
+
+local sqlite store of the raw value grids read from the sheets, keyed by
+(sheet_id, sheet_range), so repeated runs and offline runs read from disk.
+the grids hold families' names, addresses and phones in plain text, so
+directo only keeps them when a run opts in
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+from directo.sheets import read_sheets
+
+SNAPSHOT_PATH = os.environ.get(
+    "DIRECTO_SNAPSHOTS",
+    os.path.join(os.path.expanduser("~"), ".cache", "directo", "snapshots.sqlite3"),
+)
+
+
+class MissingSnapshotError(LookupError):
+    """an offline read of a range that was never snapshotted"""
+
+
+class SnapshotStore(object):
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " sheet_id TEXT NOT NULL,"
+                " sheet_range TEXT NOT NULL,"
+                " fetched REAL NOT NULL,"
+                " grid TEXT NOT NULL,"
+                " PRIMARY KEY (sheet_id, sheet_range))"
+            )
+        return self.connection
+
+    def get(self, sheet_id, sheet_range, max_age=None):
+        """the stored grid, or None if there is none younger than max_age
+        seconds; max_age None accepts any age"""
+        row = (
+            self.connect()
+            .execute(
+                "SELECT fetched, grid FROM snapshots"
+                " WHERE sheet_id = ? AND sheet_range = ?",
+                (sheet_id, sheet_range),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        fetched, grid = row
+        if max_age is not None and time.time() - fetched > max_age:
+            return None
+        return json.loads(grid)
+
+    def put_many(self, values_by_range, fetched=None):
+        """store {(sheet_id, sheet_range): values} in one transaction"""
+        fetched = time.time() if fetched is None else fetched
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                [
+                    (sheet_id, sheet_range, fetched, json.dumps(values))
+                    for (sheet_id, sheet_range), values in values_by_range.items()
+                ],
+            )
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def read_sheets_cached(ranges_by_sheet, store, max_age=0, offline=False):
+    """read_sheets answered from snapshots where they are fresh enough; a
+    spreadsheet with any range missing or stale is fetched whole, in one
+    batchGet, and stored. offline never fetches and accepts any age"""
+    result = {}
+    to_fetch = {}
+    for sheet_id, sheet_ranges in ranges_by_sheet.items():
+        cached = {
+            sheet_range: store.get(sheet_id, sheet_range, None if offline else max_age)
+            for sheet_range in sheet_ranges
+        }
+        if all(values is not None for values in cached.values()):
+            for sheet_range, values in cached.items():
+                result[(sheet_id, sheet_range)] = values
+        elif offline:
+            missing = [r for (r, values) in cached.items() if values is None]
+            raise MissingSnapshotError(
+                f"no snapshot of {sheet_id} {', '.join(missing)}"
+            )
+        else:
+            to_fetch[sheet_id] = sheet_ranges
+    if to_fetch:
+        fetched = read_sheets(to_fetch)
+        store.put_many(fetched)
+        result.update(fetched)
+    logging.debug(
+        "sheets from snapshots: %d ranges, fetched: %d",
+        len(result) - sum(len(r) for r in to_fetch.values()),
+        sum(len(r) for r in to_fetch.values()),
+    )
+    return result
@@ -0,0 +1,124 @@
+"""synthetic module
+
+seeded roster and directory value grids in the shape the sheets api returns,
+for benchmarks and offline runs
+
+    python -m directo.synthetic FIXTURE STUDENTS ROSTER_SHEET_ID DIRECTORY_SHEET_ID
+
+writes a fake transport fixture matching the ranges main() reads
+"""
+import json
+import random
+import sys
+
+FIRST_NAMES = [
+    "Alex", "Ana", "Ben", "Chloé", "Dana", "Eli", "Fatima", "Gus", "Hana",
+    "Ivan", "Jon", "Kai", "Lena", "Mateo", "Nia", "Omar", "Pia", "Quinn",
+    "Rosa", "Sam", "Tariq", "Uma", "Vera", "Wes", "Xin", "Yara", "Zoë",
+]  # fmt: skip
+LAST_NAMES = [
+    "Abbott", "Baker", "Castillo", "Dubois", "Eriksen", "Flores", "García",
+    "Huang", "Ito", "Jensen", "Kowalski", "López", "Müller", "Nguyen",
+    "O'Brien", "Patel", "Quintero", "Rossi", "Smith", "Tanaka", "Ueda",
+    "Vargas", "Williams", "Xu", "Young", "Zhang",
+]  # fmt: skip
+LANGUAGES = ["Spanish", "Mandarin", "English"]
+GRADES = ["0", "1", "2", "3", "4", "5"]
+
+ROSTER_HEADERS = ["name_last", "name_first", "grade", "teacher_hr", "language"]
+CHILD_COLUMNS = ["name_last", "name_first", "grade", "program", "teacher_hr"]
+PARENT_COLUMNS = [
+    "name_last",
+    "name_first",
+    "email",
+    "phone",
+    "address",
+    "city",
+    "state",
+    "zip",
+]
+DIRECTORY_HEADERS = (
+    [f"{c}_child_a" for c in CHILD_COLUMNS]
+    + [f"{c}_child_b" for c in CHILD_COLUMNS]
+    + [f"{c}_parent_guardian_a" for c in PARENT_COLUMNS]
+    + [f"{c}_parent_guardian_b" for c in PARENT_COLUMNS]
+)
+
+
+def make_name(rng, serial):
+    """names stay unique at any size by carrying a serial suffix"""
+    return rng.choice(LAST_NAMES) + f"-{serial}", rng.choice(FIRST_NAMES)
+
+
+def make_parent(rng, name_last, serial, present=True):
+    if not present:
+        return [""] * len(PARENT_COLUMNS)
+    name_first = rng.choice(FIRST_NAMES)
+    return [
+        name_last,
+        name_first,
+        f"{name_first.lower()}{serial}@example.com",
+        f"555-{serial % 10000:04d}" if rng.random() < 0.8 else "",
+        f"{rng.randint(1, 9999)} Main St",
+        "Portland",
+        "OR",
+        f"97{rng.randint(200, 299)}",
+    ]
+
+
+def generate(students, seed=0, teachers_per_class=1):
+    """returns (roster_values, directory_values) for about `students` children;
+    each value grid is [headers] + rows, and families have one or two children
+    and always a first parent/guardian"""
+    rng = random.Random(seed)
+    classes = [
+        (grade, language, f"Teacher {grade}{language[0]}{n}")
+        for grade in GRADES
+        for language in LANGUAGES
+        for n in range(teachers_per_class)
+    ]
+    roster = [ROSTER_HEADERS]
+    directory = [DIRECTORY_HEADERS]
+    serial = 0
+    while serial < students:
+        family_children = []
+        for _ in range(1 if rng.random() < 0.7 else 2):
+            name_last, name_first = make_name(rng, serial)
+            grade, language, teacher = rng.choice(classes)
+            roster.append([name_last, name_first, grade, teacher, language])
+            family_children.append(
+                [name_last, name_first, grade, language, teacher]
+            )
+            serial += 1
+        row = []
+        for child in family_children + [[""] * 5] * (2 - len(family_children)):
+            row.extend(child)
+        family_name = family_children[0][0]
+        row.extend(make_parent(rng, family_name, serial))
+        row.extend(
+            make_parent(rng, family_name, serial + 1, present=rng.random() < 0.7)
+        )
+        # the api trims trailing empty cells
+        while row and row[-1] == "":
+            row.pop()
+        directory.append(row)
+    return roster, directory
+
+
+def fixture(roster_sheet_id, directory_sheet_id, students, seed=0):
+    """spreadsheets for the fake transport: the roster on Sheet1!A1 and the
+    directory on working!E1, as main() expects"""
+    roster, directory = generate(students, seed)
+    return {
+        "spreadsheets": {
+            roster_sheet_id: {"Sheet1": roster},
+            directory_sheet_id: {"working": [[""] * 4 + row for row in directory]},
+        }
+    }
+
+
+if __name__ == "__main__":
+    path, students, roster_sheet_id, directory_sheet_id = sys.argv[1:5]
+    result = fixture(roster_sheet_id, directory_sheet_id, int(students))
+    with open(path, "w") as fixture_file:
+        json.dump(result, fixture_file)
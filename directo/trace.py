@@ -0,0 +1,191 @@
+"""trace module
+
+per-stage tracing and api call accounting, enabled by pointing DIRECTO_TRACE
+at an output file; when disabled every hook is a no-op
+
+the output is a chrome trace (chrome://tracing, perfetto) whose otherData
+holds the per-span summary that is also printed as a table on exit
+"""
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+from directo.transport import endpoint
+
+TRACE_PATH = os.environ.get("DIRECTO_TRACE")
+
+
+class Tracer(object):
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = path is not None
+        self.events = []
+        self.counters = defaultdict(int)
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def span(self, name, category="stage", **args):
+        if not self.enabled:
+            return nullcontext()
+        return self.record_span(name, category, args)
+
+    @contextmanager
+    def record_span(self, name, category, args):
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.add_event(name, category, start, time.perf_counter(), args)
+
+    def add_event(self, name, category, start, end, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args or {},
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def summary(self):
+        """per (category, name): calls, total/max seconds and byte totals"""
+        result = {}
+        for event in self.events:
+            key = f"{event['cat']}:{event['name']}"
+            row = result.setdefault(
+                key,
+                {
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "bytes_out": 0,
+                    "bytes_in": 0,
+                },
+            )
+            seconds = event["dur"] / 1e6
+            row["calls"] += 1
+            row["seconds"] += seconds
+            row["max_seconds"] = max(row["max_seconds"], seconds)
+            row["bytes_out"] += event["args"].get("request_bytes", 0)
+            row["bytes_in"] += event["args"].get("response_bytes", 0)
+        return result
+
+    def summary_table(self):
+        lines = [
+            f"{'span':48} {'calls':>7} {'total s':>9} {'max s':>8}"
+            f" {'out KiB':>9} {'in KiB':>9}"
+        ]
+        rows = sorted(self.summary().items(), key=lambda r: -r[1]["seconds"])
+        for key, row in rows:
+            lines.append(
+                f"{key[:48]:48} {row['calls']:7d} {row['seconds']:9.3f}"
+                f" {row['max_seconds']:8.3f} {row['bytes_out'] / 1024:9.1f}"
+                f" {row['bytes_in'] / 1024:9.1f}"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:48} {value:7d}")
+        return "\n".join(lines)
+
+    def finish(self):
+        """write the trace file and print the summary table"""
+        if not self.enabled:
+            return
+        with open(self.path, "w") as trace_file:
+            json.dump(
+                {
+                    "traceEvents": self.events,
+                    "otherData": {
+                        "summary": self.summary(),
+                        "counters": dict(self.counters),
+                    },
+                },
+                trace_file,
+            )
+        print(self.summary_table(), file=sys.stderr)
+
+
+TRACER = Tracer(TRACE_PATH)
+
+
+def traced(name=None, category="stage"):
+    """decorator recording a span per call, awaited calls included"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not TRACER.enabled:
+                    return await func(*args, **kwargs)
+                with TRACER.span(span_name, category):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with TRACER.span(span_name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_methods(category):
+    """class decorator tracing every public method defined on the class"""
+
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if callable(value) and not attr.startswith("_"):
+                setattr(cls, attr, traced(category=category)(value))
+        return cls
+
+    return decorator
+
+
+class TracingHttp(object):
+    """wraps the http object of an api service and records every call"""
+
+    def __init__(self, http):
+        self.http = http
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        start = time.perf_counter()
+        response, content = self.http.request(
+            uri, method=method, body=body, headers=headers, **kwargs
+        )
+        TRACER.add_event(
+            f"{method} {urlsplit(uri).netloc}{endpoint(uri)}",
+            "api",
+            start,
+            time.perf_counter(),
+            {
+                "status": response.status,
+                "request_bytes": len(body or b""),
+                "response_bytes": len(content or b""),
+            },
+        )
+        return response, content
@@ -0,0 +1,436 @@
+"""transport module
+
+pluggable http transport for every docs/sheets api call, selected with
+DIRECTO_TRANSPORT:
+
+    record:<cassette.jsonl>  call the live apis and record each exchange
+    replay:<cassette.jsonl>  answer calls from a recorded cassette
+    fake:<fixture.json>      answer calls from an in-process fake docs/sheets
+                             server seeded with sheet grids from a fixture
+
+the fake server can also be served over http for clients that do not go
+through googleapiclient, such as directo.aio:
+
+    python -m directo.transport FIXTURE [PORT]
+"""
+import copy
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from directo.model import DocumentModel, apply_field_mask, parse_field_mask
+
+TRANSPORT_SPEC = os.environ.get("DIRECTO_TRANSPORT")
+
+
+class TransportStats(object):
+    """api call counts and payload sizes per (method, endpoint)"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.request_bytes = defaultdict(int)
+        self.response_bytes = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, method, uri, body, content):
+        key = f"{method} {endpoint(uri)}"
+        with self.lock:
+            self.calls[key] += 1
+            self.request_bytes[key] += len(body or b"")
+            self.response_bytes[key] += len(content or b"")
+
+    def summary(self):
+        return {
+            key: {
+                "calls": self.calls[key],
+                "request_bytes": self.request_bytes[key],
+                "response_bytes": self.response_bytes[key],
+            }
+            for key in sorted(self.calls)
+        }
+
+
+def endpoint(uri):
+    """uri path with ids and ranges replaced, for grouping calls"""
+    path = urlsplit(uri).path
+    path = re.sub(r"/documents/[^/:]+", "/documents/{id}", path)
+    path = re.sub(r"/spreadsheets/[^/:]+", "/spreadsheets/{id}", path)
+    return re.sub(r"/values/[^/:]+", "/values/{range}", path)
+
+
+def as_bytes(body):
+    if body is None or isinstance(body, bytes):
+        return body
+    return body.encode()
+
+
+def normalized_query(uri):
+    parts = urlsplit(uri)
+    query = sorted(
+        (k, v) for (k, v) in parse_qs(parts.query).items() if k not in ("alt",)
+    )
+    return f"{parts.path}?{query}"
+
+
+def make_response(status, content, content_type="application/json"):
+    response = httplib2.Response(
+        {"status": str(status), "content-type": content_type}
+    )
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content)
+    return response, as_bytes(content)
+
+
+class RecordingHttp(object):
+    """wraps an http object and appends every exchange to a cassette; request
+    headers are never written, so tokens stay out of the file"""
+
+    def __init__(self, http, cassette_path, stats):
+        self.http = http
+        self.cassette_path = cassette_path
+        self.stats = stats
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        response, content = self.http.request(
+            uri, method=method, body=body, headers=headers, **kwargs
+        )
+        self.stats.add(method, uri, as_bytes(body), content)
+        exchange = {
+            "method": method,
+            "uri": uri,
+            "body": as_bytes(body).decode() if body else None,
+            "status": response.status,
+            "content_type": response.get("content-type", "application/json"),
+            "content": content.decode() if content else "",
+        }
+        with self.lock:
+            with open(self.cassette_path, "a") as cassette:
+                cassette.write(json.dumps(exchange) + "\n")
+        return response, content
+
+
+class ReplayHttp(object):
+    """answers requests from a cassette in recorded order per request key"""
+
+    redirect_codes = set()
+
+    def __init__(self, cassette_path, stats):
+        self.stats = stats
+        self.exchanges = defaultdict(deque)
+        self.lock = threading.Lock()
+        with open(cassette_path) as cassette:
+            for line in cassette:
+                exchange = json.loads(line)
+                key = self.key(exchange["method"], exchange["uri"])
+                self.exchanges[key].append(exchange)
+
+    def key(self, method, uri):
+        return (method, normalized_query(uri))
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        with self.lock:
+            recorded = self.exchanges.get(self.key(method, uri))
+            if not recorded:
+                raise KeyError(f"no recorded response for {method} {uri}")
+            exchange = recorded.popleft()
+        response, content = make_response(
+            exchange["status"], exchange["content"], exchange["content_type"]
+        )
+        self.stats.add(method, uri, as_bytes(body), content)
+        return response, content
+
+
+# fake server
+def column_number(letters):
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def parse_a1_range(sheet_range):
+    """'Tab!E2:AD' -> ('Tab', first_row, last_row, first_col, last_col), zero
+    based with open ends as None"""
+    tab_name, _, cells = sheet_range.rpartition("!")
+    start, _, end = cells.partition(":")
+    start_match = re.fullmatch(r"([A-Za-z]*)(\d*)", start)
+    end_match = re.fullmatch(r"([A-Za-z]*)(\d*)", end or start)
+    first_col = column_number(start_match.group(1) or "A") - 1
+    first_row = int(start_match.group(2) or 1) - 1
+    last_col = last_row = None
+    if end_match.group(1):
+        last_col = column_number(end_match.group(1)) - 1
+    if end_match.group(2):
+        last_row = int(end_match.group(2)) - 1
+    return tab_name or "Sheet1", first_row, last_row, first_col, last_col
+
+
+def slice_grid(grid, sheet_range):
+    """values of a range the way the api returns them, with trailing empty
+    cells and rows trimmed"""
+    _, first_row, last_row, first_col, last_col = parse_a1_range(sheet_range)
+    rows = grid[first_row : None if last_row is None else last_row + 1]
+    result = []
+    for row in rows:
+        cells = row[first_col : None if last_col is None else last_col + 1]
+        while cells and cells[-1] == "":
+            cells = cells[:-1]
+        result.append(list(cells))
+    while result and not result[-1]:
+        result.pop()
+    return result
+
+
+def empty_document(doc_id, title):
+    return {
+        "documentId": doc_id,
+        "title": title,
+        "revisionId": "0",
+        "body": {
+            "content": [
+                {"endIndex": 1, "sectionBreak": {"sectionStyle": {}}},
+                {
+                    "startIndex": 1,
+                    "endIndex": 2,
+                    "paragraph": {
+                        "elements": [
+                            {
+                                "startIndex": 1,
+                                "endIndex": 2,
+                                "textRun": {"content": "\n", "textStyle": {}},
+                            }
+                        ],
+                        "paragraphStyle": {},
+                    },
+                },
+            ]
+        },
+    }
+
+
+class FakeGoogleHttp(object):
+    """in-process stand-in for the docs and sheets apis; documents are kept
+    as DocumentModels so batchUpdate requests change them like the real api
+
+    fixture = {"spreadsheets": {sheet_id: {tab_name: [[cell, ...], ...]}}}
+    with each tab's grid starting at A1, and optionally "faults", a list of
+    inject() arguments as objects, to answer some calls with errors"""
+
+    redirect_codes = set()
+
+    def __init__(self, fixture, stats):
+        self.spreadsheets = fixture.get("spreadsheets", {})
+        self.documents = {}
+        self.stats = stats
+        self.doc_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.faults = []
+        for fault in fixture.get("faults", []):
+            self.inject(**fault)
+
+    def inject(self, pattern, status, times=1, applied=False):
+        """answer the next times calls whose "METHOD path" matches pattern
+        with an error status, as the api does when throttling (429) or
+        failing (5xx); applied calls take effect before the error, like a
+        batchUpdate whose response was lost"""
+        with self.lock:
+            self.faults.append(
+                {
+                    "pattern": pattern,
+                    "status": status,
+                    "times": times,
+                    "applied": applied,
+                }
+            )
+
+    def fault(self, method, path):
+        for fault in self.faults:
+            if fault["times"] > 0 and re.search(fault["pattern"], f"{method} {path}"):
+                fault["times"] -= 1
+                return fault
+        return None
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        parts = urlsplit(uri)
+        query = parse_qs(parts.query)
+        payload = json.loads(body) if body else {}
+        with self.lock:
+            fault = self.fault(method, unquote(parts.path))
+            try:
+                if fault is None or fault["applied"]:
+                    status, result = self.route(method, parts.path, query, payload)
+            except KeyError as e:
+                status, result = 404, {"error": {"code": 404, "message": str(e)}}
+            if fault is not None:
+                status = fault["status"]
+                result = {"error": {"code": status, "message": "injected fault"}}
+        if status == 200 and "fields" in query:
+            result = apply_field_mask(result, parse_field_mask(query["fields"][0])[0])
+        response, content = make_response(status, result)
+        self.stats.add(method, uri, as_bytes(body), content)
+        return response, content
+
+    def route(self, method, path, query, payload):
+        path = unquote(path)
+        if path == "/v1/documents" and method == "POST":
+            doc_id = f"fake-doc-{next(self.doc_ids)}"
+            self.documents[doc_id] = DocumentModel(
+                empty_document(doc_id, payload.get("title", ""))
+            )
+            return 200, copy.deepcopy(self.documents[doc_id].doc_json)
+        match = re.fullmatch(r"/v1/documents/([^/:]+)(:batchUpdate)?", path)
+        if match:
+            model = self.documents[match.group(1)]
+            if match.group(2):
+                required = payload.get("writeControl", {}).get("requiredRevisionId")
+                if required is not None and required != model.doc_json["revisionId"]:
+                    return 400, {
+                        "error": {
+                            "code": 400,
+                            "message": f"required revision {required} is not "
+                            f"the latest, {model.doc_json['revisionId']}",
+                        }
+                    }
+                return 200, self.batch_update(model, payload["requests"])
+            return 200, copy.deepcopy(model.doc_json)
+        match = re.fullmatch(r"/v4/spreadsheets/([^/]+)/values:batchGet", path)
+        if match:
+            return 200, {
+                "spreadsheetId": match.group(1),
+                "valueRanges": [
+                    self.value_range(match.group(1), sheet_range)
+                    for sheet_range in query.get("ranges", [])
+                ],
+            }
+        match = re.fullmatch(r"/v4/spreadsheets/([^/]+)/values/(.+)", path)
+        if match:
+            return 200, self.value_range(match.group(1), match.group(2))
+        match = re.fullmatch(r"/v4/spreadsheets/([^/:]+)", path)
+        if match:
+            return 200, self.spreadsheet(match.group(1))
+        return 404, {"error": {"code": 404, "message": f"{method} {path}"}}
+
+    def batch_update(self, model, requests):
+        for request in requests:
+            model.apply(request)
+        if model.stale:
+            logging.debug("fake server ignored requests it does not model")
+            model.stale = False
+        revision = str(int(model.doc_json.get("revisionId", "0")) + 1)
+        model.doc_json["revisionId"] = revision
+        return {
+            "documentId": model.doc_json["documentId"],
+            "replies": [{} for _ in requests],
+            "writeControl": {"requiredRevisionId": revision},
+        }
+
+    def spreadsheet(self, sheet_id):
+        return {
+            "spreadsheetId": sheet_id,
+            "sheets": [
+                {
+                    "properties": {
+                        "title": tab_name,
+                        "gridProperties": {
+                            "rowCount": len(grid),
+                            "columnCount": max(map(len, grid), default=0),
+                        },
+                    }
+                }
+                for tab_name, grid in self.spreadsheets[sheet_id].items()
+            ],
+        }
+
+    def value_range(self, sheet_id, sheet_range):
+        tab_name = parse_a1_range(sheet_range)[0]
+        grid = self.spreadsheets[sheet_id][tab_name]
+        result = {"range": sheet_range, "majorDimension": "ROWS"}
+        values = slice_grid(grid, sheet_range)
+        if values:
+            result["values"] = values
+        return result
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    """answers http requests from the server's FakeGoogleHttp"""
+
+    def handle_fake(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        response, content = self.server.fake.request(
+            self.path, method=self.command, body=body
+        )
+        self.send_response(response.status)
+        self.send_header("Content-Type", response["content-type"])
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = handle_fake
+    do_POST = handle_fake
+
+    def log_message(self, format, *args):
+        logging.debug("fake server: " + format, *args)
+
+
+def fake_server(fixture_path, host="127.0.0.1", port=0):
+    """an http server answering from a FakeGoogleHttp; port 0 picks a free
+    port, read it back from server.server_address"""
+    server = ThreadingHTTPServer((host, port), FakeGoogleHandler)
+    with open(fixture_path) as fixture:
+        server.fake = FakeGoogleHttp(json.load(fixture), TransportStats())
+    return server
+
+
+class Transport(object):
+    """builds the http object handed to googleapiclient for one mode"""
+
+    def __init__(self, mode, path):
+        self.mode = mode
+        self.path = path
+        self.stats = TransportStats()
+        self.needs_credentials = mode == "record"
+        self.shared_http = None
+        if mode == "replay":
+            self.shared_http = ReplayHttp(path, self.stats)
+        elif mode == "fake":
+            with open(path) as fixture:
+                self.shared_http = FakeGoogleHttp(json.load(fixture), self.stats)
+        elif mode != "record":
+            raise ValueError(f"unknown transport mode: {mode}")
+
+    def http(self, creds=None):
+        if self.shared_http is not None:
+            return self.shared_http
+        return AuthorizedHttp(
+            creds, http=RecordingHttp(httplib2.Http(), self.path, self.stats)
+        )
+
+
+def parse_transport_spec(spec):
+    mode, _, path = spec.partition(":")
+    return Transport(mode, path)
+
+
+TRANSPORT = parse_transport_spec(TRANSPORT_SPEC) if TRANSPORT_SPEC else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python -m directo.transport FIXTURE [PORT]")
+    server = fake_server(sys.argv[1], port=int(sys.argv[2:3] and sys.argv[2] or 0))
+    host, port = server.server_address[:2]
+    print(f"serving on http://{host}:{port}", flush=True)
+    server.serve_forever()
@@ -15,5 +15,11 @@ setup(
         "google-auth-oauthlib",
         "jinja2",
     ],
-    entry_points={"console_scripts": ["directo=directo.main:main"]},
+    extras_require={"async": ["aiohttp"], "locale": ["PyICU"]},
+    entry_points={
+        "console_scripts": [
+            "directo=directo.main:main",
+            "directo-batch=directo.batch:main",
+        ]
+    },
 )
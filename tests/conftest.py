@@ -0,0 +1,33 @@
+import json
+import os
+import pytest
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "school.json")
+# the transport is chosen when directo.transport is first imported
+os.environ["DIRECTO_TRANSPORT"] = f"fake:{FIXTURE_PATH}"
+
+from directo.clients import REGISTRY  # noqa: E402
+from directo.scheduler import DOCS_SCHEDULER, TokenBucket  # noqa: E402
+from directo.transport import FakeGoogleHttp, TransportStats  # noqa: E402
+
+ROSTER_SHEET_ID = "roster"
+DIRECTORY_SHEET_ID = "directory"
+
+
+@pytest.fixture
+def fake():
+    """a fresh fake docs and sheets api, seeded from the school fixture"""
+    with open(FIXTURE_PATH) as fixture:
+        http = FakeGoogleHttp(json.load(fixture), TransportStats())
+    REGISTRY.transport.shared_http = http
+    REGISTRY.clear()
+    yield http
+    REGISTRY.clear()
+
+
+@pytest.fixture(autouse=True)
+def unpaced(monkeypatch):
+    """no quota pacing and millisecond backoff"""
+    monkeypatch.setattr(DOCS_SCHEDULER, "bucket", TokenBucket(10**7))
+    monkeypatch.setattr(DOCS_SCHEDULER, "backoff_base", 0.001)
+    monkeypatch.setattr(DOCS_SCHEDULER, "retries", 0)
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from conftest import FIXTURE_PATH, ROSTER_SHEET_ID  # noqa: E402
+from directo.aio import AsyncClient, AsyncDirectoryDoc, SyncClient  # noqa: E402
+from directo.docs import BOLD_STYLE, DirectoryDoc, get_doc_json  # noqa: E402
+from directo.scheduler import DOCS_SCHEDULER  # noqa: E402
+from directo.sheets import batch_read_sheet_ranges, read_sheet_range  # noqa: E402
+from directo.transport import fake_server  # noqa: E402
+
+ROWS = [(f"Student {n}\n\n", f"Parent {n}\naddress {n}\n") for n in range(30)]
+RANGES = ["Sheet1!A1:E1", "Sheet1!A2:E20"]
+
+
+@pytest.fixture
+def server():
+    """the fake apis served over http, with the base url to reach them"""
+    server = fake_server(FIXTURE_PATH)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    server.url = f"http://{host}:{port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def run(coroutine_function, url):
+    """await coroutine_function(client) on a client of url"""
+
+    async def main():
+        async with AsyncClient(api_url=url) as client:
+            return await coroutine_function(client)
+
+    return asyncio.run(main())
+
+
+async def build(client, title):
+    doc = AsyncDirectoryDoc(client)
+    await doc.new(title)
+    await doc.build_tables([ROWS], 2, font_size=9)
+    return doc, await doc.checkpoint()
+
+
+def test_sheet_reads_match_the_sync_client(fake, server):
+    async def read(client):
+        return (
+            await client.read_sheet_range(ROSTER_SHEET_ID, RANGES[0]),
+            await client.batch_read_sheet_ranges(ROSTER_SHEET_ID, RANGES),
+        )
+
+    values, grids = run(read, server.url)
+    assert values == read_sheet_range(ROSTER_SHEET_ID, RANGES[0])
+    assert grids == batch_read_sheet_ranges(ROSTER_SHEET_ID, RANGES)
+    assert len(grids[1]) == 19
+
+
+def test_build_matches_the_sync_build(fake, server):
+    expected = DirectoryDoc()
+    expected.new("expected")
+    expected.build_tables([ROWS], 2, font_size=9)
+
+    async def built(client):
+        doc, matched = await build(client, "async")
+        return await client.get_doc_json(doc.doc_id), matched
+
+    doc_json, matched = run(built, server.url)
+    assert matched
+    assert doc_json["body"] == get_doc_json(expected.doc_id)["body"]
+
+
+def test_chunk_applied_before_a_lost_response_is_not_sent_twice(server):
+    async def built(client, title):
+        doc, matched = await build(client, title)
+        return (await client.get_doc_json(doc.doc_id))["body"], matched
+
+    expected, _ = run(lambda client: built(client, "expected"), server.url)
+    server.fake.inject(r":batchUpdate$", 503, times=3, applied=True)
+    body, matched = run(lambda client: built(client, "lost responses"), server.url)
+    assert DOCS_SCHEDULER.retries == 3
+    assert matched
+    assert body == expected
+
+
+def test_sync_client_keeps_its_loop_between_calls(server):
+    client = SyncClient(api_url=server.url)
+    try:
+        doc_id = client.create_doc({"title": "sync", "body": {}})
+        revision = client.get_doc_json(doc_id, "revision")["revisionId"]
+        (response,) = client.batch_update_doc(
+            doc_id, [{"insertText": {"text": "x", "location": {"index": 1}}}]
+        )
+        assert response["writeControl"]["requiredRevisionId"] != revision
+    finally:
+        client.close()
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_streamed_fill_matches_the_sync_stream(fake, server):
+    expected = DirectoryDoc()
+    expected.new("expected")
+    expected.new_table(2)
+    expected.stream_table_with_data(iter(ROWS), BOLD_STYLE)
+
+    async def streamed(client):
+        doc = AsyncDirectoryDoc(client)
+        await doc.new("async")
+        await doc.new_table(2)
+        await doc.stream_table_with_data(iter(ROWS), BOLD_STYLE)
+        return await client.get_doc_json(doc.doc_id), await doc.checkpoint()
+
+    doc_json, matched = run(streamed, server.url)
+    assert matched
+    assert len(doc_json["body"]["content"][-2]["table"]["tableRows"]) == 15
+    assert doc_json["body"] == get_doc_json(expected.doc_id)["body"]
+
+
+def test_fill_styles_first_lines_like_the_sync_fill(fake, server):
+    expected = DirectoryDoc()
+    expected.new("expected")
+    expected.new_table(2)
+    expected.fill_table_with_data(ROWS, BOLD_STYLE)
+
+    async def filled(client):
+        doc = AsyncDirectoryDoc(client)
+        await doc.new("async")
+        await doc.new_table(2)
+        await doc.fill_table_with_data(ROWS, BOLD_STYLE)
+        return await client.get_doc_json(doc.doc_id)
+
+    assert run(filled, server.url)["body"] == get_doc_json(expected.doc_id)["body"]
@@ -0,0 +1,119 @@
+import datetime
+import json
+import os
+import threading
+import time
+import pytest
+from google.oauth2.credentials import Credentials
+from directo.auth import SCOPES_RW, CredentialManager, utcnow
+
+
+class CountingRefresh(object):
+    """stands in for Credentials.refresh, each call taking a round trip's
+    time to hand out the next token, valid for expires_in"""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.expires_in = datetime.timedelta(hours=1)
+
+    def __call__(self, creds, request):
+        time.sleep(0.05)
+        with self.lock:
+            self.calls += 1
+            creds.token = f"token-{self.calls}"
+        creds.expiry = utcnow() + self.expires_in
+
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    refresh = CountingRefresh()
+    monkeypatch.setattr(
+        Credentials, "refresh", lambda creds, request: refresh(creds, request)
+    )
+    return refresh
+
+
+def store_token(path, token="token-0", expiry=None):
+    expiry = expiry or utcnow() - datetime.timedelta(minutes=1)
+    with open(path, "w") as token_file:
+        json.dump(
+            {
+                "token": token,
+                "refresh_token": "refresh",
+                "client_id": "client",
+                "client_secret": "secret",
+                "token_uri": "https://oauth2.googleapis.com/token",
+                "scopes": SCOPES_RW,
+                "expiry": expiry.isoformat() + "Z",
+            },
+            token_file,
+        )
+
+
+def stored_token(path):
+    with open(path) as token_file:
+        return json.load(token_file)["token"]
+
+
+def test_managers_sharing_a_token_file_refresh_it_once(tmp_path, refreshes):
+    path = str(tmp_path / "token.json")
+    store_token(path)
+    managers = [CredentialManager(path) for _ in range(2)]
+    held = [manager.stored_creds(SCOPES_RW) for manager in managers]
+    barrier = threading.Barrier(2)
+
+    def refresh(manager, creds):
+        barrier.wait()
+        manager.refresh(creds, SCOPES_RW)
+
+    threads = [
+        threading.Thread(target=refresh, args=pair) for pair in zip(managers, held)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # the second manager adopted what the first wrote under the lock
+    assert refreshes.calls == 1
+    assert [creds.token for creds in held] == ["token-1", "token-1"]
+    assert stored_token(path) == "token-1"
+
+
+def test_token_file_is_replaced_only_when_it_changed(tmp_path, refreshes):
+    path = str(tmp_path / "token.json")
+    store_token(path)
+    manager = CredentialManager(path)
+    creds = manager.stored_creds(SCOPES_RW)
+    inode = os.stat(path).st_ino
+    manager.refresh(creds, SCOPES_RW)
+    # a new file renamed over the old one, never a partly written token
+    assert os.stat(path).st_ino != inode
+    assert stored_token(path) == "token-1"
+    inode = os.stat(path).st_ino
+    with manager.file_lock():
+        manager.write(creds)
+    assert os.stat(path).st_ino == inode
+    assert sorted(os.listdir(tmp_path)) == ["token.json", "token.json.lock"]
+
+
+def test_background_thread_refreshes_ahead_of_expiry(tmp_path, refreshes):
+    path = str(tmp_path / "token.json")
+    store_token(path)
+    manager = CredentialManager(path, refresh_margin=2)
+    # the first token is due again a second after it is handed out
+    refreshes.expires_in = datetime.timedelta(seconds=3)
+    try:
+        creds = manager.get(SCOPES_RW)
+        assert creds.token == "token-1"
+        refreshes.expires_in = datetime.timedelta(hours=1)
+        deadline = time.monotonic() + 10
+        while refreshes.calls < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        manager.stop()
+    assert refreshes.calls == 2
+    # refreshed in place, so clients holding creds use the new token
+    assert creds.token == "token-2"
+    assert stored_token(path) == "token-2"
+    assert manager.thread.daemon
@@ -0,0 +1,21 @@
+import pytest
+from conftest import DIRECTORY_SHEET_ID, ROSTER_SHEET_ID
+from directo.batch import run_job
+from directo.scheduler import DOCS_SCHEDULER
+
+SHARE = 10**6
+
+
+@pytest.mark.parametrize(
+    "job_rate, rate", [(None, SHARE), (SHARE // 2, SHARE // 2), (SHARE * 4, SHARE)]
+)
+def test_job_rate_never_exceeds_its_share(fake, job_rate, rate):
+    job = {
+        "name": "north",
+        "roster_sheet_id": ROSTER_SHEET_ID,
+        "directory_sheet_id": DIRECTORY_SHEET_ID,
+    }
+    if job_rate is not None:
+        job["requests_per_minute"] = job_rate
+    assert run_job(job, SHARE)["status"] == "ok"
+    assert DOCS_SCHEDULER.bucket.rate == rate / 60.0
@@ -0,0 +1,75 @@
+"""the table fill against docs api responses replayed from a cassette, rather
+than against the fake server, which applies requests with the same
+DocumentModel the planner uses
+
+tests/fixtures/table_fill.jsonl follows the documented response shape of the
+docs api, style fields included; record it afresh against a live document
+with
+
+    rm tests/fixtures/table_fill.jsonl
+    DIRECTO_TRANSPORT=record:tests/fixtures/table_fill.jsonl \\
+        python tests/test_cassette.py
+"""
+import os
+import pytest
+from directo.clients import REGISTRY
+from directo.diff import table_rows_text
+from directo.docs import BOLD_STYLE, DirectoryDoc, get_doc_json, last_table_index
+from directo.model import skeleton
+from directo.transport import ReplayHttp, TransportStats
+
+CASSETTE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "table_fill.jsonl")
+GROUPS = [
+    ("Abbott, Wes - K\n\n", "Ana Abbott\n1 Elm St\n"),
+    ("García, Zoë - 3\n\n", "Marta García 😀\n2 Oak Ave\n"),
+    ("O'Brien, Kai - 5\n\n", "\n"),
+]
+
+
+def fill():
+    """insertTable, then insertTableRow and the fill in one batchUpdate;
+    returns the local document and the document the api returned"""
+    doc = DirectoryDoc()
+    doc.new("table fill")
+    doc.new_table(2)
+    doc.fill_table_with_data(GROUPS, BOLD_STYLE)
+    return doc, get_doc_json(doc.doc_id)
+
+
+@pytest.fixture
+def replayed():
+    REGISTRY.transport.shared_http = ReplayHttp(CASSETTE_PATH, TransportStats())
+    REGISTRY.clear()
+    yield
+    REGISTRY.clear()
+
+
+def bold_ranges(table):
+    return [
+        (run["startIndex"], run["endIndex"])
+        for row in table["tableRows"]
+        for cell in row["tableCells"]
+        for paragraph in cell["content"]
+        for run in paragraph["paragraph"]["elements"]
+        if run["textRun"].get("textStyle", {}).get("bold")
+    ]
+
+
+def test_planned_fill_matches_the_recorded_document(replayed):
+    doc, recorded = fill()
+    # every index the planner assumed is where the api put the content
+    assert skeleton(recorded) == skeleton(doc.doc_json)
+    table = recorded["body"]["content"][last_table_index(recorded)]["table"]
+    assert table["rows"] == 2
+    assert table_rows_text(table) == table_rows_text(doc.active_table_json)
+    assert table_rows_text(table)[1] == ("O'Brien, Kai - 5\n\n\n\n", "\n\n")
+    # the bold ranges sent were each cell's first line in the api's indexes
+    assert bold_ranges(table) == [
+        (cell["content"][0]["startIndex"], cell["content"][0]["endIndex"])
+        for row in doc.active_table_json["tableRows"]
+        for cell in row["tableCells"]
+    ]
+
+
+if __name__ == "__main__":
+    print(fill()[0].doc_id)
@@ -0,0 +1,14 @@
+import httplib2
+from google.auth.credentials import AnonymousCredentials
+from directo.clients import ClientRegistry
+
+
+def test_services_build_without_the_network(monkeypatch):
+    def offline(*args, **kwargs):
+        raise AssertionError("no request expected")
+
+    monkeypatch.setattr(httplib2.Http, "request", offline)
+    registry = ClientRegistry(transport=None)
+    docs = registry.build("docs", "v1", AnonymousCredentials())
+    sheets = registry.build("sheets", "v4", AnonymousCredentials())
+    assert hasattr(docs, "documents") and hasattr(sheets, "spreadsheets")
@@ -0,0 +1,80 @@
+import pytest
+from directo.diff import data_cells, plan_tables_update, table_rows_text, update_doc
+from directo.docs import DirectoryDoc, get_doc_json
+
+FIRST = [
+    ("Abbott, Wes - K\n\n", "Ana Abbott\n1 Elm St\n"),
+    ("Baker, Lu - 1\n\n", "Sam Baker\n3 Pine Rd\n"),
+    ("García, Zoë - 3\n\n", "Marta García 😀\n2 Oak Ave\n"),
+    ("O'Brien, Kai - 5\n\n", "\n"),
+    ("Young, Ida - 2\n\n", "Jo Young\n9 Ash Ct\n"),
+]
+SECOND = [
+    ("Chen, Mo - 4\n\n", "Li Chen\n7 Birch Ln\n"),
+    ("Diaz, Ray - K\n\n", "Eva Diaz\n5 Fir Way\n"),
+]
+
+
+def built(tables_data):
+    doc = DirectoryDoc()
+    doc.new("directory")
+    doc.build_tables(tables_data, 2)
+    return doc
+
+
+def tables_text(doc_json, count):
+    tables = [e["table"] for e in doc_json["body"]["content"] if "table" in e]
+    return [table_rows_text(table) for table in tables[-count:]]
+
+
+def tables_cells(doc_json, count):
+    return [
+        [cell for row in rows for cell in data_cells(row)]
+        for rows in tables_text(doc_json, count)
+    ]
+
+
+def expected_cells(tables_data):
+    return [
+        ["".join(group) + "\n" for group in data if "".join(group)]
+        for data in tables_data
+    ]
+
+
+def test_unchanged_data_plans_nothing(fake):
+    doc = built([FIRST, SECOND])
+    requests, counts = plan_tables_update(doc.doc_json, [FIRST, SECOND], 2)
+    assert requests == []
+    assert counts == {"kept": 4, "replaced": 0, "inserted": 0, "deleted": 0}
+
+
+def test_replaced_cell_matches_a_fresh_build(fake):
+    changed = list(FIRST)
+    changed[2] = ("García, Zoë - 4\n\n", "Marta García 😀\n2 Oak Ave\n")
+    doc = built([FIRST, SECOND])
+    counts = update_doc(doc, [changed, SECOND], 2)
+    assert counts == {"kept": 3, "replaced": 1, "inserted": 0, "deleted": 0}
+    assert doc.checkpoint()
+    fresh = built([changed, SECOND])
+    assert tables_text(get_doc_json(doc.doc_id), 2) == tables_text(
+        fresh.doc_json, 2
+    )
+
+
+def test_inserted_and_removed_families_match_a_fresh_build(fake):
+    changed = FIRST[:1] + [("Adams, Bo - 1\n\n", "Cy Adams\n4 Elm St\n")] + FIRST[2:]
+    doc = built([FIRST, SECOND])
+    counts = update_doc(doc, [changed, SECOND[1:]], 2)
+    assert counts["deleted"] + counts["replaced"] > 0
+    assert doc.checkpoint()
+    fresh = built([changed, SECOND[1:]])
+    assert tables_cells(get_doc_json(doc.doc_id), 2) == tables_cells(
+        fresh.doc_json, 2
+    )
+    assert tables_cells(fresh.doc_json, 2) == expected_cells([changed, SECOND[1:]])
+
+
+def test_update_needs_enough_tables(fake):
+    doc = built([FIRST])
+    with pytest.raises(ValueError, match="1 tables, 2 needed"):
+        plan_tables_update(doc.doc_json, [FIRST, SECOND], 2)
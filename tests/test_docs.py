@@ -0,0 +1,103 @@
+from directo.diff import table_rows_text
+from directo.docs import (
+    BOLD_STYLE,
+    DirectoryDoc,
+    get_doc_json,
+    group_cell_data_items,
+    insert_table_request,
+    last_table_index,
+    plan_table_fill,
+)
+from directo.model import DocumentModel, utf16_len
+from directo.transport import empty_document
+
+GROUPS = [
+    ("Abbott, Wes - K\n\n", "Ana Abbott\n1 Elm St\n"),
+    ("García, Zoë - 3\n\n", "Marta García 😀\n2 Oak Ave\n"),
+    ("O'Brien, Kai - 5\n\n", "\n"),
+]
+
+
+def table_index(model):
+    return last_table_index(model.doc_json)
+
+
+def filled_model(groups, columns=2, first_line_style=None):
+    model = DocumentModel(empty_document("doc", "test"))
+    model.apply(insert_table_request(rows=1, columns=columns))
+    table = model.content[last_table_index(model.doc_json)]
+    rows = list(group_cell_data_items(groups, columns))
+    requests = plan_table_fill(
+        table["table"], table["startIndex"], rows, first_line_style
+    )
+    model.apply_all(requests)
+    return model, requests
+
+
+def test_plan_table_fill_cell_contents():
+    model, _ = filled_model(GROUPS)
+    table = model.content[last_table_index(model.doc_json)]["table"]
+    # each cell keeps its own closing newline after the inserted text
+    assert table_rows_text(table) == [
+        ("".join(GROUPS[0]) + "\n", "".join(GROUPS[1]) + "\n"),
+        ("".join(GROUPS[2]) + "\n", "\n\n"),
+    ]
+
+
+def test_plan_table_fill_appends_a_row_per_further_row_of_data():
+    _, requests = filled_model(GROUPS, columns=2)
+    kinds = [next(iter(request)) for request in requests]
+    # the short last row is padded with a newline cell
+    assert kinds == [
+        "insertText",
+        "insertText",
+        "insertTableRow",
+        "insertText",
+        "insertText",
+    ]
+    _, requests = filled_model([], columns=2)
+    assert requests == []
+
+
+def test_plan_table_fill_skips_empty_cells():
+    model = DocumentModel(empty_document("doc", "test"))
+    model.apply(insert_table_request(rows=1, columns=2))
+    table = model.content[last_table_index(model.doc_json)]
+    requests = plan_table_fill(
+        table["table"], table["startIndex"], [[("",), ("x\n",)]]
+    )
+    assert [request["insertText"]["text"] for request in requests] == ["x\n"]
+    model.apply_all(requests)
+    assert table_rows_text(model.content[table_index(model)]["table"]) == [
+        ("\n", "x\n\n")
+    ]
+
+
+def test_plan_table_fill_styles_first_lines():
+    model, requests = filled_model(GROUPS, first_line_style=BOLD_STYLE)
+    styled = [
+        request["updateTextStyle"]["range"]
+        for request in requests
+        if "updateTextStyle" in request
+    ]
+    inserted = [
+        request["insertText"] for request in requests if "insertText" in request
+    ]
+    assert len(styled) == len(inserted)
+    for text_range, insert in zip(styled, inserted):
+        first_line = insert["text"].split("\n")[0] + "\n"
+        assert text_range["startIndex"] == insert["location"]["index"]
+        assert text_range["endIndex"] - text_range["startIndex"] == utf16_len(
+            first_line
+        )
+    assert not model.stale
+
+
+def test_planned_fill_matches_the_server(fake):
+    doc = DirectoryDoc()
+    doc.new("directory")
+    doc.new_table(2)
+    doc.fill_table_with_data(GROUPS, BOLD_STYLE)
+    assert doc.checkpoint()
+    table = get_doc_json(doc.doc_id)["body"]["content"][-2]["table"]
+    assert table_rows_text(table) == table_rows_text(doc.active_table_json)
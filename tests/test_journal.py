@@ -0,0 +1,141 @@
+import os
+import pytest
+from googleapiclient.errors import HttpError
+import directo.journal
+import directo.main
+from conftest import DIRECTORY_SHEET_ID, ROSTER_SHEET_ID
+from directo.docs import get_doc_json
+from directo.journal import JournalError, Journals
+from directo.pipeline import stream_doc
+from directo.scheduler import DOCS_SCHEDULER
+
+GROUPS = [(f"Student {n}\n\n", f"Parent {n}\naddress {n}\n") for n in range(12)]
+TITLE = "student directory"
+
+
+@pytest.fixture
+def chunks(monkeypatch):
+    """small chunks, and a count of the chunks journals send"""
+    monkeypatch.setattr(DOCS_SCHEDULER, "max_count", 4)
+    sent = []
+    send = directo.journal.batch_update_doc
+
+    def counted(doc_id, chunk, **kwargs):
+        sent.append(chunk)
+        return send(doc_id, chunk, **kwargs)
+
+    monkeypatch.setattr(directo.journal, "batch_update_doc", counted)
+    return sent
+
+
+def build(directory, resume=False, groups=GROUPS):
+    journals = Journals(str(directory), resume)
+    _, rows = journals.add_sheet(["name", "family"], groups)
+    return stream_doc(TITLE, rows, journals=journals)
+
+
+def failed_build(fake, chunks, directory, sequence, applied=False):
+    """a journaled build failing on chunk sequence, after it landed if
+    applied"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(DOCS_SCHEDULER, "max_retries", 0)
+        counted = directo.journal.batch_update_doc
+
+        def failing(doc_id, chunk, **kwargs):
+            if len(chunks) == sequence:
+                fake.inject(r":batchUpdate$", 503, applied=applied)
+            return counted(doc_id, chunk, **kwargs)
+
+        patch.setattr(directo.journal, "batch_update_doc", failing)
+        with pytest.raises(HttpError):
+            build(directory)
+
+
+@pytest.mark.parametrize("applied", [False, True])
+@pytest.mark.parametrize("sequence", [0, 2, 5])
+def test_resume_sends_only_what_did_not_land(
+    fake, chunks, tmp_path, sequence, applied
+):
+    expected = get_doc_json(build(tmp_path / "clean"))["body"]
+    total = len(chunks)
+    assert total > 5
+    chunks.clear()
+
+    failed_build(fake, chunks, tmp_path, sequence, applied)
+    assert len(chunks) == sequence + 1
+    chunks.clear()
+
+    doc_id = build(tmp_path, resume=True)
+    # the failed chunk is sent again only if it did not land
+    assert len(chunks) == total - sequence - applied
+    assert get_doc_json(doc_id)["body"] == expected
+
+
+def test_finished_run_is_not_built_again(fake, chunks, tmp_path):
+    doc_id = build(tmp_path)
+    chunks.clear()
+    assert build(tmp_path, resume=True) == doc_id
+    assert chunks == []
+
+
+def test_other_sheet_data_is_built_anew(fake, chunks, tmp_path):
+    doc_id = build(tmp_path)
+    other = build(tmp_path, resume=True, groups=GROUPS[1:])
+    assert other != doc_id
+    with open(tmp_path / "student_directory.jsonl") as journal:
+        assert '"finish":"' + other in journal.read()
+
+
+def test_nothing_to_resume_builds_anew(fake, chunks, tmp_path):
+    expected = get_doc_json(build(tmp_path / "clean"))["body"]
+    assert get_doc_json(build(tmp_path, resume=True))["body"] == expected
+
+
+def test_journal_keeps_no_family_details(fake, chunks, tmp_path):
+    failed_build(fake, chunks, tmp_path, 3)
+    with open(tmp_path / "student_directory.jsonl") as journal:
+        text = journal.read()
+    assert '"chunk":3' in text
+    assert "Parent" not in text and "Student" not in text
+
+
+@pytest.mark.parametrize(
+    "argv, journaled",
+    [([], False), (["--resume"], True), (["--journal-dir", "{tmp}"], True)],
+)
+def test_runs_journal_only_when_asked(fake, tmp_path, monkeypatch, argv, journaled):
+    monkeypatch.setattr(directo.main, "JOURNAL_DIR", str(tmp_path))
+    argv = [arg.format(tmp=tmp_path) for arg in argv]
+    directo.main.run(
+        directo.main.parse_args(["directory"] + argv),
+        roster_sheet_id=ROSTER_SHEET_ID,
+        directory_sheet_id=DIRECTORY_SHEET_ID,
+    )
+    assert os.path.exists(tmp_path / "student_directory.jsonl") == journaled
+
+
+def test_a_sheet_read_up_front_identifies_the_run_like_a_lazy_one(tmp_path):
+    lazy = Journals(str(tmp_path))
+    _, rows = lazy.add_sheet(["name", "family"], iter(GROUPS))
+    list(rows)
+    read = Journals(str(tmp_path))
+    read.add_read_sheet(["name", "family"], GROUPS)
+    assert read.open(TITLE).run == lazy.open(TITLE).run
+    other = Journals(str(tmp_path))
+    other.add_read_sheet(["name", "family"], GROUPS[1:])
+    assert other.open(TITLE).run != read.open(TITLE).run
+
+
+def test_rejected_journaled_revision_is_a_journal_error(fake, chunks, tmp_path):
+    failed_build(fake, chunks, tmp_path, 2)
+    # as the api answers a revision id that expired
+    fake.inject(r":batchUpdate$", 400)
+    with pytest.raises(JournalError, match="journaled revision"):
+        build(tmp_path, resume=True)
+
+
+def test_deleted_journaled_document_is_a_journal_error(fake, chunks, tmp_path):
+    failed_build(fake, chunks, tmp_path, 2)
+    fake.inject(r"^GET /v1/documents/", 404)
+    with pytest.raises(JournalError, match="no longer exists"):
+        build(tmp_path, resume=True)
@@ -0,0 +1,124 @@
+import os
+import subprocess
+import sys
+import pytest
+import directo.ordering
+from directo.ordering import OrderedIndex
+from directo.records import RecordStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHILDREN = [
+    ("López, Ana", "0", "Ms. Smith", "Spanish"),
+    ("Lopez, Ana", "0", "Ms. smith", "Spanish"),
+    ("lopez, ana", "0", "Ms. Smith", "Spanish"),
+    ("de la Cruz, Bo", "3", "Mr. Ángel", "English"),
+    ("Dunn, Cy", "3", "Mr. Angel", "English"),
+    ("Adams, Di", "3", "Mr. Angel", "Spanish"),
+    ("Zed, Eli", "5", "Ms. Wu", "English"),
+    ("Baker, Flo", "10", "Ms. Wu", "English"),
+]
+
+
+def index(children=CHILDREN):
+    store = RecordStore()
+    for name, grade, teacher, language in children:
+        store.add_child(
+            name, {"grade": grade, "teacher_hr": teacher, "language": language}
+        )
+    return OrderedIndex(store)
+
+
+def test_names_tie_on_letters_then_break_on_accents_then_case():
+    assert index().ordered("name") == [
+        "Adams, Di",
+        "Baker, Flo",
+        "de la Cruz, Bo",
+        "Dunn, Cy",
+        "Lopez, Ana",
+        "lopez, ana",
+        "López, Ana",
+        "Zed, Eli",
+    ]
+
+
+def test_grade_span_is_one_grade():
+    assert index().span("grade", "3") == ["Adams, Di", "de la Cruz, Bo", "Dunn, Cy"]
+    assert index().span("grade", "4") == []
+
+
+def test_grade_range_span_includes_both_ends():
+    names = index().span("grade", "3", "5")
+    assert names == ["Adams, Di", "de la Cruz, Bo", "Dunn, Cy", "Zed, Eli"]
+    # grades are compared as text, a prefix span of "1" takes in "10"
+    assert index().span("grade", "1") == ["Baker, Flo"]
+
+
+def test_name_letter_span():
+    assert index().span("name", "a", "d") == [
+        "Adams, Di",
+        "Baker, Flo",
+        "de la Cruz, Bo",
+        "Dunn, Cy",
+    ]
+    assert index().span("name", "LO") == ["Lopez, Ana", "lopez, ana", "López, Ana"]
+
+
+def test_class_groups_keep_teacher_spellings_together():
+    ordered = index(
+        [
+            ("Adams, A", "3", "Ms. Smith", "Spanish"),
+            ("Baker, B", "3", "Ms. smith", "Spanish"),
+            ("Cole, C", "3", "Ms. Smith", "Spanish"),
+            ("Dunn, D", "3", "Ms. smith", "Spanish"),
+            ("Eve, E", "3", "Mr. Ángel", "Spanish"),
+            ("Fox, F", "3", "Mr. Angel", "Spanish"),
+            ("Gil, G", "2", "Ms. Smith", "Spanish"),
+        ]
+    )
+    # spellings of one teacher differing in case or accents sort together,
+    # so each is one run, however the children's names interleave
+    assert list(ordered.groups("class", 3, ordered.span("class", "3"))) == [
+        (("3", "Spanish", "Mr. Angel"), ["Fox, F"]),
+        (("3", "Spanish", "Mr. Ángel"), ["Eve, E"]),
+        (("3", "Spanish", "Ms. Smith"), ["Adams, A", "Cole, C"]),
+        (("3", "Spanish", "Ms. smith"), ["Baker, B", "Dunn, D"]),
+    ]
+
+
+def test_groups_run_over_at_most_the_grouped_fields():
+    ordered = index()
+    assert [values for (values, _) in ordered.groups("grade", 1)] == [
+        ("0",),
+        ("10",),
+        ("3",),
+        ("5",),
+    ]
+    with pytest.raises(ValueError, match="at most 3 fields"):
+        list(ordered.groups("class", 4))
+    with pytest.raises(ValueError):
+        list(ordered.groups("name", 1))
+
+
+def test_import_leaves_the_process_locale_alone():
+    code = (
+        "import locale, directo.ordering;"
+        "directo.ordering.primary_key('x');"
+        "print(locale.setlocale(locale.LC_COLLATE))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env={"DIRECTO_LOCALE": "C.UTF-8", "PYTHONPATH": ROOT, "LC_ALL": "C"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "C"
+
+
+def test_locale_without_pyicu_falls_back_to_the_default_key(monkeypatch, caplog):
+    monkeypatch.setattr(directo.ordering, "COLLATE_LOCALE", "sv_SE")
+    monkeypatch.setattr(directo.ordering, "icu", None)
+    monkeypatch.setattr(directo.ordering, "_collator", None)
+    assert directo.ordering.primary_key("Ångström") == "angstrom"
+    assert directo.ordering.primary_key("Öl") == "ol"
+    assert caplog.text.count("needs PyICU") == 1
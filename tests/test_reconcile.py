@@ -0,0 +1,70 @@
+import logging
+from directo.reconcile import normalize_text, reconcile, soundex
+
+
+def test_normalize_text():
+    assert normalize_text("  García-Núñez,  ZOË ") == "garcia nunez zoe"
+
+
+def test_soundex():
+    assert soundex("robert") == soundex("rupert") == "r163"
+    assert soundex("ashcraft") == "a261"
+
+
+def test_exact_and_normalized_names_match():
+    result = reconcile(
+        ["Abbott, Wes", "garcia,  zoe", "O'Brien, Kai"],
+        ["Abbott, Wes", "García, Zoë", "OBrien, Kai", "Young, Ida"],
+    )
+    assert result.matched == {
+        "Abbott, Wes": "Abbott, Wes",
+        "garcia,  zoe": "García, Zoë",
+    }
+    assert "O'Brien, Kai" in result.proposed
+    assert result.unmatched_directory == ["OBrien, Kai", "Young, Ida"]
+
+
+def test_close_names_are_proposed_not_matched(caplog):
+    result = reconcile(["Garcia, Mario"], ["Garcia, Maria"])
+    assert result.matched == {}
+    score, name = result.proposed["Garcia, Mario"]
+    assert name == "Garcia, Maria" and score >= 0.9
+    # the directory child is still unaccounted for
+    assert result.unmatched_directory == ["Garcia, Maria"]
+    with caplog.at_level(logging.WARNING):
+        result.log_proposed()
+    assert "Garcia, Maria" in caplog.text
+    # formatted only if the record is emitted
+    assert caplog.records[0].args[:2] == ("Garcia, Mario", "Garcia, Maria")
+
+
+def test_names_equal_once_normalized_are_ambiguous_if_several():
+    result = reconcile(["Lee, Jo"], ["LEE, JO", "Lee,  Jo"])
+    assert result.matched == {}
+    assert result.ambiguous == {"Lee, Jo": [(1.0, "LEE, JO"), (1.0, "Lee,  Jo")]}
+    assert result.unmatched_directory == []
+
+
+def test_close_candidates_are_ambiguous():
+    result = reconcile(["Smith, Anna"], ["Smith, Anne", "Smith, Ana"])
+    assert "Smith, Anna" in result.ambiguous
+    assert result.proposed == {}
+
+
+def test_a_matched_name_is_not_claimed_twice():
+    result = reconcile(["Young, Ida", "young, ida"], ["Young, Ida"])
+    assert result.matched == {"Young, Ida": "Young, Ida"}
+    assert result.unmatched_roster == ["young, ida"]
+
+
+def test_unrelated_names_are_unmatched():
+    result = reconcile(["Zed, Quinn"], ["Abbott, Wes"])
+    assert result.unmatched_roster == ["Zed, Quinn"]
+    assert result.unmatched_directory == ["Abbott, Wes"]
+    assert result.summary() == {
+        "matched": 0,
+        "proposed": 0,
+        "ambiguous": 0,
+        "unmatched_roster": 1,
+        "unmatched_directory": 1,
+    }
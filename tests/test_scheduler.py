@@ -0,0 +1,149 @@
+import threading
+import time
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from directo.docs import DirectoryDoc, batch_update_doc, get_doc_json
+from directo.scheduler import (
+    DOCS_SCHEDULER,
+    BatchScheduler,
+    TokenBucket,
+    chunk_requests,
+)
+
+ROWS = [(f"Student {n}\n\n", f"Parent {n}\naddress {n}\n") for n in range(30)]
+
+
+class FakeEndpoint(object):
+    """a batchUpdate endpoint answering the first len(statuses) calls with
+    those error statuses, and every later call with the chunk it was sent"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def __call__(self, chunk):
+        self.calls.append(chunk)
+        if self.statuses:
+            status = self.statuses.pop(0)
+            raise HttpError(httplib2.Response({"status": status}), b"{}")
+        return {"replies": [{} for _ in chunk]}
+
+
+def scheduler(**kwargs):
+    return BatchScheduler(
+        bucket=TokenBucket(10**7), max_count=10, backoff_base=0.001, **kwargs
+    )
+
+
+def test_chunk_requests_bounds_count_and_bytes():
+    requests = [{"insertText": {"text": "x" * 10}} for _ in range(25)]
+    assert [len(chunk) for chunk in chunk_requests(requests, 10)] == [10, 10, 5]
+    size = len('{"insertText":{"text":"xxxxxxxxxx"}}')
+    assert [len(chunk) for chunk in chunk_requests(requests, 100, 3 * size)] == [
+        3
+    ] * 8 + [1]
+
+
+def test_every_chunk_is_sent_in_order():
+    requests = [{"insertText": {"text": str(n)}} for n in range(25)]
+    endpoint = FakeEndpoint()
+    responses = scheduler().run(endpoint, requests)
+    assert [request for chunk in endpoint.calls for request in chunk] == requests
+    assert [len(response["replies"]) for response in responses] == [10, 10, 5]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_throttled_and_failed_calls_are_retried(status):
+    endpoint = FakeEndpoint(status, status)
+    batch_scheduler = scheduler()
+    batch_scheduler.run(endpoint, [{"insertText": {"text": "x"}}])
+    assert batch_scheduler.retries == 2
+    assert len(endpoint.calls) == 3
+
+
+def test_client_errors_are_not_retried():
+    endpoint = FakeEndpoint(400)
+    batch_scheduler = scheduler()
+    with pytest.raises(HttpError):
+        batch_scheduler.run(endpoint, [{"insertText": {"text": "x"}}])
+    assert batch_scheduler.retries == 0
+
+
+def test_retries_give_up():
+    endpoint = FakeEndpoint(503, 503, 503)
+    batch_scheduler = scheduler(max_retries=2)
+    with pytest.raises(HttpError):
+        batch_scheduler.run(endpoint, [{"insertText": {"text": "x"}}])
+    assert len(endpoint.calls) == 3
+
+
+def test_token_bucket_paces_past_its_burst():
+    bucket = TokenBucket(rate_per_minute=1200, capacity=2)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    # two tokens of burst, then one every 50 ms
+    assert time.monotonic() - start >= 0.09
+
+
+def build(title, rows=ROWS):
+    doc = DirectoryDoc()
+    doc.new(title)
+    doc.build_tables([rows], 2, font_size=9)
+    return doc
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_throttled_and_failed_chunks_are_retried_by_the_docs_client(fake, status):
+    expected = get_doc_json(build("expected").doc_id)["body"]
+    fake.inject(r":batchUpdate$", status, times=2)
+    doc = build("throttled")
+    assert DOCS_SCHEDULER.retries == 2
+    assert get_doc_json(doc.doc_id)["body"] == expected
+
+
+def test_chunk_applied_before_a_lost_response_is_not_sent_twice(fake):
+    expected = get_doc_json(build("expected").doc_id)["body"]
+    fake.inject(r":batchUpdate$", 503, times=3, applied=True)
+    doc = build("lost responses")
+    assert DOCS_SCHEDULER.retries == 3
+    assert get_doc_json(doc.doc_id)["body"] == expected
+    assert doc.checkpoint()
+
+
+def test_docs_client_retries_give_up(fake, monkeypatch):
+    monkeypatch.setattr(DOCS_SCHEDULER, "max_retries", 2)
+    doc = DirectoryDoc()
+    doc.new("failing")
+    fake.inject(r":batchUpdate$", 503, times=3)
+    with pytest.raises(HttpError):
+        doc.new_table(2)
+    assert DOCS_SCHEDULER.retries == 2
+
+
+def test_chunk_planned_against_an_old_revision_is_rejected(fake):
+    doc = build("edited")
+    with pytest.raises(HttpError) as error:
+        batch_update_doc(
+            doc.doc_id,
+            [{"insertText": {"text": "x", "location": {"index": 1}}}],
+            revision="1",
+        )
+    assert error.value.resp.status == 400
+
+
+def test_retries_are_counted_across_threads():
+    batch_scheduler = scheduler()
+    threads = [
+        threading.Thread(
+            target=batch_scheduler.run,
+            args=(FakeEndpoint(*[503] * 5), [{"insertText": {"text": "x"}}]),
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert batch_scheduler.retries == 40
@@ -0,0 +1,20 @@
+import pytest
+import directo.main
+from conftest import DIRECTORY_SHEET_ID, ROSTER_SHEET_ID
+from directo.sheets import RosterError
+
+
+@pytest.mark.parametrize("command", ["roster", "directory", "unrostered"])
+def test_every_command_rejects_bad_roster_rows(fake, command):
+    roster = fake.spreadsheets[ROSTER_SHEET_ID]["Sheet1"]
+    roster[1][2] = "7"
+    roster[2][1] = ""
+    with pytest.raises(RosterError) as raised:
+        directo.main.run(
+            directo.main.parse_args([command]),
+            roster_sheet_id=ROSTER_SHEET_ID,
+            directory_sheet_id=DIRECTORY_SHEET_ID,
+        )
+    assert "Young-0, Mateo has unknown grade '7'" in str(raised.value)
+    assert "'Ito-1, ' lacks a last or first name" in str(raised.value)
+    assert fake.documents == {}